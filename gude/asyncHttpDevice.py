@@ -0,0 +1,388 @@
+import asyncio
+import base64
+import collections
+import ssl
+import time
+from urllib.parse import urlencode
+
+import requests
+
+from gude.dnsCache import resolve_async
+from gude.httpDevice import HttpDevice
+from gude.multipartStream import MultipartStream
+
+from gude.probes import liveness_probes, gbl_probe
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
+
+
+def _insecure_ssl_context():
+    # same as verify=False of the requests based HttpDevice
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
+class AsyncHttpResponse(object):
+    __slots__ = ('status_code', 'headers', 'content', 'url')
+
+    def __init__(self, status_code, headers, content, url):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.url = url
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+
+class AsyncHttpConnection(object):
+    """
+    Minimal HTTP/1.1 client on asyncio streams: one keep-alive connection to one
+    device, requests are serialized. Errors are raised as requests exceptions so
+    callers handle both engines alike.
+    """
+    _ssl_context = None
+
+    def __init__(self, host, port, use_ssl=False):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        ssl_ctx = None
+        if self.use_ssl:
+            if AsyncHttpConnection._ssl_context is None:
+                AsyncHttpConnection._ssl_context = _insecure_ssl_context()
+            ssl_ctx = AsyncHttpConnection._ssl_context
+        # connect to the address pinned for the run, TLS still names the host (SNI)
+        address = await resolve_async(self.host)
+        self._reader, self._writer = await asyncio.open_connection(address, self.port, ssl=ssl_ctx,
+                                                                   server_hostname=self.host if ssl_ctx else None)
+
+    async def close(self):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+
+    async def _send(self, method, target, headers, body):
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+        self._writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        if isinstance(body, MultipartStream):
+            for chunk in body:
+                self._writer.write(chunk)
+                await self._writer.drain()
+        elif body is not None:
+            self._writer.write(body)
+        await self._writer.drain()
+
+    async def _read_response(self, method):
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Remote end closed connection without response")
+        version, status, _ = (status_line.decode('latin-1').rstrip('\r\n') + '  ').split(' ', 2)
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        status = int(status)
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            content = b''
+        elif 'chunked' in headers.get('transfer-encoding', '').lower():
+            parts = []
+            while True:
+                size = int((await self._reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    while (await self._reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                parts.append(await self._reader.readexactly(size))
+                await self._reader.readexactly(2)
+            content = b''.join(parts)
+        elif 'content-length' in headers:
+            content = await self._reader.readexactly(int(headers['content-length']))
+        else:
+            content = await self._reader.read()
+            keep_alive = False
+        return status, headers, content, keep_alive
+
+    async def request(self, method, target, headers=None, body=None, timeout=10.0):
+        headers = headers or {}
+        async with self._lock:
+            # a reused keep-alive connection may have been closed by the device, retry once on a new one
+            for attempt in (0, 1):
+                reused = self._writer is not None
+                try:
+                    if not reused:
+                        await asyncio.wait_for(self._connect(), timeout)
+                    await asyncio.wait_for(self._send(method, target, headers, body), timeout)
+                    status, resp_headers, content, keep_alive = await asyncio.wait_for(self._read_response(method), timeout)
+                except asyncio.TimeoutError:
+                    await self.close()
+                    raise requests.exceptions.Timeout(f"Timeout {method} {self.host}:{self.port}{target}")
+                except (OSError, ssl.SSLError, asyncio.IncompleteReadError, ValueError) as e:
+                    await self.close()
+                    if reused and attempt == 0 and not isinstance(body, MultipartStream):
+                        continue
+                    raise requests.exceptions.ConnectionError(f"{method} {self.host}:{self.port}{target}: {e!r}")
+                if not keep_alive:
+                    await self.close()
+                return status, resp_headers, content
+
+
+class AsyncHttpDevice(HttpDevice):
+    """
+    asyncio counterpart of HttpDevice. Setup (ports, auth, timeouts) and URL helpers
+    are shared, request methods are coroutines with the same names and arguments.
+    """
+
+    def __init__(self, host, req_headers=None):
+        super().__init__(host, req_headers)
+        self.asyncConn = None
+        self.asyncConnKey = None
+
+    def get_async_connection(self):
+        key = (self.host, self.httpOpts["port"], bool(self.httpOpts["ssl"]))
+        if self.asyncConn is None or self.asyncConnKey != key:
+            self.asyncConn = AsyncHttpConnection(*key)
+            self.asyncConnKey = key
+        return self.asyncConn
+
+    async def close(self):
+        if self.asyncConn is not None:
+            await self.asyncConn.close()
+
+    def get_request_headers(self, req_headers=None):
+        headers = {"Accept": "*/*"}
+        if self.httpOpts["basicauth"]:
+            token = f'{self.httpOpts["username"]}:{self.httpOpts["password"]}'.encode('latin-1')
+            headers["Authorization"] = "Basic " + base64.b64encode(token).decode('ascii')
+        if req_headers:
+            headers.update(req_headers)
+        return headers
+
+    def get_http_target(self, filename, cgi_get_params=None):
+        target = f"/{filename}"
+        if cgi_get_params:
+            target += "?" + urlencode(cgi_get_params, doseq=True)
+        return target
+
+    async def http_request(self, method, filename, cgi_get_params=None, req_headers=None, body=None, timeout=None):
+        target = self.get_http_target(filename, cgi_get_params)
+        status, headers, content = await self.get_async_connection().request(
+            method, target, self.get_request_headers(req_headers), body,
+            timeout if timeout is not None else self.httpTimeout)
+        return AsyncHttpResponse(status, headers, content, self.get_http_url(target[1:]))
+
+    async def http_get(self, filename, cgi_get_params=None, req_headers=None):
+        if cgi_get_params is None:
+            cgi_get_params = {}
+
+        log.debug(cgi_get_params)
+
+        start = stop = None
+        retries = 0
+        r = None
+        while retries < (1+self.httpRetries) and stop is None:
+            try:
+                start = time.time()
+                if self.httpAutoAddAjaxTimestamp:
+                    cgi_get_params["_"] = int(time.time())
+                r = await self.http_request("GET", filename, cgi_get_params, req_headers)
+                stop = time.time()
+            except requests.exceptions.Timeout:
+                log.info(f"Timeout {self.get_http_url(filename)} {cgi_get_params} {retries}")
+                retries += 1
+
+        if r is not None:
+            return self.get_response_text(r, stop - start)
+        elif stop is None:
+            raise requests.exceptions.Timeout("Timeout", response=r)
+
+        raise ValueError("http request failed")
+
+    async def http_ping(self, timeout=1.0, req_headers=None):
+        for probe in liveness_probes.candidates(self.boot_model):
+            start = time.time()
+            outcome = await self.http_probe(probe, timeout, req_headers)
+            liveness_probes.report(self.boot_model, probe, outcome, time.time() - start)
+            if outcome is not None:
+                return outcome
+        return False
+
+    async def http_probe(self, probe, timeout=1.0, req_headers=None):
+        try:
+            r = await self.http_request(probe.method, probe.resource, dict(probe.params), req_headers=req_headers, timeout=timeout)
+            return probe.outcome(r.status_code)
+        except (ValueError, Exception):
+            return False
+
+    async def upload_file(self, file_data, upload_type, cgi_get_params=None, ret_ressource='fwupdate.txt', timeout=10.0, req_headers=None, sent_cb=None):
+        cgi_get_params, body, headers = self.get_upload_request(file_data, upload_type, cgi_get_params, req_headers, sent_cb)
+
+        start = time.time()
+        r = await self.http_request("POST", ret_ressource, cgi_get_params, headers, body, timeout)
+        stop = time.time()
+        return self.get_upload_response_text(r, stop - start)
+
+    async def http_get_json(self, file, cgi_get_params=None, req_headers=None):
+        return self.parse_json(await self.http_get(file, cgi_get_params, req_headers))
+
+    async def http_get_status_json(self, components, cgi_get_params=None, req_headers=None):
+        return await self.http_get_json("status.json", self.get_components_params(components, cgi_get_params), req_headers)
+
+    async def http_get_status_json_coalesced(self, components_list, cgi_get_params=None, req_headers=None):
+        components = self.get_coalesced_components(components_list)
+        return self.split_status_json(await self.http_get_status_json(components, cgi_get_params, req_headers) or {}, components_list)
+
+    async def http_get_config_json(self, components, cgi_get_params=None, req_headers=None):
+        return await self.http_get_json("config.json", self.get_components_params(components, cgi_get_params), req_headers)
+
+    async def http_cgi_json_cmd(self, cmd, params=None, merge_defaults=True, req_headers=None):
+        return await self.http_get_json(*self.get_cgi_json_cmd_request(cmd, params, merge_defaults), req_headers)
+
+    async def http_switch_port(self, port, status, req_headers=None):
+        json_data = await self.http_cgi_json_cmd(self.CGI_CMD_SWITCH_POWERPORTS, {"p": port, "s": status}, req_headers)
+        return self.check_switch_state(json_data, port, status)
+
+    async def wait_reboot(self, max_wait_secs=20.0, pre_wait_secs=5.0, req_headers=None, show_progress_bar=True, progress_cb=None):
+        await self.close()
+        total = int(pre_wait_secs) + int(max_wait_secs)
+        detector = self.new_reboot_detector(max_wait_secs, pre_wait_secs)
+        reported_sec = -1
+        while not detector.finished:
+            delay, probe = detector.next_probe()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            detector.report(probe, await self.reboot_probe(probe, req_headers))
+            reported_sec = self.report_reboot_elapsed(detector, reported_sec, total, show_progress_bar, progress_cb)
+
+        if self.finish_reboot_detection(detector, max_wait_secs, total, show_progress_bar):
+            await asyncio.sleep(1)
+            return True
+        return False
+
+    async def reboot_probe(self, probe, req_headers=None):
+        if probe == 'http':
+            return await self.http_ping(1.0, req_headers)
+        start = time.time()
+        if probe == 'tcp':
+            try:
+                address = await resolve_async(self.host)
+                _, writer = await asyncio.wait_for(asyncio.open_connection(address, self.httpOpts["port"]), 0.5)
+                writer.close()
+                ok = True
+            except (OSError, asyncio.TimeoutError):
+                ok = False
+        else:
+            ok = await asyncio.get_running_loop().run_in_executor(None, gbl_probe, self.host)
+        if ok:
+            liveness_probes.record_rtt(probe, time.time() - start)
+        return ok
+
+    async def reboot(self, wait_reboot=True, max_wait_secs=20, show_progress_bar=True, progress_cb=None):
+        log.info(f"[{self.get_log_label()}] Rebooting...")
+        self.flush_config_buffer()
+        await self.http_cgi_json_cmd(self.CGI_CMD_RESET)
+        if wait_reboot:
+            return await self.wait_reboot(max_wait_secs, show_progress_bar=show_progress_bar, progress_cb=progress_cb)
+        return True
+
+
+async def iterate_async(iterable, executor=None):
+    """Async iterator over iterable, next() runs in executor (for generators doing blocking I/O)."""
+    loop = asyncio.get_running_loop()
+    items = iter(iterable)
+    done = object()
+    while True:
+        item = await loop.run_in_executor(executor, next, items, done)
+        if item is done:
+            return
+        yield item
+
+
+async def run_bounded(keys, coro_factory, concurrency, group_of=None, group_slots=None):
+    """
+    Run coro_factory(key) for all keys on the running loop with at most `concurrency`
+    of them in flight. Keys are taken from the iterable (or async iterable, see
+    iterate_async) as slots get free, so a large range is never expanded into coroutines
+    up front. With group_slots (gude.deployScheduler.GroupSlots), a key also needs a slot
+    of its group_of(key); while its group is full, later keys of other groups go first.
+    At most `concurrency` keys are held back that way, then the oldest one is waited for.
+    Returns the results in order of completion.
+    """
+    concurrency = max(1, int(concurrency))
+    is_async = hasattr(keys, '__aiter__')
+    keys = keys.__aiter__() if is_async else iter(keys)
+    deferred = collections.deque()  # (key, group) of full groups
+    taking = asyncio.Lock()
+    results = []
+
+    async def _take():
+        if is_async:
+            return await keys.__anext__()
+        try:
+            return next(keys)
+        except StopIteration:
+            raise StopAsyncIteration from None
+
+    async def _next_ready():
+        """(key, group) with the group slot taken, None if no key can start right now."""
+        for _ in range(len(deferred)):
+            key, group = deferred.popleft()
+            if group_slots.try_acquire(group):
+                return key, group
+            deferred.append((key, group))
+        # a saturated group must not drain the whole iterable into `deferred`
+        while len(deferred) < concurrency:
+            try:
+                key = await _take()
+            except StopAsyncIteration:
+                break
+            group = group_of(key) if group_slots is not None else None
+            if group is None or group_slots.try_acquire(group):
+                return key, group
+            deferred.append((key, group))
+        return None
+
+    async def _worker():
+        while True:
+            async with taking:
+                ready = await _next_ready()
+                if ready is None:
+                    if not deferred:
+                        return
+                    key, group = deferred.popleft()
+            if ready is None:
+                # no key can start, wait for the group of the oldest deferred one
+                await group_slots.acquire_async(group)
+            else:
+                key, group = ready
+            try:
+                results.append(await coro_factory(key))
+            finally:
+                if group is not None:
+                    group_slots.release(group)
+
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    return results
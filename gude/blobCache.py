@@ -0,0 +1,79 @@
+import os
+import threading
+from collections import OrderedDict
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
+
+
+class FirmwareBlobCache(object):
+    """
+    Process-wide cache of firmware images.
+
+    Each file is read once and kept as a single bytes object keyed by
+    (path, size, mtime), concurrent uploads get read-only memoryviews on it.
+    Entries stay alive while referenced; unreferenced entries are evicted LRU
+    once more than max_idle of them are kept.
+    """
+
+    def __init__(self, max_idle=2):
+        self.max_idle = max_idle
+        self._entries = {}  # key -> [data, refcount]
+        self._idle = OrderedDict()  # keys with refcount 0, oldest first
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def blob_key(filename):
+        st = os.stat(filename)
+        return os.path.abspath(filename), st.st_size, st.st_mtime_ns
+
+    def acquire(self, filename):
+        """Return (key, memoryview) of filename, reading the file only if not cached."""
+        key = self.blob_key(filename)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1] += 1
+                self._idle.pop(key, None)
+                return key, memoryview(entry[0])
+
+        # read outside the lock, a concurrent reader of the same key is resolved below
+        with open(filename, 'rb') as fp:
+            data = fp.read()
+        log.debug(f"cached firmware blob {filename} ({len(data)} bytes)")
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = [data, 0]
+                self._entries[key] = entry
+            entry[1] += 1
+            self._idle.pop(key, None)
+            return key, memoryview(entry[0])
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry[1] = max(0, entry[1] - 1)
+            if entry[1] == 0:
+                self._idle[key] = True
+                while len(self._idle) > self.max_idle:
+                    old_key, _ = self._idle.popitem(last=False)
+                    self._entries.pop(old_key, None)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._idle):
+                self._entries.pop(key, None)
+            self._idle.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+firmware_blobs = FirmwareBlobCache()
@@ -0,0 +1,84 @@
+import json
+import os
+import threading
+import time
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
+
+
+class DeadHosts(object):
+    """
+    Negative cache of unreachable targets (host, port), stored as JSON file.
+
+    A target failing again is skipped for ttl, 2 * ttl, 4 * ttl ... seconds (at most max_ttl);
+    once the time is up it is tried again. A target that answers is removed.
+    """
+    VERSION = 1
+    DEFAULT_TTL = 300.0
+    DEFAULT_MAX_TTL = 86400.0
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_ttl=DEFAULT_MAX_TTL, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.max_ttl = max_ttl
+        self.clock = clock
+        self.hosts = {}
+        self._lock = threading.Lock()
+        self._changed = False
+
+    @classmethod
+    def load(cls, path, ttl=DEFAULT_TTL, max_ttl=DEFAULT_MAX_TTL, clock=time.time):
+        dead = cls(path, ttl, max_ttl, clock)
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as fp:
+                    dead.hosts = dict(json.load(fp).get('hosts', {}))
+            except (OSError, ValueError, AttributeError) as e:
+                log.warning(f"Could not read dead host cache {path}, starting empty: {e}")
+        return dead
+
+    def save(self):
+        with self._lock:
+            if not self._changed:
+                return
+            now = self.clock()
+            # entries are forgotten once they could have been retried for max_ttl
+            self.hosts = {key: entry for key, entry in self.hosts.items() if entry['retry_at'] + self.max_ttl > now}
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as fp:
+                    json.dump({'version': self.VERSION, 'hosts': self.hosts}, fp, indent=1, sort_keys=True)
+                os.replace(tmp_path, self.path)
+                self._changed = False
+            except OSError as e:
+                log.warning(f"Could not write dead host cache {self.path}: {e}")
+
+    @staticmethod
+    def key(host, port):
+        return f"{host}:{port}"
+
+    def is_dead(self, host, port):
+        with self._lock:
+            entry = self.hosts.get(self.key(host, port))
+            return entry is not None and self.clock() < entry['retry_at']
+
+    def retry_at(self, host, port):
+        with self._lock:
+            entry = self.hosts.get(self.key(host, port))
+            return entry['retry_at'] if entry is not None else None
+
+    def failed(self, host, port):
+        with self._lock:
+            now = self.clock()
+            entry = self.hosts.setdefault(self.key(host, port), {'failures': 0, 'first_failed': now})
+            entry['failures'] += 1
+            entry['retry_at'] = now + min(self.ttl * 2 ** (entry['failures'] - 1), self.max_ttl)
+            self._changed = True
+
+    def alive(self, host, port):
+        with self._lock:
+            if self.hosts.pop(self.key(host, port), None) is not None:
+                self._changed = True
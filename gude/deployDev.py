@@ -1,8 +1,6 @@
 import os
 import re
-import time
 import requests
-import threading
 from gude.httpDevice import HttpDevice
 from gude.firmware_target import (
     format_firmware_version_for_display,
@@ -11,6 +9,9 @@ from gude.firmware_target import (
 )
 
 from gude.gblib import print_progress_bar
+from gude.blobCache import firmware_blobs
+from gude.deployScheduler import Sleep, run_steps
+from gude.gblEntities import clone_entities_steps
 
 import logging
 # logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
@@ -19,9 +20,13 @@ log.setLevel(logging.getLevelName('DEBUG'))
 
 
 class DeployDev(HttpDevice):
+    # status.json?components=2097152&cmd=42 (POST)
+    FACTORY_RESET_PARAMS = {'components': 2097152, 'cmd': 42}
+
     def __init__(self, host, req_headers=None):
         super().__init__(host, req_headers)
         self.fw = None
+        self.fw_blob_key = None
         self.firmware_upload_connection_error_info = None
 
     @staticmethod
@@ -77,23 +82,97 @@ class DeployDev(HttpDevice):
 
         return cfg_filename
 
-    def threaded_upload(self):
+    def upload_firmware_blob(self, sent_cb=None):
         log.info(f"[{self.get_log_label()}] uploading {len(self.fw)} bytes...")
         try:
             # This call is specifically for firmware
-            self.upload_file(self.fw, self.CGI_UPLOAD_TYPE_FIRMWARE, timeout=300.0)
+            self.upload_file(self.fw, self.CGI_UPLOAD_TYPE_FIRMWARE, timeout=300.0, sent_cb=sent_cb)
             log.info(f"[{self.get_log_label()}] upload_file call completed for firmware.")
-        except requests.exceptions.ConnectionError as e:
+        except Exception as e:
+            self.record_firmware_upload_error(e)
+        finally:
+            self.release_firmware_blob()
+
+    def record_firmware_upload_error(self, e):
+        if isinstance(e, requests.exceptions.ConnectionError):
             log.warning(f"[{self.get_log_label()}] ConnectionError during firmware upload_file call: {e}. Device might still process the file.")
             self.firmware_upload_connection_error_info = str(e) # Store specific info
-        except Exception as e:
+        else:
             log.error(f"[{self.get_log_label()}] Other exception during firmware upload_file call: {e}")
             self.firmware_upload_connection_error_info = f"Other upload error: {str(e)}"
-        finally:
-            log.info(f"[{self.get_log_label()}] Threaded firmware upload processing finished, setting self.fw to None.")
-            self.fw = None # Ensure this is always set to allow main thread to proceed
+
+    def release_firmware_blob(self):
+        fw_content = self.fw
+        self.fw = None
+        if self.fw_blob_key is not None:
+            fw_content.release()
+            firmware_blobs.release(self.fw_blob_key)
+            self.fw_blob_key = None
+
+    def get_upload_sent_cb(self, show_progress_bar=True, progress_cb=None):
+        """Map bytes-sent callbacks of the streamed upload to progress bar / progress_cb events."""
+        state = {"pct": None, "logged": None}
+
+        def on_sent(sent, total):
+            if show_progress_bar:
+                print_progress_bar(sent, total, fill='#', clear=' ', unit='bytes')
+            else:
+                pct = int((100 * sent) / total) if total > 0 else 100
+                if progress_cb and pct != state["pct"]:
+                    progress_cb({"ip": self.host, "type": "progress", "progress": pct})
+                state["pct"] = pct
+                if state["logged"] is None or pct - state["logged"] >= 20:
+                    log.info(f"[{self.get_log_label()}] Upload progress: {pct:.0f}%")
+                    state["logged"] = pct
+
+            if sent == total:
+                # the device replies after it checked the received file
+                log.info(f"[{self.get_log_label()}] upload complete, device is checking file consistency...")
+                if progress_cb:
+                    progress_cb({"ip": self.host, "type": "progress", "progress": 100, "status": "checking"})
+
+        return on_sent
 
     def update_firmware(self, device_data, cfg, fw_dir='fw', forced=False, online_update=False, show_progress_bar=True, progress_cb=None):
+        return run_steps(self.update_firmware_steps(device_data, cfg, fw_dir, forced, online_update, show_progress_bar, progress_cb))
+
+    def update_firmware_steps(self, device_data, cfg, fw_dir='fw', forced=False, online_update=False, show_progress_bar=True, progress_cb=None):
+        plan = self.prepare_firmware_update(device_data, cfg, fw_dir, forced, online_update)
+        if plan["result"] is not None:
+            return plan["result"]
+
+        self.load_firmware_blob(plan)
+        # with pf this may raise a requests.exceptions.ConnectionError: HTTPConnectionPool(host='', port=''): Read timed out.
+        # progress is reported from the bytes put on the wire, no status polling while uploading
+        self.upload_firmware_blob(self.get_upload_sent_cb(show_progress_bar, progress_cb))
+
+        # Get final upload status if possible
+        upload_status = None
+        try:
+            upload_status = self.http_get_status_json(DeployDev.JSON_STATUS_UPLOAD)['fileupload']
+        except (requests.exceptions.RequestException, ValueError) as e:
+            log.warning(f"[{self.get_log_label()}] Could not get final upload status after upload: {e}.")
+        self.log_upload_status(upload_status)
+
+        if progress_cb:
+            progress_cb({"ip": self.host, "type": "progress", "progress": 100, "status": "Rebooting..."})
+        
+        reboot_successful = yield from self.reboot_steps(max_wait_secs=85, show_progress_bar=show_progress_bar, progress_cb=progress_cb)
+
+        misc_info_after_reboot = status_error = None
+        if reboot_successful:
+            try:
+                # Fetch fresh device info after reboot
+                misc_info_after_reboot = self.http_get_status_json(DeployDev.JSON_STATUS_MISC)['misc']
+            except (requests.exceptions.RequestException, ValueError) as e:
+                status_error = e
+        return self.finish_firmware_update(plan, reboot_successful, misc_info_after_reboot, status_error)
+
+    def prepare_firmware_update(self, device_data, cfg, fw_dir='fw', forced=False, online_update=False):
+        """
+        Select the firmware file for device_data (downloading it for online updates).
+        Returns the update plan; plan["result"] is already set if no update is needed.
+        """
         prodid = device_data['prodid']
         dev_version = device_data['firm_v']
         initial_dev_version = dev_version # Store initial version for reporting
@@ -135,11 +214,13 @@ class DeployDev(HttpDevice):
         if not needs_update:
             log.warning(f"[{self.get_log_label()}] Device Firmware v{dev_version} is already expected v{target_log_value} : no update needed")
             return {
-                "updated": False,
-                "initial_version": initial_dev_version,
-                "final_version": initial_dev_version,
-                "status_message": f"up to date (v{initial_dev_version})",
-                "upload_notes": None
+                "result": {
+                    "updated": False,
+                    "initial_version": initial_dev_version,
+                    "final_version": initial_dev_version,
+                    "status_message": f"up to date (v{initial_dev_version})",
+                    "upload_notes": None
+                }
             }
 
         if cfg.has_option(prodid, 'path'):
@@ -174,117 +255,77 @@ class DeployDev(HttpDevice):
             log.info(f"[{self.get_log_label()}] using selected firmware file {fw_filename}")
         log.info(f"[{self.get_log_label()}] updating to Firmware v{target_log_value}")
 
-        fw_content = self.get_file_content(local_filename, "rb")
-        if fw_content is None: # Should be caught by ValueError above if file not found
-             raise ValueError(f"Could not read firmware file content: {local_filename}")
-        log.info(f"[{self.get_log_label()}] uploading {fw_filename}, please wait...")
-
-        self.fw = fw_content # Set self.fw for the thread
-
-        # with pf this may raise a requests.exceptions.ConnectionError: HTTPConnectionPool(host='', port=''): Read timed out.
-        upload_thread = threading.Thread(target=self.threaded_upload, args=())
-        upload_thread.start()
-        time.sleep(2)
-
-        upload_status_after_thread = None
-        last_logged_progress = None
-        while self.fw is not None:
-            try:
-                upload_status = self.http_get_status_json(DeployDev.JSON_STATUS_UPLOAD)['fileupload']
-                upload_status_after_thread = upload_status
-                total = upload_status['total']
-                progress = upload_status['progress']
-                # p = (100 / total) * progress
-                # log.info(f"upload progress {p:02.2f}% {upload_status['progress']}/{total}")
-
-                if show_progress_bar:
-                    print_progress_bar(progress, total, fill='#', clear=' ', unit='bytes')
-                else:
-                    pct = (100 / total) * progress if total > 0 else 0
-                    if progress_cb:
-                        progress_cb({"ip": self.host, "type": "progress", "progress": pct})
-
-                    p = pct
-                    if last_logged_progress is None or p - last_logged_progress >= 20:
-                         log.info(f"[{self.get_log_label()}] Upload progress: {p:.0f}%")
-                         last_logged_progress = p
-
-                if upload_status['checking']:
-                    log.info(f"[{self.get_log_label()}] upload complete, device is checking file consistency...")
-                    if progress_cb:
-                        progress_cb({"ip": self.host, "type": "progress", "progress": 100, "status": "checking"})
-                    time.sleep(5)
-            except (requests.exceptions.RequestException, ValueError) as e:
-                log.warning(f"[{self.get_log_label()}] Could not get upload status during firmware update: {e}. Continuing...")
-            # If we can't get status, we rely on the thread's outcome and post-reboot check
-            time.sleep(2) # Wait before retrying or fw becomes None
-
-        # After the loop, ensure the thread has fully completed
-        log.debug("Waiting for firmware upload thread to join...")
-        upload_thread.join(timeout=15.0) # Wait for up to 15 seconds for the thread to finish
-        if upload_thread.is_alive():
-            log.warning(f"[{self.get_log_label()}] Firmware upload thread did not complete within timeout after self.fw was set to None. It might be stuck.")
-        else:
-            log.debug("Firmware upload thread has joined.")
+        return {
+            "result": None,
+            "prodid": prodid,
+            "initial_version": initial_dev_version,
+            "latest_version": latest_version,
+            "fw_filename": fw_filename,
+            "local_filename": local_filename,
+        }
 
-        # Get final upload status if possible, or use last known
+    def load_firmware_blob(self, plan):
+        # all devices updated to the same file share one read-only copy of it
         try:
-            upload_status_final_check = self.http_get_status_json(DeployDev.JSON_STATUS_UPLOAD)['fileupload']
-            upload_status_after_thread = upload_status_final_check
-        except (requests.exceptions.RequestException, ValueError) as e:
-            log.warning(f"[{self.get_log_label()}] Could not get final upload status after thread: {e}. Using last known status if available.")
+            fw_blob_key, fw_content = firmware_blobs.acquire(plan["local_filename"])
+        except OSError as e: # Should be caught by ValueError above if file not found
+             raise ValueError(f"Could not read firmware file content: {plan['local_filename']} ({e})")
+        log.info(f"[{self.get_log_label()}] uploading {plan['fw_filename']}, please wait...")
+
+        self.fw = fw_content
+        self.fw_blob_key = fw_blob_key # released when the upload is done
 
+    def log_upload_status(self, upload_status):
         fw_versions_log_info = "unknown versions"
-        if upload_status_after_thread and 'update' in upload_status_after_thread and upload_status_after_thread['update']:
+        if upload_status and 'update' in upload_status and upload_status['update']:
             # fw = [upload_status['update']['from'], upload_status['update']['to']]
-            from_v = upload_status_after_thread['update']['from']
-            to_v = upload_status_after_thread['update']['to']
+            from_v = upload_status['update']['from']
+            to_v = upload_status['update']['to']
             fw_versions_log_info = f"{from_v[1]}.{from_v[2]}.{from_v[3]} -> {to_v[1]}.{to_v[2]}.{to_v[3]}"
 
         log.info(f"[{self.get_log_label()}] Firmware update based on device status: {fw_versions_log_info}, "
                  f"device is rebooting to extract firmware file, please wait...")
-        
-        if progress_cb:
-            progress_cb({"ip": self.host, "type": "progress", "progress": 100, "status": "Rebooting..."})
-        
-        reboot_successful = self.reboot(wait_reboot=True, max_wait_secs=85, show_progress_bar=show_progress_bar, progress_cb=progress_cb)
+
+    def finish_firmware_update(self, plan, reboot_successful, misc_info_after_reboot=None, status_error=None):
+        """Build the update_firmware result from the reboot outcome and the status read afterwards."""
+        prodid = plan["prodid"]
+        initial_dev_version = plan["initial_version"]
+        latest_version = plan["latest_version"]
+        fw_filename = plan["fw_filename"]
 
         new_actual_version = initial_dev_version # Default to old if reboot fails or version can't be read
         is_successful_fw_update = False
         status_message = ""
         upload_notes_message = None
 
-        if reboot_successful:
-            try:
-                # Fetch fresh device info after reboot
-                misc_info_after_reboot = self.http_get_status_json(DeployDev.JSON_STATUS_MISC)['misc']
-                new_actual_version = misc_info_after_reboot['firm_v']
-                log.info(f"[{self.get_log_label()}] Device rebooted. Current firmware version: {new_actual_version}")
-
-                # Determine if update was successful based on version comparison
-                expected_target_version = format_firmware_version_for_display(prodid, latest_version)
-
-                if expected_target_version:
-                    is_successful_fw_update = (new_actual_version == expected_target_version)
-
-                    if is_successful_fw_update:
-                        status_message = f"updated from {initial_dev_version} to {new_actual_version}"
-                        if self.firmware_upload_connection_error_info:
-                            upload_notes_message = f"Transient connection error during upload ({self.firmware_upload_connection_error_info}), but update succeeded."
-                    else:
-                        status_message = f"failed: version mismatch post-update (expected {expected_target_version}, got {new_actual_version})"
-                        if self.firmware_upload_connection_error_info:
-                             upload_notes_message = f"Original upload connection error: {self.firmware_upload_connection_error_info}."
+        if reboot_successful and status_error is not None:
+            log.error(f"[{self.get_log_label()}] Failed to get device status after reboot: {status_error}")
+            status_message = f"failed: could not verify version after reboot ({status_error})"
+            if self.firmware_upload_connection_error_info:
+                upload_notes_message = f"Original upload connection error: {self.firmware_upload_connection_error_info}."
+        elif reboot_successful:
+            new_actual_version = misc_info_after_reboot['firm_v']
+            log.info(f"[{self.get_log_label()}] Device rebooted. Current firmware version: {new_actual_version}")
+
+            # Determine if update was successful based on version comparison
+            expected_target_version = format_firmware_version_for_display(prodid, latest_version)
+
+            if expected_target_version:
+                is_successful_fw_update = (new_actual_version == expected_target_version)
+
+                if is_successful_fw_update:
+                    status_message = f"updated from {initial_dev_version} to {new_actual_version}"
+                    if self.firmware_upload_connection_error_info:
+                        upload_notes_message = f"Transient connection error during upload ({self.firmware_upload_connection_error_info}), but update succeeded."
                 else:
-                    is_successful_fw_update = True
-                    status_message = f"firmware file {fw_filename} applied; current version {new_actual_version}"
+                    status_message = f"failed: version mismatch post-update (expected {expected_target_version}, got {new_actual_version})"
                     if self.firmware_upload_connection_error_info:
-                        upload_notes_message = f"Transient connection error during upload ({self.firmware_upload_connection_error_info}), but device rebooted with firmware {new_actual_version}."
-            except (requests.exceptions.RequestException, ValueError) as e:
-                log.error(f"[{self.get_log_label()}] Failed to get device status after reboot: {e}")
-                status_message = f"failed: could not verify version after reboot ({e})"
+                         upload_notes_message = f"Original upload connection error: {self.firmware_upload_connection_error_info}."
+            else:
+                is_successful_fw_update = True
+                status_message = f"firmware file {fw_filename} applied; current version {new_actual_version}"
                 if self.firmware_upload_connection_error_info:
-                    upload_notes_message = f"Original upload connection error: {self.firmware_upload_connection_error_info}."
+                    upload_notes_message = f"Transient connection error during upload ({self.firmware_upload_connection_error_info}), but device rebooted with firmware {new_actual_version}."
         else: # Reboot failed
             new_actual_version = initial_dev_version # Stays old version
             status_message = "failed: reboot failed after firmware update attempt"
@@ -299,7 +340,14 @@ class DeployDev(HttpDevice):
             "upload_notes": upload_notes_message
         }
 
+    @staticmethod
+    def get_config_port_states(cfg):
+        return re.findall(r'port (\d+) state set (\d)', cfg)
+
     def upload_config(self, cfg_file_name, config_ip, show_progress_bar=True, progress_cb=None):
+        return run_steps(self.upload_config_steps(cfg_file_name, config_ip, show_progress_bar, progress_cb))
+
+    def upload_config_steps(self, cfg_file_name, config_ip, show_progress_bar=True, progress_cb=None):
         cfg = self.get_file_content(cfg_file_name)
         if cfg is None:
             return
@@ -317,15 +365,27 @@ class DeployDev(HttpDevice):
         self.reboot(wait_reboot=False, show_progress_bar=show_progress_bar, progress_cb=progress_cb)
         if config_ip is not None:
             self.host = config_ip
-        self.wait_reboot(max_wait_secs=25, show_progress_bar=show_progress_bar, progress_cb=progress_cb)
+        yield from self.wait_reboot_steps(max_wait_secs=25, show_progress_bar=show_progress_bar, progress_cb=progress_cb)
 
         # apply every 'port X state set Y' by http
-        for port, state in re.findall(r'port (\d+) state set (\d)', cfg):
+        for port, state in self.get_config_port_states(cfg):
             new_sate = self.http_switch_port(int(port), int(state))['outputs'][int(port) - 1]['state']
             log.info(f"[{self.get_log_label()}] cmd 'port {port} state set {state}' -> '{new_sate}' (sleeping 1s)")
-            time.sleep(1)
+            yield Sleep(1)
+
+    def clone_entities_gbl_steps(self, entities, show_progress_bar=True, progress_cb=None):
+        """Write eprom entities (e.g. of a reference device) via GBL instead of uploading config.txt."""
+        log.info(f"[{self.get_log_label()}] writing {len(entities)} entities via GBL...")
+        stats = yield from clone_entities_steps(self.host, entities)
+        if progress_cb:
+            progress_cb({"ip": self.host, "type": "progress", "progress": 100, "status": "Rebooting..."})
+        yield from self.wait_reboot_steps(max_wait_secs=25, show_progress_bar=show_progress_bar, progress_cb=progress_cb)
+        return stats
 
     def upload_ssl_certificate(self, ssl_cert_file_name, show_progress_bar=True, progress_cb=None):
+        return run_steps(self.upload_ssl_certificate_steps(ssl_cert_file_name, show_progress_bar, progress_cb))
+
+    def upload_ssl_certificate_steps(self, ssl_cert_file_name, show_progress_bar=True, progress_cb=None):
         cert = self.get_file_content(ssl_cert_file_name)
         if cert is None:
             return
@@ -340,7 +400,7 @@ class DeployDev(HttpDevice):
         if progress_cb:
             progress_cb({"ip": self.host, "type": "progress", "progress": 100, "status": "Rebooting..."})
 
-        self.reboot(wait_reboot=True, max_wait_secs=10, show_progress_bar=show_progress_bar, progress_cb=progress_cb)
+        yield from self.reboot_steps(max_wait_secs=10, show_progress_bar=show_progress_bar, progress_cb=progress_cb)
 
     def factory_reset(self, timeout=10.0):
         """
@@ -349,19 +409,17 @@ class DeployDev(HttpDevice):
         """
         url = self.get_http_url('status.json')
         auth = self.get_http_auth()
-        params = {
-            'components': 2097152,
-            'cmd': 42
-        }
         
         log.info(f"[{self.get_log_label()}] Triggering factory reset (POST {url})...")
         try:
-            r = requests.post(url, params=params, auth=auth, verify=False, timeout=timeout, headers=self.req_headers)
-            if r.status_code == 200:
-                return True
-            else:
-                log.warning(f"[{self.get_log_label()}] Factory reset POST returned {r.status_code}")
-                return False
+            r = self.get_http_session().post(url, params=dict(self.FACTORY_RESET_PARAMS), auth=auth, verify=False, timeout=timeout, headers=self.req_headers)
+            return self.factory_reset_accepted(r)
         except Exception as e:
             log.error(f"[{self.get_log_label()}] Factory reset exception: {e}")
             raise
+
+    def factory_reset_accepted(self, r):
+        if r.status_code == 200:
+            return True
+        log.warning(f"[{self.get_log_label()}] Factory reset POST returned {r.status_code}")
+        return False
@@ -0,0 +1,267 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
+
+
+#
+# Deployment steps are generators. A generator does its (short) device I/O when
+# resumed and yields Sleep(secs) whenever it has to wait, e.g. between reboot probes.
+# run_steps() drives such a generator on the calling thread, the DeploymentScheduler
+# drives many of them with a few worker threads: waiting generators are parked as
+# timers and do not hold a thread. run_steps_async() drives one on an asyncio loop.
+#
+class Sleep(object):
+    __slots__ = ('secs',)
+
+    def __init__(self, secs):
+        self.secs = secs
+
+    def __repr__(self):
+        return f"Sleep({self.secs})"
+
+
+def run_steps(steps):
+    """Run a step generator to completion on the calling thread and return its result."""
+    try:
+        item = next(steps)
+        while True:
+            if isinstance(item, Sleep) and item.secs > 0:
+                time.sleep(item.secs)
+            item = steps.send(None)
+    except StopIteration as e:
+        return e.value
+
+
+def _resume(steps):
+    """(True, result) once the generator returned, (False, yielded item) otherwise."""
+    try:
+        return False, steps.send(None)
+    except StopIteration as e:  # must not be raised into an asyncio future
+        return True, e.value
+
+
+async def run_steps_async(steps, executor=None):
+    """
+    Run a step generator to completion on the running event loop and return its result.
+    The generator is resumed on executor (its device I/O blocks), Sleep is awaited on the
+    loop, so a waiting device holds no thread.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        done, item = await loop.run_in_executor(executor, _resume, steps)
+        if done:
+            return item
+        if isinstance(item, Sleep) and item.secs > 0:
+            await asyncio.sleep(item.secs)
+
+
+class GroupSlots(object):
+    """
+    Counting slots per group, e.g. per gateway address of port-forwarded devices.
+
+    limit is an int or a callable group -> int, 0 or None means unlimited. try_acquire()
+    never blocks: step generators wait with acquire_steps() (yielding Sleep), coroutines
+    with acquire_async(), so a waiting device does not hold a worker thread.
+    """
+    POLL_SECS = 0.5
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.used = {}
+        self._lock = threading.Lock()
+
+    def limit_of(self, group):
+        limit = self.limit(group) if callable(self.limit) else self.limit
+        return int(limit or 0)
+
+    def try_acquire(self, group):
+        limit = self.limit_of(group)
+        with self._lock:
+            used = self.used.get(group, 0)
+            if limit and used >= limit:
+                return False
+            self.used[group] = used + 1
+            return True
+
+    def release(self, group):
+        with self._lock:
+            used = self.used.get(group, 0) - 1
+            if used > 0:
+                self.used[group] = used
+            else:
+                self.used.pop(group, None)
+
+    def acquire_steps(self, group):
+        while not self.try_acquire(group):
+            yield Sleep(self.POLL_SECS)
+
+    async def acquire_async(self, group):
+        while not self.try_acquire(group):
+            await asyncio.sleep(self.POLL_SECS)
+
+
+class _Job(object):
+    __slots__ = ('key', 'factory', 'steps', 'group')
+
+    def __init__(self, key, factory, group=None):
+        self.key = key
+        self.factory = factory
+        self.steps = None
+        self.group = group
+
+
+class DeploymentScheduler(object):
+    """
+    Run step generators of many devices with a small pool of worker threads.
+
+    At most max_active generators are started at once (devices in flight), the rest
+    wait in submission order. Jobs submitted with a group also need a slot of group_slots
+    (GroupSlots); while their group is full, later jobs of other groups are started. A worker resumes a ready generator until it yields
+    Sleep or returns; sleeping generators are kept in a timer heap.
+
+    run(jobs) also takes the jobs of an iterable while the workers run, no more than
+    max_active of them wait at a time, so a large target range is never queued up front.
+    It returns a dict mapping each key to the generator's return value, or to
+    on_error(key, exception) if it raised (to the exception if on_error raises too).
+    """
+
+    def __init__(self, workers=4, max_active=None, on_error=None, group_slots=None):
+        self.workers = max(1, int(workers))
+        self.max_active = max(1, int(max_active)) if max_active else None
+        self.on_error = on_error
+        self.group_slots = group_slots
+        self._pending = deque()
+        self._ready = deque()
+        self._timers = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._results = {}
+        self._feeding = False
+        self._cond = threading.Condition()
+
+    def submit(self, key, steps_factory, group=None):
+        """steps_factory() is called when the job gets started and must return a step generator."""
+        with self._cond:
+            self._pending.append(_Job(key, steps_factory, group))
+
+    def _grouped(self, job):
+        return job.group is not None and self.group_slots is not None
+
+    def _admit(self):
+        waiting = deque()
+        while self._pending and (self.max_active is None or self._active < self.max_active):
+            job = self._pending.popleft()
+            if self._grouped(job) and not self.group_slots.try_acquire(job.group):
+                waiting.append(job)  # group full, the slot goes to the next job of another group
+                continue
+            self._ready.append(job)
+            self._active += 1
+        waiting.extend(self._pending)
+        self._pending = waiting
+
+    def _done(self):
+        return (not self._feeding and not self._pending and not self._ready and not self._timers
+                and self._active == 0)
+
+    def _next_job(self):
+        """Return the next runnable job, waiting for timers; None if all work is done."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._timers and self._timers[0][0] <= now:
+                    self._ready.append(heapq.heappop(self._timers)[2])
+                if self._ready:
+                    return self._ready.popleft()
+                if self._done():
+                    self._cond.notify_all()
+                    return None
+                timeout = (self._timers[0][0] - now) if self._timers else None
+                self._cond.wait(timeout)
+
+    def _finish(self, job, result):
+        with self._cond:
+            self._results[job.key] = result
+            self._active -= 1
+            if self._grouped(job):
+                self.group_slots.release(job.group)
+            self._admit()
+            self._cond.notify_all()
+
+    def _error_result(self, key, e):
+        """on_error(key, e), or e itself; a raising on_error must not leave the job unfinished."""
+        if self.on_error is None:
+            return e
+        try:
+            return self.on_error(key, e)
+        except Exception as callback_error:
+            log.error(f"{key}: on_error failed: {callback_error}", exc_info=True)
+            return e
+
+    def _step(self, job):
+        try:
+            if job.steps is None:
+                job.steps = job.factory()
+                item = next(job.steps)
+            else:
+                item = job.steps.send(None)
+        except StopIteration as e:
+            self._finish(job, e.value)
+            return
+        except Exception as e:
+            log.error(f"{job.key}: deployment steps failed: {e}", exc_info=True)
+            self._finish(job, self._error_result(job.key, e))
+            return
+
+        with self._cond:
+            if isinstance(item, Sleep) and item.secs > 0:
+                heapq.heappush(self._timers, (time.monotonic() + item.secs, next(self._seq), job))
+            else:
+                self._ready.append(job)
+            self._cond.notify()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._step(job)
+
+    def _feed(self, jobs):
+        """Submit (key, steps_factory, group) of jobs, waiting while max_active jobs are pending."""
+        for key, steps_factory, group in jobs:
+            with self._cond:
+                while self.max_active is not None and len(self._pending) >= self.max_active:
+                    self._cond.wait()
+                self._pending.append(_Job(key, steps_factory, group))
+                self._admit()
+                self._cond.notify_all()
+
+    def run(self, jobs=()):
+        """
+        Run the submitted jobs and the (key, steps_factory, group) tuples of jobs. jobs is
+        iterated on the calling thread, it may block (e.g. look devices up) while others run.
+        """
+        with self._cond:
+            self._feeding = True
+            self._admit()
+        threads = [threading.Thread(target=self._worker, name=f"deploy-worker-{i}", daemon=True)
+                   for i in range(self.workers)]
+        for t in threads:
+            t.start()
+        try:
+            self._feed(jobs)
+        finally:
+            with self._cond:
+                self._feeding = False
+                self._cond.notify_all()
+            for t in threads:
+                t.join()
+        return self._results
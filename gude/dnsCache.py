@@ -0,0 +1,167 @@
+import asyncio
+import ipaddress
+import socket
+import threading
+import time
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
+
+DEFAULT_TTL = 300.0
+DEFAULT_CONCURRENCY = 32
+
+
+def _is_ip_literal(host):
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+class DnsCache(object):
+    """
+    Host name -> addresses, resolved through the system resolver once and reused.
+
+    Entries resolved on demand are kept for ttl seconds. Names resolved by prefetch()
+    (run start) are pinned until unpin() of the same hosts (run end), failures included,
+    so every request and GBL datagram of a run goes to the same address. Runs in parallel
+    (e.g. Web UI jobs) share the pins of a name, it is released by the last of them.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = {}  # host -> (expires or None if pinned, [(family, address)] or OSError)
+        self.pins = {}  # host -> number of runs that pinned it
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _addresses(infos):
+        return [(family, sockaddr[0]) for family, _, _, _, sockaddr in infos]
+
+    def _lookup(self, host):
+        return self._addresses(socket.getaddrinfo(host, None, socket.AF_UNSPEC, socket.SOCK_STREAM))
+
+    async def _lookup_async(self, host):
+        loop = asyncio.get_running_loop()
+        return self._addresses(await loop.getaddrinfo(host, None, family=socket.AF_UNSPEC, type=socket.SOCK_STREAM))
+
+    def _cached(self, host):
+        with self._lock:
+            entry = self.entries.get(host)
+            if entry is not None and (entry[0] is None or self.clock() < entry[0]):
+                return entry[1]
+        return None
+
+    def _store(self, host, addresses):
+        with self._lock:
+            self.entries[host] = (self.clock() + self.ttl, addresses)
+
+    def _entry(self, host):
+        addresses = self._cached(host)
+        if addresses is None:
+            try:
+                addresses = self._lookup(host)
+            except OSError as e:
+                return e
+            self._store(host, addresses)
+        return addresses
+
+    async def _entry_async(self, host):
+        addresses = self._cached(host)
+        if addresses is None:
+            try:
+                addresses = await self._lookup_async(host)
+            except OSError as e:
+                return e
+            self._store(host, addresses)
+        return addresses
+
+    @staticmethod
+    def _pick(host, addresses, family):
+        if isinstance(addresses, OSError):
+            raise socket.gaierror(f"{host}: {addresses}")
+        for addr_family, address in addresses:
+            if family == socket.AF_UNSPEC or addr_family == family:
+                return address
+        raise socket.gaierror(f"{host}: no address of family {family}")
+
+    def resolve(self, host, family=socket.AF_UNSPEC):
+        """First address of host (of family, if given), host itself for IP literals. Raises socket.gaierror."""
+        host = str(host)
+        if _is_ip_literal(host):
+            return host
+        return self._pick(host, self._entry(host.lower()), family)
+
+    async def resolve_async(self, host, family=socket.AF_UNSPEC):
+        """resolve() for coroutines, names not cached are looked up with loop.getaddrinfo()."""
+        host = str(host)
+        if _is_ip_literal(host):
+            return host
+        return self._pick(host, await self._entry_async(host.lower()), family)
+
+    async def _prefetch_async(self, hosts, concurrency):
+        slots = asyncio.Semaphore(concurrency)
+
+        async def _one(host):
+            async with slots:
+                try:
+                    return host, await self._lookup_async(host)
+                except OSError as e:
+                    return host, e
+
+        return await asyncio.gather(*(_one(host) for host in hosts))
+
+    @staticmethod
+    def _names(hosts):
+        return sorted(set(str(host).lower() for host in hosts if not _is_ip_literal(str(host))))
+
+    def prefetch(self, hosts, concurrency=DEFAULT_CONCURRENCY):
+        """Resolve hosts in parallel and pin them. Returns {host: error} of the names that failed."""
+        hosts = self._names(hosts)
+        if not hosts:
+            return {}
+        start = time.monotonic()
+        with self._lock:
+            # names pinned by a run in flight keep their address, they are not looked up again
+            pinned = {host: self.entries[host][1] for host in hosts if host in self.pins}
+            for host in pinned:
+                self.pins[host] += 1
+        answers = list(pinned.items())
+        lookup = [host for host in hosts if host not in pinned]
+        if lookup:
+            answers += asyncio.run(self._prefetch_async(lookup, concurrency))
+        with self._lock:
+            for host in lookup:
+                self.pins[host] = self.pins.get(host, 0) + 1
+            for host, addresses in answers:
+                self.entries[host] = (None, addresses)
+        failed = {host: addresses for host, addresses in answers if isinstance(addresses, OSError)}
+        log.info(f"DNS: {len(hosts) - len(failed)} of {len(hosts)} host names resolved within {time.monotonic() - start:.1f}s")
+        return failed
+
+    def unpin(self, hosts):
+        """Release the pins of prefetch(hosts) (end of a run), names still pinned by other runs are kept."""
+        with self._lock:
+            for host in self._names(hosts):
+                count = self.pins.get(host, 0)
+                if count > 1:
+                    self.pins[host] = count - 1
+                elif count == 1:
+                    del self.pins[host]
+                    self.entries.pop(host, None)
+
+
+# process-wide cache used by the http sessions, the asyncio engine and GBL
+dns_cache = DnsCache()
+
+
+def resolve(host, family=socket.AF_UNSPEC):
+    return dns_cache.resolve(host, family)
+
+
+async def resolve_async(host, family=socket.AF_UNSPEC):
+    return await dns_cache.resolve_async(host, family)
@@ -0,0 +1,139 @@
+import socket
+import struct
+
+#
+# GBL (Gude UDP bootloader protocol, port 50123) frame codec.
+#
+#   'GBL' version(0x04) | cmd (1 byte) | [mac (6 bytes) | data] | checksum (XOR of all previous bytes)
+#
+# Replies are parsed through memoryviews with precompiled struct layouts, nothing is
+# sliced out of the datagram before it is needed.
+#
+GBL_PREFIX = b'GBL\x04'
+GBL_PORT = 50123
+
+# NETCONF reply layouts by datagram size
+NETCONF_LAYOUTS = {
+    37: struct.Struct(">5s6sH5B4s4s4s3BHBB"),
+    131: struct.Struct(">5s6sH5B4s4s4s3BH6s3s3H64s16sB"),
+    133: struct.Struct(">5s6sH5B4s4s4s3BH6s3s3H64s16sHB"),
+}
+
+
+def checksum(data):
+    """XOR over all bytes of data, folded on big integers instead of a per-byte loop."""
+    n = len(data)
+    if n == 0:
+        return 0
+    x = int.from_bytes(data, 'big')
+    # xor of all bytes is kept when xoring the upper onto the lower half
+    while n > 1:
+        half = (n + 1) // 2
+        x = (x >> (8 * half)) ^ (x & ((1 << (8 * half)) - 1))
+        n = half
+    return x
+
+
+def encode(cmd, mac=b'', data=b''):
+    """Frame for a GBL_* command (1 byte, as bytes or int), optionally addressed to mac."""
+    if isinstance(cmd, int):
+        cmd = bytes([cmd])
+    frame = b''.join((GBL_PREFIX, cmd, mac, data))
+    return frame + bytes([checksum(frame)])
+
+
+class GblFrame(object):
+    """Decoded frame, data is a memoryview into the received datagram."""
+    __slots__ = ('cmd', 'mac', 'data', 'crc_ok')
+
+    def __init__(self, cmd, mac, data, crc_ok):
+        self.cmd = cmd
+        self.mac = mac
+        self.data = data
+        self.crc_ok = crc_ok
+
+
+def decode(udpdata):
+    """Split a reply into cmd, mac and data; None if it is no GBL frame."""
+    view = memoryview(udpdata)
+    if len(view) < 12 or view[:4] != GBL_PREFIX:
+        return None
+    return GblFrame(bytes(view[4:5]), bytes(view[5:11]), view[11:-1], checksum(view[:-1]) == view[-1])
+
+
+class NetconfReply(object):
+    """
+    Parsed GBL_NETCONF reply. Indexing and len() behave like the tuple eval_gbl1_reply
+    used to return (dev[1] mac, dev[8] ip, dev[20] name, ...).
+    """
+    __slots__ = ('fields',)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __getitem__(self, idx):
+        return self.fields[idx]
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def __hash__(self):
+        return hash(self.fields)
+
+    def __repr__(self):
+        return f"NetconfReply(mac={self.mac_str}, ip={self.ip}, name={self.product_name!r})"
+
+    @property
+    def mac(self):
+        return self.fields[1]
+
+    @property
+    def mac_str(self):
+        return ':'.join(f'{c:02x}' for c in self.fields[1])
+
+    @property
+    def ip(self):
+        return socket.inet_ntoa(self.fields[8])
+
+    @property
+    def bootloader(self):
+        return [self.fields[3], self.fields[4]]
+
+    @property
+    def firmware(self):
+        return [self.fields[5], self.fields[6]]
+
+    @property
+    def bootl_mode(self):
+        return self.fields[7]
+
+    @property
+    def allow_go_boot(self):
+        return self.fields[13] & 0x80
+
+    @property
+    def extended(self):
+        """Replies of newer firmware carry product name and hostname."""
+        return len(self.fields) >= 18
+
+    @property
+    def product_name(self):
+        return self.fields[20].decode(errors='replace').rstrip('\0') if self.extended else None
+
+    @property
+    def hostname(self):
+        return self.fields[21].decode(errors='replace').rstrip('\0') if self.extended else None
+
+
+def parse_netconf(udpdata):
+    """NetconfReply for a 37/131/133 byte reply, None for other sizes."""
+    layout = NETCONF_LAYOUTS.get(len(udpdata))
+    if layout is None:
+        return None
+    return NetconfReply(layout.unpack_from(udpdata))
@@ -0,0 +1,143 @@
+import struct
+
+from gude import gblCodec
+from gude.gblib import Gblib
+from gude.gblWindow import GblWindow, GblTransferError, enter_bootloader_steps
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
+
+
+class EntityLayout(object):
+    """
+    Frame layout of GBL_READENT / GBL_WRITENT, assumed like PartitionPageLayout
+    (the bootloader side is not part of this tree):
+
+      READENT request: mac | entity id (>H)
+              reply:   mac | entity id (>H) | status (B, 0 = present) | entity data
+      WRITENT request: mac | entity id (>H) | entity data
+              reply:   mac | entity id (>H) | status (B, 0 = written)
+    """
+    HEADER = struct.Struct(">H")
+    MAX_ENTITY_ID = 128  # ids scanned when reading all entities of a device
+
+    def encode_read(self, mac, entity_id):
+        return gblCodec.encode(Gblib.GBL_READENT, mac, self.HEADER.pack(entity_id))
+
+    def encode_write(self, mac, entity_id, data):
+        return gblCodec.encode(Gblib.GBL_WRITENT, mac, self.HEADER.pack(entity_id) + data)
+
+    def decode_reply(self, udpdata, mac):
+        """(cmd, entity id, status, data) of a valid reply from mac, None otherwise."""
+        frame = gblCodec.decode(udpdata)
+        if frame is None or not frame.crc_ok or frame.mac != mac or len(frame.data) < self.HEADER.size + 1:
+            return None
+        entity_id, = self.HEADER.unpack_from(frame.data)
+        return frame.cmd, entity_id, frame.data[self.HEADER.size], frame.data[self.HEADER.size + 1:]
+
+
+class GblEntityTransfer(GblWindow):
+    """
+    Reads and writes eprom entities of one device, requests are pipelined by GblWindow.
+    Entities are dicts {"id": int, "data": hex string} like the ones of eprom.json
+    (HttpDevice.get_eprom_json), so HttpDevice.remove_volatile_entities applies to both.
+    """
+
+    def __init__(self, host, mac, layout=None, window=GblWindow.WINDOW, rto=GblWindow.RTO, retries=GblWindow.RETRIES):
+        super().__init__(host, mac, window, rto, retries)
+        self.layout = layout or EntityLayout()
+
+    def decode_reply(self, udpdata):
+        reply = self.layout.decode_reply(udpdata, self.mac)
+        if reply is None:
+            return None
+        cmd, entity_id, status, data = reply
+        return cmd, entity_id, (status, data)
+
+    def read_entities_steps(self, entity_ids=None):
+        """Entities present on the device, all ids below MAX_ENTITY_ID unless entity_ids is given."""
+        if entity_ids is None:
+            entity_ids = range(self.layout.MAX_ENTITY_ID)
+        found = {}
+
+        def encode(entity_id):
+            return self.layout.encode_read(self.mac, entity_id)
+
+        def accept(entity_id, cmd, reply):
+            if cmd != Gblib.GBL_READENT:
+                return None
+            status, data = reply
+            if status == 0:
+                found[entity_id] = bytes(data).hex().upper()
+            return True
+
+        yield from self.transfer_steps(entity_ids, encode, accept)
+        return [{"id": entity_id, "data": found[entity_id]} for entity_id in sorted(found)]
+
+    def write_entities_steps(self, entities):
+        data = {entity["id"]: bytes.fromhex(entity["data"]) for entity in entities}
+
+        def encode(entity_id):
+            return self.layout.encode_write(self.mac, entity_id, data[entity_id])
+
+        def accept(entity_id, cmd, reply):
+            if cmd != Gblib.GBL_WRITENT:
+                return None
+            return reply[0] == 0  # error status: send again
+
+        yield from self.transfer_steps(list(data), encode, accept)
+
+    def clone_steps(self, entities):
+        """Write entities, read them back and write mismatching ones once more."""
+        self.open()
+        try:
+            yield from self.write_entities_steps(entities)
+            bad = yield from self.mismatching_steps(entities)
+            if bad:
+                log.warning(f"[{self.host}] {len(bad)} entities differ after writing, writing them again")
+                yield from self.write_entities_steps(bad)
+                bad = yield from self.mismatching_steps(bad)
+                if bad:
+                    raise GblTransferError(f"verification failed for entities {[e['id'] for e in bad]}")
+        finally:
+            self.close()
+        log.info(f"[{self.host}] {len(entities)} entities written and verified, {self.retransmits} retransmissions")
+        return {"entities": len(entities), "retransmits": self.retransmits}
+
+    def mismatching_steps(self, entities):
+        actual = yield from self.read_entities_steps([entity["id"] for entity in entities])
+        actual = {entity["id"]: entity["data"] for entity in actual}
+        return [entity for entity in entities if actual.get(entity["id"]) != entity["data"].upper()]
+
+    def read_all_steps(self, entity_ids=None):
+        self.open()
+        try:
+            return (yield from self.read_entities_steps(entity_ids))
+        finally:
+            self.close()
+
+
+def read_device_entities_steps(host, entity_ids=None):
+    """Step generator returning the entities of host, read in bootloader mode."""
+    gbl = yield from enter_bootloader_steps(host)
+    try:
+        return (yield from GblEntityTransfer(host, gbl.dstMAC).read_all_steps(entity_ids))
+    finally:
+        gbl.go_firmware(host)
+
+
+def clone_entities_steps(host, entities):
+    """
+    Step generator writing entities to host in bootloader mode. The firmware is started
+    afterwards, also if writing or verification failed (the error is raised then).
+    """
+    gbl = yield from enter_bootloader_steps(host)
+    try:
+        return (yield from GblEntityTransfer(host, gbl.dstMAC).clone_steps(entities))
+    except GblTransferError as e:
+        log.error(f"[{host}] cloning entities failed: {e}, starting the firmware again")
+        raise
+    finally:
+        gbl.go_firmware(host)
@@ -0,0 +1,138 @@
+import struct
+
+from gude import gblCodec
+from gude.gblib import Gblib
+from gude.gblWindow import GblWindow, GblTransferError
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
+
+
+class GblFlashError(GblTransferError):
+    pass
+
+
+class PartitionPageLayout(object):
+    """
+    Frame layout of GBL_WRPART / GBL_RDPART. The bootloader side is not part of this
+    tree, the layout below is an assumption kept in this one class:
+
+      WRPART request: mac | partition (B) | page (>H) | page data (page_size bytes)
+             reply:   mac | partition (B) | page (>H) | status (B, 0 = written)
+      RDPART request: mac | partition (B) | page (>H)
+             reply:   mac | partition (B) | page (>H) | page data
+
+    Every frame is protected by the GBL XOR checksum. The last page is padded with 0xff.
+    """
+    HEADER = struct.Struct(">BH")
+    PAGE_SIZE = 1024
+    FIRMWARE_PARTITION = 0
+    PAD = b'\xff'
+
+    def __init__(self, page_size=PAGE_SIZE):
+        self.page_size = page_size
+
+    def page_count(self, size):
+        return (size + self.page_size - 1) // self.page_size
+
+    def page_data(self, image, page):
+        chunk = image[page * self.page_size:(page + 1) * self.page_size]
+        if len(chunk) < self.page_size:
+            return bytes(chunk) + self.PAD * (self.page_size - len(chunk))
+        return chunk
+
+    def encode_write(self, mac, partition, page, data):
+        return gblCodec.encode(Gblib.GBL_WRPART, mac, self.HEADER.pack(partition, page) + bytes(data))
+
+    def encode_read(self, mac, partition, page):
+        return gblCodec.encode(Gblib.GBL_RDPART, mac, self.HEADER.pack(partition, page))
+
+    def decode_reply(self, udpdata, mac):
+        """(cmd, partition, page, payload) of a valid reply from mac, None otherwise."""
+        frame = gblCodec.decode(udpdata)
+        if frame is None or not frame.crc_ok or frame.mac != mac or len(frame.data) < self.HEADER.size:
+            return None
+        partition, page = self.HEADER.unpack_from(frame.data)
+        return frame.cmd, partition, page, frame.data[self.HEADER.size:]
+
+
+class GblFlasher(GblWindow):
+    """
+    Writes an image into a flash partition of a device in bootloader mode.
+
+    Page writes are pipelined by GblWindow; a page acknowledged with an error status is
+    sent again. Afterwards every page is read back via RDPART and compared, mismatching
+    pages are written once more.
+
+    Not used by the deployment (upload.py) until PartitionPageLayout is checked against
+    the bootloader: a wrong page header or partition would write garbage into flash.
+    """
+
+    def __init__(self, host, mac, partition=None, layout=None, window=GblWindow.WINDOW, rto=GblWindow.RTO,
+                 retries=GblWindow.RETRIES):
+        super().__init__(host, mac, window, rto, retries)
+        self.layout = layout or PartitionPageLayout()
+        self.partition = self.layout.FIRMWARE_PARTITION if partition is None else partition
+
+    def decode_reply(self, udpdata):
+        reply = self.layout.decode_reply(udpdata, self.mac)
+        if reply is None or reply[1] != self.partition:
+            return None
+        cmd, partition, page, payload = reply
+        return cmd, page, payload
+
+    def flash_steps(self, image, sent_cb=None):
+        image = memoryview(image).cast('B')
+        pages = self.layout.page_count(len(image))
+        self.open()
+        try:
+            yield from self.write_pages_steps(image, range(pages), sent_cb)
+            bad = yield from self.verify_pages_steps(image, range(pages))
+            if bad:
+                log.warning(f"[{self.host}] {len(bad)} pages differ after writing, writing them again")
+                yield from self.write_pages_steps(image, bad)
+                bad = yield from self.verify_pages_steps(image, bad)
+                if bad:
+                    raise GblFlashError(f"verification failed for pages {bad[:8]}")
+        finally:
+            self.close()
+        log.info(f"[{self.host}] {pages} pages written and verified, {self.retransmits} retransmissions")
+        return {"pages": pages, "retransmits": self.retransmits}
+
+    def write_pages_steps(self, image, pages, sent_cb=None):
+        total = len(image)
+        page_size = self.layout.page_size
+        state = {"done": 0}
+
+        def encode(page):
+            return self.layout.encode_write(self.mac, self.partition, page, self.layout.page_data(image, page))
+
+        def accept(page, cmd, payload):
+            if cmd != Gblib.GBL_WRPART:
+                return None
+            if len(payload) < 1 or payload[0] != 0:
+                return False  # written with error status, send again
+            state["done"] += 1
+            if sent_cb is not None:
+                sent_cb(min(state["done"] * page_size, total), total)
+            return True
+
+        yield from self.transfer_steps(pages, encode, accept)
+
+    def verify_pages_steps(self, image, pages):
+        bad = []
+
+        def encode(page):
+            return self.layout.encode_read(self.mac, self.partition, page)
+
+        def accept(page, cmd, payload):
+            if cmd != Gblib.GBL_RDPART:
+                return None
+            if bytes(payload[:self.layout.page_size]) != bytes(self.layout.page_data(image, page)):
+                bad.append(page)
+            return True
+
+        yield from self.transfer_steps(pages, encode, accept)
+        return sorted(bad)
@@ -0,0 +1,127 @@
+import socket
+from collections import deque
+from time import monotonic
+
+from gude import gblCodec
+from gude.deployScheduler import Sleep
+from gude.dnsCache import resolve
+from gude.gblib import Gblib
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
+
+
+class GblTransferError(Exception):
+    pass
+
+
+def enter_bootloader_steps(host, max_wait_secs=30):
+    """Step generator returning a Gblib for host once it answers in bootloader mode."""
+    gbl = Gblib()
+    if not gbl.check_mac(host):
+        raise GblTransferError("device does not answer GBL_NETCONF")
+    if gbl.bootl_mode:
+        return gbl
+    if not gbl.allow_go_boot:
+        raise GblTransferError("device does not allow to start the bootloader via GBL")
+    log.info(f"[{host}] starting bootloader")
+    gbl.go_bootldr(host)
+    deadline = monotonic() + max_wait_secs
+    while monotonic() < deadline:
+        yield Sleep(0.5)
+        if gbl.check_mac(host) and gbl.bootl_mode:
+            return gbl
+    raise GblTransferError(f"bootloader did not answer within {max_wait_secs}s")
+
+
+class GblWindow(object):
+    """
+    Pipelined GBL request/reply exchange with one device (GblFlasher, GblEntityTransfer).
+
+    Up to `window` requests are outstanding at once, each identified by a key (flash page,
+    entity id). A request without a valid reply within `rto` seconds is sent again, at most
+    `retries` times. Subclasses implement decode_reply().
+
+    transfer_steps() is a step generator (see gude.deployScheduler): it yields Sleep(0) after
+    each time slice so other devices get their turn on the worker threads.
+    """
+    WINDOW = 8
+    RTO = 0.3
+    RETRIES = 8
+    SLICE_SECS = 0.05
+
+    def __init__(self, host, mac, window=WINDOW, rto=RTO, retries=RETRIES):
+        self.host = host
+        self.mac = mac
+        self.window = window
+        self.rto = rto
+        self.retries = retries
+        self.retransmits = 0
+        self.sock = None
+
+    def open(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.bind(("", 0))
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def decode_reply(self, udpdata):
+        """(cmd, key, payload) of a valid reply from this device, None otherwise."""
+        raise NotImplementedError
+
+    def transfer_steps(self, keys, encode, accept):
+        """
+        Send encode(key) for all keys. accept(key, cmd, payload) returns True if the key
+        is done, False to send it again, None to ignore the reply.
+        """
+        pending = deque(keys)
+        inflight = {}  # key -> [deadline, tries]
+        while pending or inflight:
+            slice_end = monotonic() + self.SLICE_SECS
+            while (pending or inflight) and monotonic() < slice_end:
+                while pending and len(inflight) < self.window:
+                    key = pending.popleft()
+                    self.send(encode(key))
+                    inflight[key] = [monotonic() + self.rto, 1]
+
+                now = monotonic()
+                for key, entry in inflight.items():
+                    if entry[0] <= now:
+                        self.resend(key, entry, encode)
+
+                wait = min(entry[0] for entry in inflight.values()) - monotonic() if inflight else 0
+                self.sock.settimeout(max(0.001, min(wait, slice_end - monotonic())))
+                try:
+                    data = self.sock.recv(2048)
+                except socket.timeout:
+                    continue
+                except OSError:  # e.g. ICMP port unreachable
+                    continue
+                reply = self.decode_reply(data)
+                if reply is None:
+                    continue
+                cmd, key, payload = reply
+                if key not in inflight:
+                    continue
+                ok = accept(key, cmd, payload)
+                if ok:
+                    del inflight[key]
+                elif ok is False:
+                    self.resend(key, inflight[key], encode)
+            yield Sleep(0)
+
+    def resend(self, key, entry, encode):
+        if entry[1] > self.retries:
+            raise GblTransferError(f"{key}: no valid reply after {self.retries} retries")
+        self.retransmits += 1
+        entry[1] += 1
+        entry[0] = monotonic() + self.rto
+        self.send(encode(key))
+
+    def send(self, frame):
+        self.sock.sendto(frame, (resolve(self.host, socket.AF_INET), gblCodec.GBL_PORT))
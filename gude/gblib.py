@@ -3,8 +3,19 @@ from shutil import get_terminal_size
 from sys import stdout
 
 import socket
-from time import sleep
+import select
 import struct
+import sys
+import ipaddress
+from time import sleep, monotonic
+
+from gude import gblCodec
+from gude.dnsCache import resolve
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
 
 
 def print_progress_bar(iteration, total, decimals=1, length=None, fill='█', clear='-', unit='', actual=None,
@@ -54,6 +65,9 @@ class Gblib(object):
 
     DEFAULT_TIMEOUT = 1.0
 
+    # MAC -> hostname of legacy devices from GBL_FWINFO, kept for the lifetime of the process
+    fwinfo_cache = {}
+
     def __init__(self):
         self.dstMAC = bytes(0)
         self.bootl_mode = False
@@ -63,10 +77,7 @@ class Gblib(object):
 
     @staticmethod
     def gbl_checksum(data):
-        chksum = 0
-        for byte in data:
-            chksum ^= int(byte)
-        return chksum
+        return gblCodec.checksum(data)
 
     @staticmethod
     def send_gbl(ip_addr, cmd, timeout=1, wait_answ=True):
@@ -75,10 +86,8 @@ class Gblib(object):
         s.settimeout(timeout)
         s.bind(("", 0))
         # print (f"send GBL1... with timeout {timeout}")
-        payload = b'\x47\x42\x4c\x04' + cmd
-        chksum = Gblib.gbl_checksum(payload)
         data = None
-        s.sendto(payload + bytes([chksum]), (ip_addr, 50123))
+        s.sendto(gblCodec.encode(cmd), (resolve(ip_addr, socket.AF_INET), gblCodec.GBL_PORT))
         if wait_answ:
             try:
                 data = s.recv(2048)
@@ -102,17 +111,20 @@ class Gblib(object):
         Gblib.send_gbl(ip_addr, Gblib.GBL_FABSETTINGS + self.dstMAC, self.default_timeout, False)
 
     def parse_gbl_reply(self, udpdata, expected_cmd, keys=None, unpack=None):
+        frame = gblCodec.decode(udpdata)
+        if frame is None:
+            raise ValueError('no GBL reply')
         gbl_reply = {
-            'prefix': udpdata[0:4],
-            'cmd': udpdata[4:5],
-            'mac': udpdata[5:11],
-            'data': udpdata[11:-1],
+            'prefix': gblCodec.GBL_PREFIX,
+            'cmd': frame.cmd,
+            'mac': frame.mac,
+            'data': frame.data,
             'crc': udpdata[-1],
             'unpacked': None,
             'udpdata': udpdata
         }
 
-        if Gblib.gbl_checksum(udpdata[:-1]) != gbl_reply['crc']:
+        if not frame.crc_ok:
             raise ValueError('crc checksum error')
 
         if expected_cmd != gbl_reply['cmd']:
@@ -122,13 +134,13 @@ class Gblib(object):
             raise ValueError('reply from unexpected mac')
 
         if keys is not None and unpack is not None:
-            gbl_reply['unpacked'] = dict(zip(keys, struct.unpack(unpack, gbl_reply['data'])))
+            gbl_reply['unpacked'] = dict(zip(keys, struct.unpack(unpack, frame.data)))
 
         return gbl_reply
 
     @staticmethod
     def send_bc(ip_addr):
-        payload = b'\x47\x42\x4c\x04\x01\x4c'
+        payload = gblCodec.encode(Gblib.GBL_NETCONF)
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, True)
         s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, True)
@@ -139,14 +151,7 @@ class Gblib(object):
 
     @staticmethod
     def eval_gbl1_reply(data):
-        if len(data) == 37:
-            return struct.unpack_from(">5s6sH5B4s4s4s3BHBB", data, 0)
-        if len(data) == 131:
-            return struct.unpack_from(">5s6sH5B4s4s4s3BH6s3s3H64s16sB", data, 0)
-        if len(data) == 133:
-            return struct.unpack_from(">5s6sH5B4s4s4s3BH6s3s3H64s16sHB", data, 0)
-
-        return None
+        return gblCodec.parse_netconf(data)
 
     @staticmethod
     def get_device_name(dev):
@@ -160,12 +165,12 @@ class Gblib(object):
             return dev[20].decode().rstrip('\0')  # strip zeros at end!
 
     @staticmethod
-    def get_dev_info(dev):
-        if len(dev) < 18:  # older
-            data2 = Gblib.send_gbl(socket.inet_ntoa(dev[8]), Gblib.GBL_FWINFO + dev[1] + b'\x01')
-            hostname = bytes(data2[13:-1]).decode().rstrip('\0')  # strip zeros at end!
-        else:
+    def get_dev_info(dev, hostname=None):
+        # hostname: of a legacy device, if already known (see legacy_hostnames)
+        if len(dev) >= 18:
             hostname = dev[21].decode().rstrip('\0')  # strip zeros at end!
+        elif hostname is None:  # older
+            hostname = Gblib.legacy_hostnames([dev]).get(dev[1], '')
 
         return {
             'devname': Gblib.get_device_name(dev),
@@ -197,10 +202,11 @@ class Gblib(object):
         if len(self.dstMAC) == 0:
             data = Gblib.send_gbl(ip_addr, Gblib.GBL_NETCONF, self.default_timeout)
             if data is not None:
-                self.dstMAC = (struct.unpack_from("6s", data, 5))[0]
-                self.bootl_mode = (struct.unpack_from("B", data, 17))[0]
-                self.allow_go_boot = (struct.unpack_from("B", data, 32))[0] & 0x80
-                self.dev_info = Gblib.eval_gbl1_reply(data)
+                info = Gblib.netconf_info(data)
+                self.dstMAC = info['mac']
+                self.bootl_mode = info['bootl_mode']
+                self.allow_go_boot = info['allow_go_boot']
+                self.dev_info = info['dev_info']
                 return True
             else:
                 return False
@@ -208,21 +214,131 @@ class Gblib(object):
             return True
 
     @staticmethod
-    def recv_bc(myip='0.0.0.0', timeout=1):
-        sock_lst = []
-        device_lst = []
-        sock_lst.append(Gblib.send_bc(myip))
-        sleep(timeout)
-        for ip_addr, sock in sock_lst:
-            while True:
-                try:
-                    data, addr = sock.recvfrom(1024)
-                    if len(data) > 6:
-                        device_lst.append(Gblib.eval_gbl1_reply(data))
-                except BlockingIOError:
+    def netconf_info(data):
+        """MAC, bootloader mode and firmware version from a GBL_NETCONF reply (see check_mac)."""
+        dev = gblCodec.parse_netconf(data)
+        if dev is None:  # unknown reply size, read the fixed offsets only
+            return {
+                'mac': (struct.unpack_from("6s", data, 5))[0],
+                'bootl_mode': (struct.unpack_from("B", data, 17))[0],
+                'allow_go_boot': (struct.unpack_from("B", data, 32))[0] & 0x80,
+                'firmware': list(struct.unpack_from("2B", data, 15)),
+                'dev_info': None,
+            }
+        return Gblib.dev_netconf_info(dev)
+
+    @staticmethod
+    def dev_netconf_info(dev):
+        """netconf_info() from an already parsed reply (gblCodec.NetconfReply), e.g. from GblDiscovery."""
+        return {
+            'mac': dev.mac,
+            'bootl_mode': dev.bootl_mode,
+            'allow_go_boot': dev.allow_go_boot,
+            'firmware': dev.firmware,
+            'dev_info': dev,
+        }
+
+    @staticmethod
+    def batch_exchange(frames, match, timeout=DEFAULT_TIMEOUT, resend=True):
+        """
+        Send all frames {key: (addr, payload)} from one UDP socket and collect the replies
+        within one timeout window; match(data, addr) maps a reply to (key, value) or None.
+        Unanswered frames are sent again halfway through (resend). Returns {key: value}.
+        """
+        found = {}
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            s.bind(("", 0))
+
+            def send_pending():
+                for key, (addr, payload) in frames.items():
+                    if key not in found:
+                        try:
+                            s.sendto(payload, (addr, gblCodec.GBL_PORT))
+                        except OSError:
+                            pass
+
+            send_pending()
+            start = monotonic()
+            resend_at = start + timeout / 2 if resend else None
+            while len(found) < len(frames):
+                now = monotonic()
+                if resend_at is not None and now >= resend_at:
+                    send_pending()
+                    resend_at = None
+                wait = (resend_at if resend_at is not None else start + timeout) - now
+                if now >= start + timeout:
                     break
-            sock.close()
-        return device_lst
+                s.settimeout(max(0.001, wait))
+                try:
+                    data, (addr, _) = s.recvfrom(2048)
+                except socket.timeout:
+                    continue
+                except OSError:  # e.g. ICMP port unreachable reported on the socket
+                    continue
+                reply = match(data, addr)
+                if reply is not None and reply[0] in frames:
+                    found[reply[0]] = reply[1]
+        finally:
+            s.close()
+        return found
+
+    @staticmethod
+    def netconf_batch(hosts, timeout=DEFAULT_TIMEOUT, resend=True):
+        """
+        Send GBL_NETCONF to all hosts from one UDP socket and collect the replies by source
+        address within one timeout window. Returns {host: netconf_info} for the hosts that answered.
+        """
+        by_addr = {}
+        for host in hosts:
+            try:
+                addr = resolve(host, socket.AF_INET)
+            except (socket.gaierror, UnicodeError):
+                continue
+            by_addr.setdefault(addr, []).append(host)
+
+        payload = gblCodec.encode(Gblib.GBL_NETCONF)
+
+        def match(data, addr):
+            frame = gblCodec.decode(data) if len(data) > 32 else None
+            if frame is not None and frame.cmd == Gblib.GBL_NETCONF and frame.crc_ok:
+                return addr, Gblib.netconf_info(data)
+            return None
+
+        found = Gblib.batch_exchange({addr: (addr, payload) for addr in by_addr}, match, timeout, resend)
+        return {host: info for addr, info in found.items() for host in by_addr[addr]}
+
+    @staticmethod
+    def fwinfo_hostname(data):
+        """Hostname from a GBL_FWINFO reply."""
+        return bytes(data[13:-1]).decode(errors='replace').rstrip('\0')  # strip zeros at end!
+
+    @staticmethod
+    def legacy_hostnames(devs, timeout=DEFAULT_TIMEOUT):
+        """
+        Hostnames of legacy devices (short NETCONF replies without hostname) by MAC, queried by
+        GBL_FWINFO in parallel from one socket. Answers are kept in Gblib.fwinfo_cache.
+        """
+        frames = {}
+        for dev in devs:
+            if len(dev) < 18 and dev[1] not in Gblib.fwinfo_cache:
+                frames[dev[1]] = (socket.inet_ntoa(dev[8]), gblCodec.encode(Gblib.GBL_FWINFO, dev[1], b'\x01'))
+
+        def match(data, addr):
+            frame = gblCodec.decode(data)
+            if frame is not None and frame.cmd == Gblib.GBL_FWINFO and frame.crc_ok:
+                return frame.mac, Gblib.fwinfo_hostname(data)
+            return None
+
+        if frames:
+            found = Gblib.batch_exchange(frames, match, timeout)
+            log.debug(f"GBL_FWINFO: {len(found)} of {len(frames)} legacy devices answered")
+            Gblib.fwinfo_cache.update(found)
+        return {dev[1]: Gblib.fwinfo_cache[dev[1]] for dev in devs if dev[1] in Gblib.fwinfo_cache}
+
+    @staticmethod
+    def recv_bc(myip='0.0.0.0', timeout=1):
+        return list(GblDiscovery(myip, timeout))
 
     def wait_for_netconf(self, ip_addr, secs=8):
         for i in range(secs):
@@ -232,3 +348,140 @@ class Gblib(object):
             sleep(1)
         return False
 
+
+
+def local_ipv4_broadcasts():
+    """
+    [(address, broadcast)] of the local IPv4 interfaces (loopback excluded). Netmasks are read
+    via ioctl on Linux; elsewhere the host's addresses are used with the limited broadcast.
+    """
+    found = []
+    if sys.platform.startswith('linux'):
+        try:
+            import fcntl
+            siocgifaddr, siocgifnetmask = 0x8915, 0x891b
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                for _, name in socket.if_nameindex():
+                    req = struct.pack('256s', name.encode()[:15])
+                    try:
+                        addr = socket.inet_ntoa(fcntl.ioctl(s.fileno(), siocgifaddr, req)[20:24])
+                        mask = socket.inet_ntoa(fcntl.ioctl(s.fileno(), siocgifnetmask, req)[20:24])
+                    except OSError:  # interface without IPv4 address
+                        continue
+                    iface = ipaddress.ip_interface(f"{addr}/{mask}")
+                    if iface.ip.is_loopback:
+                        continue
+                    bc = iface.network.broadcast_address if iface.network.prefixlen < 31 else '<broadcast>'
+                    found.append((addr, str(bc)))
+            finally:
+                s.close()
+            return found
+        except (ImportError, OSError):
+            found = []
+    try:
+        for info in socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET, socket.SOCK_DGRAM):
+            addr = info[4][0]
+            if not addr.startswith('127.') and (addr, '<broadcast>') not in found:
+                found.append((addr, '<broadcast>'))
+    except (socket.gaierror, UnicodeError):
+        pass
+    return found
+
+
+class GblDiscovery(object):
+    """
+    GBL broadcast discovery, iterating over the devices (gblCodec.NetconfReply) as they reply.
+
+    The query is sent to every (bind address, destination) pair in targets, e.g. one
+    broadcast per local interface (interface_targets) and directed broadcasts to routed
+    subnets, each from its own socket. Replies are drained continuously from all sockets
+    with a large receive buffer, the broadcasts are repeated every `rebroadcast` seconds
+    to catch lost replies and devices are deduplicated by MAC. The first reply is waited for
+    the full `timeout`; after it, iteration stops once no new device replied for `quiet`
+    seconds, at the latest after `timeout` seconds.
+    """
+    RCVBUF = 4 * 1024 * 1024
+
+    def __init__(self, myip='0.0.0.0', timeout=1.0, quiet=None, rebroadcast=None, rcvbuf=RCVBUF, targets=None):
+        self.myip = myip
+        self.timeout = timeout
+        self.quiet = quiet if quiet is not None else timeout / 2
+        self.rebroadcast = rebroadcast if rebroadcast is not None else timeout / 4
+        self.rcvbuf = rcvbuf
+        self.targets = list(targets) if targets else [(myip, '<broadcast>')]
+        self.macs = set()
+
+    @staticmethod
+    def interface_targets(myip='0.0.0.0'):
+        """One broadcast per local interface, or only on myip if one is configured."""
+        if myip and myip != '0.0.0.0':
+            return [(myip, '<broadcast>')]
+        return local_ipv4_broadcasts() or [('0.0.0.0', '<broadcast>')]
+
+    @staticmethod
+    def directed_target(network, myip='0.0.0.0'):
+        """Directed broadcast into a (routed) subnet."""
+        return (myip, str(ipaddress.ip_network(network, strict=False).broadcast_address))
+
+    def open_socket(self, bind_ip=None):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, True)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, True)
+        try:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        except OSError:
+            pass
+        s.bind((self.myip if bind_ip is None else bind_ip, 0))
+        return s
+
+    @staticmethod
+    def broadcast(s, dest='<broadcast>'):
+        s.sendto(gblCodec.encode(Gblib.GBL_NETCONF), (dest, gblCodec.GBL_PORT))
+
+    def broadcast_all(self, socks):
+        for s, dest in socks:
+            try:
+                self.broadcast(s, dest)
+            except OSError as e:
+                log.debug(f"GBL broadcast to {dest} failed: {e}")
+
+    def __iter__(self):
+        socks = []
+        try:
+            for bind_ip, dest in self.targets:
+                try:
+                    socks.append((self.open_socket(bind_ip), dest))
+                except OSError as e:
+                    log.warning(f"GBL search on {bind_ip} not possible: {e}")
+            if not socks:
+                return
+            self.broadcast_all(socks)
+            start = monotonic()
+            last_new = None  # the quiet period starts with the first reply
+            deadline = start + self.timeout
+            next_bc = start + self.rebroadcast if self.rebroadcast > 0 else None
+            while True:
+                now = monotonic()
+                quiet_end = last_new + self.quiet if last_new is not None else deadline
+                if now >= deadline or now >= quiet_end:
+                    return
+                if next_bc is not None and now >= next_bc:
+                    self.broadcast_all(socks)
+                    next_bc = now + self.rebroadcast
+                wake = min(deadline, quiet_end, next_bc if next_bc is not None else deadline)
+                readable, _, _ = select.select([s for s, _ in socks], [], [], max(0.001, wake - now))
+                for s in readable:
+                    try:
+                        data, addr = s.recvfrom(2048)
+                    except OSError:
+                        continue
+                    dev = Gblib.eval_gbl1_reply(data) if len(data) > 6 else None
+                    if dev is None or dev[1] in self.macs:
+                        continue
+                    self.macs.add(dev[1])
+                    last_new = monotonic()
+                    yield dev
+        finally:
+            for s, _ in socks:
+                s.close()
@@ -4,8 +4,13 @@ import requests
 from requests.auth import HTTPBasicAuth
 
 from gude.deviceValues import DeviceValues
+from gude import httpSession
+from gude.multipartStream import MultipartStream
 
 from gude.gblib import print_progress_bar
+from gude.rebootDetector import RebootDetector, boot_priors
+from gude.probes import liveness_probes, tcp_probe, gbl_probe
+from gude.deployScheduler import Sleep, run_steps
 
 import logging
 # logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
@@ -15,6 +20,13 @@ log.setLevel(logging.getLevelName('INFO'))
 
 class HttpDevice(DeviceValues):
 
+    # status.json members delivered for a component flag, used to split coalesced responses
+    STATUS_JSON_KEYS = {
+        DeviceValues.JSON_STATUS_ETHERNET: ('ethernet',),
+        DeviceValues.JSON_STATUS_MISC: ('misc',),
+        DeviceValues.JSON_STATUS_UPLOAD: ('fileupload',),
+    }
+
     def get_log_label(self):
         use_ssl = bool(self.httpOpts.get("ssl"))
         default_port = 443 if use_ssl else 80
@@ -77,6 +89,23 @@ class HttpDevice(DeviceValues):
             auth = HTTPBasicAuth(self.httpOpts["username"], self.httpOpts["password"])
         return auth
 
+    def get_http_session_key(self):
+        return httpSession.session_key(self.host, self.httpOpts["port"], self.httpOpts["ssl"],
+                                       self.httpOpts["basicauth"], self.httpOpts["username"],
+                                       self.httpOpts["password"])
+
+    def get_http_session(self):
+        # host may change (config upload with new ip), so the key is checked on every request
+        key = self.get_http_session_key()
+        if self.httpSession is None or self.httpSessionKey != key:
+            self.httpSession = httpSession.get_shared_session(key)
+            self.httpSessionKey = key
+        return self.httpSession
+
+    def reset_http_session(self):
+        # kept-alive connections do not survive a device reboot
+        httpSession.drop_connections(self.get_http_session_key())
+
     def set_http_timeout(self, timeout):
         self.httpTimeout = timeout
 
@@ -107,83 +136,69 @@ class HttpDevice(DeviceValues):
                 if self.httpAutoAddAjaxTimestamp:
                     cgi_get_params["_"] = int(time.time())
                 # headers={'Connection': 'close'} DOES NOT WORK WITH PORT FORWARDING
-                r = requests.get(url, params=cgi_get_params, verify=False, timeout=self.httpTimeout, auth=auth, headers=req_headers)
+                r = self.get_http_session().get(url, params=cgi_get_params, verify=False, timeout=self.httpTimeout, auth=auth, headers=req_headers)
                 stop = time.time()
             except requests.exceptions.Timeout:
                 log.info(f"Timeout {url} {cgi_get_params} {retries}")
                 retries += 1
 
         if r is not None:
-            if r.status_code == 200:
-                self.set_last_req(r.url, r.status_code, (stop - start), len(r.text))
-                return r.text
-            elif r.status_code == 401:
-                raise requests.exceptions.HTTPError("401 Unauthorized", response=r)
-            else:
-                self.set_last_req(r.url, r.status_code, (stop - start), None)
-                raise ValueError("http request error {0}".format(r.status_code))
+            return self.get_response_text(r, stop - start)
         elif stop is None:
             raise requests.exceptions.Timeout("Timeout", response=r)
             
         raise ValueError("http request failed")
 
-    def http_ping(self, timeout=1.0, req_headers=None):
-        url = self.get_http_url('index.html')
-        auth = self.get_http_auth()
-        try:
-            r = requests.get(url, params={}, verify=False, timeout=timeout, auth=auth, headers=req_headers)
-            return r.status_code == 200
-        except (ValueError, Exception):
-            return False
-
-    def upload_file(self, file_data, upload_type, cgi_get_params=None, ret_ressource='fwupdate.txt', timeout=10.0, req_headers=None):
-        url = self.get_http_url(ret_ressource)
-        auth = self.get_http_auth()
-
-        if cgi_get_params is None:
-            cgi_get_params = {}
-
-        cgi_get_params["type"] = upload_type
-        files = {'fwupload': file_data}
-
-        start = time.time()
-        r = requests.post(url, params=cgi_get_params, files=files, verify=False, timeout=timeout, auth=auth, headers=req_headers)
-        stop = time.time()
-
+    #
+    # request building / response handling, shared with the asyncio client (gude.asyncHttpDevice)
+    #
+    def get_response_text(self, r, time_val):
         if r.status_code == 200:
-            self.set_last_req(r.url, r.status_code, (stop - start), len(r.text), method="POST")
+            self.set_last_req(r.url, r.status_code, time_val, len(r.text))
             return r.text
+        elif r.status_code == 401:
+            raise requests.exceptions.HTTPError("401 Unauthorized", response=r)
         else:
-            self.set_last_req(r.url, r.status_code, (stop - start), None, method="POST")
+            self.set_last_req(r.url, r.status_code, time_val, None)
             raise ValueError("http request error {0}".format(r.status_code))
 
-    def upload_config(self, file_data):
-        log.debug(file_data)
-        return self.upload_file(file_data, self.CGI_UPLOAD_TYPE_CONFIG)
-
-    def http_get_json(self, file, cgi_get_params=None, req_headers=None):
-        if cgi_get_params is None:
-            cgi_get_params = {}
-
-        json_string = self.http_get(file, cgi_get_params, req_headers)
-        if json_string:
-            return json.loads(json_string)
+    def get_upload_response_text(self, r, time_val):
+        if r.status_code == 200:
+            self.set_last_req(r.url, r.status_code, time_val, len(r.text), method="POST")
+            return r.text
         else:
-            return None
+            self.set_last_req(r.url, r.status_code, time_val, None, method="POST")
+            raise ValueError("http request error {0}".format(r.status_code))
 
-    def http_get_status_json(self, components, cgi_get_params=None, req_headers=None):
+    @staticmethod
+    def get_upload_request(file_data, upload_type, cgi_get_params=None, req_headers=None, sent_cb=None):
+        """(cgi_get_params, body, headers) of a file upload, the body is streamed from file_data."""
         if cgi_get_params is None:
             cgi_get_params = {}
-        cgi_get_params["components"] = components
-        return self.http_get_json("status.json", cgi_get_params, req_headers)
 
-    def http_get_config_json(self, components, cgi_get_params=None, req_headers=None):
+        cgi_get_params["type"] = upload_type
+        # sent_cb(sent, total) reports the bytes on the wire
+        body = MultipartStream('fwupload', file_data, progress_cb=sent_cb)
+        headers = dict(req_headers) if req_headers else {}
+        headers['Content-Type'] = body.content_type
+        return cgi_get_params, body, headers
+
+    @staticmethod
+    def get_components_params(components, cgi_get_params=None):
         if cgi_get_params is None:
             cgi_get_params = {}
         cgi_get_params["components"] = components
-        return self.http_get_json("config.json", cgi_get_params, req_headers)
+        return cgi_get_params
 
-    def http_cgi_json_cmd(self, cmd, params=None, merge_defaults=True, req_headers=None):
+    @staticmethod
+    def get_coalesced_components(components_list):
+        components = 0
+        for c in components_list:
+            components |= c
+        return components
+
+    def get_cgi_json_cmd_request(self, cmd, params=None, merge_defaults=True):
+        """(json file, cgi params) of a cgi command."""
         if params is None:
             params = {}
 
@@ -199,8 +214,93 @@ class HttpDevice(DeviceValues):
         my_params["cmd"] = cmd
         my_params["components"] = json_map['resource']['components']
         my_params.update(params)
+        return json_map['resource']['file'], my_params
 
-        return self.http_get_json(json_map['resource']['file'], my_params, req_headers)
+    @staticmethod
+    def parse_json(json_string):
+        if json_string:
+            return json.loads(json_string)
+        else:
+            return None
+
+    @staticmethod
+    def check_switch_state(json_data, port, status):
+        if json_data['outputs'][port-1]['state'] != status:
+            raise ValueError("illegal switch state")
+        return json_data
+
+    def http_ping(self, timeout=1.0, req_headers=None):
+        # cheapest liveness probe known to work for this model, see gude.probes
+        for probe in liveness_probes.candidates(self.boot_model):
+            start = time.time()
+            outcome = self.http_probe(probe, timeout, req_headers)
+            liveness_probes.report(self.boot_model, probe, outcome, time.time() - start)
+            if outcome is not None:
+                return outcome
+        return False
+
+    def http_probe(self, probe, timeout=1.0, req_headers=None):
+        url = self.get_http_url(probe.resource)
+        auth = self.get_http_auth()
+        try:
+            r = self.get_http_session().request(probe.method, url, params=dict(probe.params), verify=False,
+                                                timeout=timeout, auth=auth, headers=req_headers)
+            return probe.outcome(r.status_code)
+        except (ValueError, Exception):
+            return False
+
+    def upload_file(self, file_data, upload_type, cgi_get_params=None, ret_ressource='fwupdate.txt', timeout=10.0, req_headers=None, sent_cb=None):
+        url = self.get_http_url(ret_ressource)
+        auth = self.get_http_auth()
+        cgi_get_params, body, headers = self.get_upload_request(file_data, upload_type, cgi_get_params, req_headers, sent_cb)
+
+        start = time.time()
+        r = self.get_http_session().post(url, params=cgi_get_params, data=body, verify=False, timeout=timeout, auth=auth, headers=headers)
+        stop = time.time()
+        return self.get_upload_response_text(r, stop - start)
+
+    def upload_config(self, file_data):
+        log.debug(file_data)
+        return self.upload_file(file_data, self.CGI_UPLOAD_TYPE_CONFIG)
+
+    def http_get_json(self, file, cgi_get_params=None, req_headers=None):
+        if cgi_get_params is None:
+            cgi_get_params = {}
+
+        return self.parse_json(self.http_get(file, cgi_get_params, req_headers))
+
+    def http_get_status_json(self, components, cgi_get_params=None, req_headers=None):
+        return self.http_get_json("status.json", self.get_components_params(components, cgi_get_params), req_headers)
+
+    @classmethod
+    def split_status_json(cls, json_data, components_list):
+        """
+        Split a status.json response fetched for several component flags into one dict per
+        entry of components_list. Flags without known members get the complete response.
+        """
+        parts = []
+        for components in components_list:
+            keys = []
+            for flag, flag_keys in cls.STATUS_JSON_KEYS.items():
+                if components & flag:
+                    keys.extend(flag_keys)
+                    components &= ~flag
+            if components:
+                parts.append(json_data)
+            else:
+                parts.append({k: json_data[k] for k in keys if k in json_data})
+        return parts
+
+    def http_get_status_json_coalesced(self, components_list, cgi_get_params=None, req_headers=None):
+        """Fetch the components of all consumers with one status.json request, return one dict per consumer."""
+        components = self.get_coalesced_components(components_list)
+        return self.split_status_json(self.http_get_status_json(components, cgi_get_params, req_headers) or {}, components_list)
+
+    def http_get_config_json(self, components, cgi_get_params=None, req_headers=None):
+        return self.http_get_json("config.json", self.get_components_params(components, cgi_get_params), req_headers)
+
+    def http_cgi_json_cmd(self, cmd, params=None, merge_defaults=True, req_headers=None):
+        return self.http_get_json(*self.get_cgi_json_cmd_request(cmd, params, merge_defaults), req_headers)
 
     def get_all_json(self, req_headers=None):
         self.allConfigJson = self.http_get_config_json(self.JSON_ALL, req_headers)
@@ -213,82 +313,116 @@ class HttpDevice(DeviceValues):
             return False
 
         if remove_volatiles:
-            new_json = []
-            for entity in self.entities:
-                #
-                # completely remove entities
-                #   14: CONFIG_ID_BOOT_STATS
-                #   30: CONFIG_ID_GSM_COUNTERS
-                #   32: CONFIG_ID_GSM_LOGENTRY
-                #   41: CONFIG_ID_ENERGY_COUNT (obsolete)
-                #   54: CONFIG_ID_EXT_ENERGY_COUNT
-                #
-                if entity["id"] not in [14, 30, 32, 41, 54]:
-                    new_json.append(entity)
-
-                #
-                # whiteout entities parts
-                #
-                if entity["id"] == 36:
-                    # watchdog status
-                    entity["data"] = entity["data"][:2] + "00" + entity["data"][5:]
-
-                if entity["id"] == 38:
-                    # whiteout current port state (remember last state maybe is fab default)
-                    opt_byte = int(bytearray.fromhex(entity["data"][:2])[0]) & 0xFE
-                    entity["data"] = f'{opt_byte:0>2X}' + entity["data"][2:]
-
-            self.entities = new_json
+            self.entities = self.remove_volatile_entities(self.entities)
         return self.entities
 
+    @staticmethod
+    def remove_volatile_entities(entities):
+        """Entities without counters / runtime state, e.g. to clone them to another device."""
+        new_json = []
+        for entity in entities:
+            #
+            # completely remove entities
+            #   14: CONFIG_ID_BOOT_STATS
+            #   30: CONFIG_ID_GSM_COUNTERS
+            #   32: CONFIG_ID_GSM_LOGENTRY
+            #   41: CONFIG_ID_ENERGY_COUNT (obsolete)
+            #   54: CONFIG_ID_EXT_ENERGY_COUNT
+            #
+            if entity["id"] not in [14, 30, 32, 41, 54]:
+                new_json.append(entity)
+
+            #
+            # whiteout entities parts
+            #
+            if entity["id"] == 36:
+                # watchdog status
+                entity["data"] = entity["data"][:2] + "00" + entity["data"][5:]
+
+            if entity["id"] == 38:
+                # whiteout current port state (remember last state maybe is fab default)
+                opt_byte = int(bytearray.fromhex(entity["data"][:2])[0]) & 0xFE
+                entity["data"] = f'{opt_byte:0>2X}' + entity["data"][2:]
+
+        return new_json
+
     def flush_config_buffer(self):
         self.allConfigJson = None
         self.allStatusJson = None
         self.entities = None
 
     def wait_reboot(self, max_wait_secs=20.0, pre_wait_secs=5.0, req_headers=None, show_progress_bar=True, progress_cb=None):
-        total = int(pre_wait_secs) + int(max_wait_secs)
-        for i in range(0, int(pre_wait_secs)):
-            # log.info(".")
-            
-            if progress_cb:
-                pct = (100 / total) * i if total > 0 else 0
-                progress_cb({"ip": self.host, "type": "progress", "progress": pct, "status": f"Rebooting {i}/{total}s"})
+        return run_steps(self.wait_reboot_steps(max_wait_secs, pre_wait_secs, req_headers, show_progress_bar, progress_cb))
 
-            if show_progress_bar:
-                print_progress_bar(i, total, fill='#', clear=' ', unit='seconds')
-            else:
-                if i % 5 == 0:
-                    log.info(f"[{self.get_log_label()}] Rebooting... {i}/{total} seconds")
-            time.sleep(1)
-        retries = max_wait_secs
-        while retries:
-            if self.http_ping(1.0, req_headers):
-                if show_progress_bar:
-                    print_progress_bar(total, total, fill='#', clear=' ', unit='seconds',
-                                       actual=int(pre_wait_secs) + max_wait_secs - retries)
-                log.info(f"[{self.get_log_label()}] Device reachable")
-                time.sleep(1)
-                return True
-            else:
-                retries -= 1
-                # log.info(".")
-                current_sec = int(pre_wait_secs) + max_wait_secs - retries
-                
-                if progress_cb:
-                    pct = (100 / total) * current_sec if total > 0 else 0
-                    progress_cb({"ip": self.host, "type": "progress", "progress": pct, "status": f"Rebooting {current_sec}/{total}s"})
-
-                if show_progress_bar:
-                    print_progress_bar(current_sec, total, fill='#', clear=' ',
-                                       unit='seconds')
-                else:
-                    if current_sec % 5 == 0:
-                        log.info(f"[{self.get_log_label()}] Rebooting... {current_sec}/{total} seconds")
-
-        log.error(f"[{self.get_log_label()}] ERROR: no reply, giving up")
+    def wait_reboot_steps(self, max_wait_secs=20.0, pre_wait_secs=5.0, req_headers=None, show_progress_bar=True, progress_cb=None):
+        self.reset_http_session()
+        total = int(pre_wait_secs) + int(max_wait_secs)
+        detector = self.new_reboot_detector(max_wait_secs, pre_wait_secs)
+        reported_sec = -1
+        while not detector.finished:
+            delay, probe = detector.next_probe()
+            if delay > 0:
+                yield Sleep(delay)
+            detector.report(probe, self.reboot_probe(probe, req_headers))
+            reported_sec = self.report_reboot_elapsed(detector, reported_sec, total, show_progress_bar, progress_cb)
+
+        if self.finish_reboot_detection(detector, max_wait_secs, total, show_progress_bar):
+            yield Sleep(1)
+            return True
         return False
 
+    def new_reboot_detector(self, max_wait_secs, pre_wait_secs):
+        # pre_wait_secs is kept as lower bound of the time allowed for the device to go down
+        return RebootDetector(int(pre_wait_secs) + int(max_wait_secs),
+                              down_timeout=max(pre_wait_secs, RebootDetector.DOWN_TIMEOUT),
+                              expected_boot_secs=boot_priors.expected((self.boot_model, int(max_wait_secs))),
+                              use_gbl=self.use_gbl_reboot_probe())
+
+    def use_gbl_reboot_probe(self):
+        # behind a port mapping GBL (UDP 50123) would reach the gateway, not this device
+        default_port = 443 if self.httpOpts["ssl"] else 80
+        return self.reboot_gbl_probe and self.httpOpts["port"] == default_port
+
+    def reboot_probe(self, probe, req_headers=None):
+        if probe == 'http':
+            return self.http_ping(1.0, req_headers)
+        start = time.time()
+        if probe == 'tcp':
+            ok = tcp_probe(self.host, self.httpOpts["port"])
+        else:
+            ok = gbl_probe(self.host)
+        if ok:
+            liveness_probes.record_rtt(probe, time.time() - start)
+        return ok
+
+    def report_reboot_elapsed(self, detector, reported_sec, total, show_progress_bar=True, progress_cb=None):
+        current_sec = min(int(detector.elapsed()), total)
+        if current_sec != reported_sec and not detector.finished:
+            self.report_reboot_progress(current_sec, total, show_progress_bar, progress_cb)
+        return current_sec
+
+    def finish_reboot_detection(self, detector, max_wait_secs, total, show_progress_bar=True):
+        if detector.phase != 'up':
+            log.error(f"[{self.get_log_label()}] ERROR: no reply, giving up")
+            return False
+        if detector.boot_secs is not None:
+            boot_priors.observe((self.boot_model, int(max_wait_secs)), detector.boot_secs)
+        if show_progress_bar:
+            print_progress_bar(total, total, fill='#', clear=' ', unit='seconds', actual=int(detector.elapsed()))
+        log.info(f"[{self.get_log_label()}] Device reachable")
+        return True
+
+    def report_reboot_progress(self, current_sec, total, show_progress_bar=True, progress_cb=None):
+        if progress_cb:
+            pct = (100 / total) * current_sec if total > 0 else 0
+            progress_cb({"ip": self.host, "type": "progress", "progress": pct, "status": f"Rebooting {current_sec}/{total}s"})
+
+        if show_progress_bar:
+            print_progress_bar(current_sec, total, fill='#', clear=' ', unit='seconds')
+        else:
+            if current_sec % 5 == 0:
+                log.info(f"[{self.get_log_label()}] Rebooting... {current_sec}/{total} seconds")
+
     def reboot_cmd(self, cmd, wait_reboot=False, max_wait_secs=20.0, req_headers=None, show_progress_bar=True, progress_cb=None):
         self.http_cgi_json_cmd(cmd, req_headers)
         if wait_reboot:
@@ -314,14 +448,19 @@ class HttpDevice(DeviceValues):
         ret = self.reboot_cmd(self.CGI_CMD_RESET, wait_reboot, max_wait_secs, show_progress_bar=show_progress_bar, progress_cb=progress_cb)
         return ret
 
+    def reboot_steps(self, max_wait_secs=20, show_progress_bar=True, progress_cb=None):
+        """reboot(wait_reboot=True) as step generator, see gude.deployScheduler"""
+        log.info(f"[{self.get_log_label()}] Rebooting...")
+        self.flush_config_buffer()
+        self.http_cgi_json_cmd(self.CGI_CMD_RESET)
+        return (yield from self.wait_reboot_steps(max_wait_secs, show_progress_bar=show_progress_bar, progress_cb=progress_cb))
+
     #
     # switch port
     #
     def http_switch_port(self, port, status, req_headers=None):
         json_data = self.http_cgi_json_cmd(self.CGI_CMD_SWITCH_POWERPORTS, {"p": port, "s": status}, req_headers)
-        if json_data['outputs'][port-1]['state'] != status:
-            raise ValueError("illegal switch state")
-        return json_data
+        return self.check_switch_state(json_data, port, status)
 
     def set_bank_source(self, bank_id, source, req_headers=None):
         json_data = self.http_cgi_json_cmd(self.CGI_CMD_CONFIG_POWERPORTS,
@@ -400,6 +539,8 @@ class HttpDevice(DeviceValues):
     def __init__(self, host, req_headers=None):
         self.host = host
         self.log_job_id = None
+        self.boot_model = None
+        self.reboot_gbl_probe = True
         self.httpOpts = {
             "ssl": False,
             "port": 80,
@@ -414,6 +555,8 @@ class HttpDevice(DeviceValues):
             "code": None,
         }
         self.req_headers = req_headers
+        self.httpSession = None
+        self.httpSessionKey = None
         self.allConfigJson = None
         self.allStatusJson = None
         self.entities = None
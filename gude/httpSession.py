@@ -0,0 +1,116 @@
+import socket
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from gude.dnsCache import resolve
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
+
+# one device is polled (status.json) while an upload is running on a second connection
+POOL_MAXSIZE = 4
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def session_key(host, port, ssl, basicauth=False, username='', password=''):
+    """
+    Registry key of a device session. Devices reached by the same endpoint and
+    credentials share one connection pool (and one TLS session on ssl=1 hosts).
+    """
+    auth = (username, password) if basicauth else None
+    return str(host).lower(), int(port), bool(ssl), auth
+
+
+#
+# Connections to the address gude.dnsCache has for the host: the name is resolved once
+# per run instead of once per connection. URL, Host header and TLS (SNI) keep the name.
+# urllib3 (1.26 and 2.x) connects to its _dns_host attribute; where a urllib3 version
+# does not have it, or the name does not resolve, urllib3 resolves the name itself.
+#
+class _PinnedDns(object):
+    def _new_conn(self):
+        host = getattr(self, '_dns_host', None)
+        if not isinstance(host, str):
+            return super()._new_conn()
+        try:
+            address = resolve(host)
+        except (socket.gaierror, UnicodeError):
+            return super()._new_conn()  # urllib3 reports the name resolution error
+        self._dns_host = address
+        try:
+            return super()._new_conn()
+        finally:
+            self._dns_host = host
+
+
+class PinnedHTTPConnection(_PinnedDns, HTTPConnection):
+    pass
+
+
+class PinnedHTTPSConnection(_PinnedDns, HTTPSConnection):
+    pass
+
+
+class PinnedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = PinnedHTTPConnection
+
+
+class PinnedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = PinnedHTTPSConnection
+
+
+class PinnedDnsAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': PinnedHTTPConnectionPool,
+                                                   'https': PinnedHTTPSConnectionPool}
+
+
+def _new_session():
+    session = requests.Session()
+    session.verify = False
+    adapter = PinnedDnsAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_shared_session(key):
+    """Return the process-wide keep-alive session for key, creating it on first use."""
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _new_session()
+            _sessions[key] = session
+            log.debug(f"new http session {key[0]}:{key[1]} ssl={key[2]}")
+        return session
+
+
+def drop_connections(key):
+    """
+    Close pooled connections of a session but keep it registered. Used when a device
+    reboots, as kept-alive sockets are dead afterwards.
+    """
+    with _sessions_lock:
+        session = _sessions.get(key)
+    if session is not None:
+        session.close()
+
+
+def close_shared_sessions():
+    """Close and forget all registered sessions (end of a processing run)."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        try:
+            session.close()
+        except Exception:
+            pass
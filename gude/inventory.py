@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+import time
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
+
+
+class DeviceInventory(object):
+    """
+    Devices seen by earlier runs, stored as JSON file and keyed by MAC (aa:bb:cc:dd:ee:ff).
+
+    An entry holds target (the host list entry the device was processed as), ip, port, ssl,
+    prodid, product_name, hostname, firmware, capabilities and last_seen (epoch seconds).
+    """
+    VERSION = 1
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self.devices = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, clock=time.time):
+        inventory = cls(path, clock)
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as fp:
+                    data = json.load(fp)
+                inventory.devices = dict(data.get('devices', {}))
+                log.debug(f"{len(inventory.devices)} devices in inventory {path}")
+            except (OSError, ValueError, AttributeError) as e:
+                log.warning(f"Could not read device inventory {path}, starting empty: {e}")
+        return inventory
+
+    def save(self):
+        with self._lock:
+            data = {'version': self.VERSION, 'devices': self.devices}
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as fp:
+                    json.dump(data, fp, indent=1, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                log.warning(f"Could not write device inventory {self.path}: {e}")
+
+    @staticmethod
+    def normalize_mac(mac):
+        """'aa:bb:cc:dd:ee:ff' for MAC bytes or strings like '00_19_32_00_00_01', None if unknown."""
+        if isinstance(mac, (bytes, bytearray)):
+            return ':'.join(f'{c:02x}' for c in mac) if len(mac) == 6 else None
+        digits = str(mac or '').lower().replace('_', '').replace(':', '').replace('-', '')
+        if len(digits) != 12 or any(c not in '0123456789abcdef' for c in digits):
+            return None
+        return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+    def record(self, mac, **fields):
+        key = self.normalize_mac(mac)
+        if key is None:
+            return None
+        with self._lock:
+            entry = self.devices.setdefault(key, {})
+            entry.update(fields)
+            entry['last_seen'] = self.clock()
+            return dict(entry, mac=key)
+
+    def get(self, mac):
+        key = self.normalize_mac(mac)
+        with self._lock:
+            entry = self.devices.get(key)
+            return dict(entry, mac=key) if entry is not None else None
+
+    def find(self, target):
+        """Most recently seen entry processed as target, None if there is none."""
+        with self._lock:
+            matches = [(entry.get('last_seen', 0), mac) for mac, entry in self.devices.items()
+                       if entry.get('target') == target]
+            if not matches:
+                return None
+            mac = max(matches)[1]
+            return dict(self.devices[mac], mac=mac)
+
+    def is_fresh(self, entry, max_age):
+        return entry is not None and self.clock() - entry.get('last_seen', 0) <= max_age
@@ -0,0 +1,82 @@
+import os
+import binascii
+
+
+class MultipartStream(object):
+    """
+    multipart/form-data body with a single file field, produced chunk by chunk.
+
+    The file part is read from a bytes-like object (sliced via memoryview, no copy)
+    or from an open binary file, so the body is never built in memory. The layout
+    matches the body requests builds for files={field_name: data}.
+
+    read() hands out file data of a bytes-like object as memoryview slices, which the
+    socket layer accepts as is; use bytes(chunk) where a real bytes object is needed.
+
+    progress_cb(sent, total) is called for every chunk handed to the connection,
+    total being the size of the file part.
+    """
+
+    def __init__(self, field_name, data, filename=None, chunk_size=64 * 1024, progress_cb=None):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.boundary = binascii.hexlify(os.urandom(16)).decode('ascii')
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.chunk_size = chunk_size
+        self.progress_cb = progress_cb
+
+        if hasattr(data, 'read'):
+            self._fp = data
+            self._view = None
+            self.data_len = os.fstat(data.fileno()).st_size - data.tell()
+        else:
+            self._fp = None
+            self._view = memoryview(data).cast('B')
+            self.data_len = len(self._view)
+
+        filename = filename or field_name
+        self._head = (f"--{self.boundary}\r\n"
+                      f"Content-Disposition: form-data; name=\"{field_name}\"; filename=\"{filename}\"\r\n"
+                      f"\r\n").encode('utf-8')
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode('utf-8')
+        self._len = len(self._head) + self.data_len + len(self._tail)
+        self._pos = 0
+        self._data_sent = 0
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def _read_data(self, size):
+        if self._view is not None:
+            chunk = self._view[self._data_sent:self._data_sent + size]
+        else:
+            chunk = self._fp.read(size)
+        self._data_sent += len(chunk)
+        if self.progress_cb is not None:
+            self.progress_cb(self._data_sent, self.data_len)
+        return chunk
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._len
+        head_len = len(self._head)
+        data_end = head_len + self.data_len
+
+        if self._pos < head_len:
+            chunk = self._head[self._pos:self._pos + size]
+        elif self._pos < data_end:
+            chunk = self._read_data(min(size, data_end - self._pos))
+            if len(chunk) == 0:
+                raise ValueError("file part ended before its announced size")
+        else:
+            chunk = self._tail[self._pos - data_end:self._pos - data_end + size]
+
+        self._pos += len(chunk)
+        return chunk
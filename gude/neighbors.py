@@ -0,0 +1,72 @@
+import ipaddress
+import subprocess
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
+
+GUDE_OUIS = ('00:19:32',)
+
+ARP_TABLE = '/proc/net/arp'
+ATF_COM = 0x2  # arp flag: entry completed (MAC known)
+NUD_SKIP = ('FAILED', 'INCOMPLETE', 'NOARP')
+
+
+#
+# Neighbor table (Linux): hosts on directly attached subnets the kernel has talked to
+# recently, as candidates that need no broadcast or sweep to be found.
+#
+def read_arp_table(path=ARP_TABLE):
+    """[(ip, mac)] of completed entries of /proc/net/arp, [] if it cannot be read."""
+    try:
+        with open(path, 'r') as fp:
+            lines = fp.read().splitlines()[1:]
+    except OSError:
+        return []
+    neighbors = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 4:
+            continue
+        try:
+            flags = int(fields[2], 16)
+        except ValueError:
+            continue
+        if flags & ATF_COM and fields[3] != '00:00:00:00:00:00':
+            neighbors.append((fields[0], fields[3].lower()))
+    return neighbors
+
+
+def parse_ip_neigh(output):
+    """[(ip, mac)] from the output of `ip -4 neigh show`."""
+    neighbors = []
+    for line in output.splitlines():
+        fields = line.split()
+        if not fields or 'lladdr' not in fields or fields[-1] in NUD_SKIP:
+            continue
+        neighbors.append((fields[0], fields[fields.index('lladdr') + 1].lower()))
+    return neighbors
+
+
+def read_neighbors():
+    """IPv4 neighbors from /proc/net/arp, or `ip -4 neigh` where that is not available."""
+    neighbors = read_arp_table()
+    if neighbors:
+        return neighbors
+    try:
+        output = subprocess.run(['ip', '-4', 'neigh', 'show'], capture_output=True, text=True, timeout=2).stdout
+    except (OSError, subprocess.SubprocessError):
+        log.debug("no neighbor table available")
+        return []
+    return parse_ip_neigh(output)
+
+
+def is_gude_mac(mac):
+    return mac[:8].lower() in GUDE_OUIS
+
+
+def neighbors_in_network(neighbors, network):
+    """Neighbors inside network (ipaddress network), Gude devices first."""
+    found = [(ip, mac) for ip, mac in neighbors if ipaddress.ip_address(ip) in network]
+    return sorted(found, key=lambda neighbor: not is_gude_mac(neighbor[1]))
@@ -0,0 +1,127 @@
+import socket
+import threading
+
+from gude.dnsCache import resolve
+from gude.gblib import Gblib
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
+
+
+#
+# Liveness probes. A probe answers True (alive), False (no answer) or None (device
+# answered but does not support this probe). TCP and GBL probes are used while a
+# device reboots, HTTP probes decide whether the web server is back (HttpDevice.http_ping).
+#
+def tcp_probe(host, port, timeout=0.5):
+    """True if a TCP connection to host:port can be established within timeout."""
+    try:
+        with socket.create_connection((resolve(host), port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def gbl_probe(host, timeout=0.5):
+    """True if the device answers a single GBL_NETCONF query (UDP 50123)."""
+    try:
+        return Gblib.send_gbl(host, Gblib.GBL_NETCONF, timeout) is not None
+    except OSError:
+        return False
+
+
+class HttpProbe(object):
+    """HTTP request used as liveness probe, executed by HttpDevice / AsyncHttpDevice."""
+    __slots__ = ('name', 'method', 'resource', 'params')
+
+    # answers meaning "alive, but this probe is not supported"
+    UNSUPPORTED_CODES = (404, 405, 501)
+
+    def __init__(self, name, method, resource, params=None):
+        self.name = name
+        self.method = method
+        self.resource = resource
+        self.params = params or {}
+
+    def outcome(self, status_code):
+        if status_code == 200:
+            return True
+        if status_code in self.UNSUPPORTED_CODES:
+            return None
+        return False
+
+    def __repr__(self):
+        return f"HttpProbe({self.name})"
+
+
+# cheapest first; index.html is what http_ping always fetched and works on every device
+HTTP_PROBES = (
+    HttpProbe('head', 'HEAD', 'index.html'),
+    HttpProbe('status', 'GET', 'status.json', {'components': 0}),
+    HttpProbe('index', 'GET', 'index.html'),
+)
+
+
+class ProbeSelector(object):
+    """
+    Chooses the cheapest HTTP probe each model supports. The first probe that answers
+    200 is cached for the model, probes answered as unsupported are skipped for it.
+    Round-trip times of successful probes are collected per probe name.
+    """
+
+    def __init__(self, probes=HTTP_PROBES):
+        self.probes = tuple(probes)
+        self._chosen = {}
+        self._unsupported = {}
+        self._rtt = {}
+        self._lock = threading.Lock()
+
+    def candidates(self, model):
+        with self._lock:
+            chosen = self._chosen.get(model)
+            unsupported = self._unsupported.get(model, ())
+        if chosen is not None:
+            return [chosen]
+        return [p for p in self.probes if p.name not in unsupported]
+
+    def report(self, model, probe, outcome, rtt=None):
+        with self._lock:
+            if outcome is None:
+                self._unsupported.setdefault(model, set()).add(probe.name)
+                if self._chosen.get(model) is probe:
+                    del self._chosen[model]
+                log.debug(f"probe '{probe.name}' not supported by model {model}")
+            elif outcome:
+                if self._chosen.get(model) is not probe:
+                    self._chosen[model] = probe
+                    log.debug(f"using probe '{probe.name}' for model {model}")
+            if outcome and rtt is not None:
+                self._record_rtt(probe.name, rtt)
+
+    def record_rtt(self, name, rtt):
+        with self._lock:
+            self._record_rtt(name, rtt)
+
+    def _record_rtt(self, name, rtt):
+        count, total = self._rtt.get(name, (0, 0.0))
+        self._rtt[name] = (count + 1, total + rtt)
+
+    def rtt_summary(self):
+        """{probe name: (count, average rtt in seconds)}"""
+        with self._lock:
+            return {name: (count, total / count) for name, (count, total) in self._rtt.items()}
+
+    def chosen(self):
+        with self._lock:
+            return {model: probe.name for model, probe in self._chosen.items()}
+
+    def clear(self):
+        with self._lock:
+            self._chosen.clear()
+            self._unsupported.clear()
+            self._rtt.clear()
+
+
+liveness_probes = ProbeSelector()
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
+
+
+class BootPriors(object):
+    """
+    Expected boot time (device went down -> reachable again) per key, learned while running.
+    Keys are chosen by the caller, HttpDevice uses (model, wait budget) so firmware
+    reboots and config reboots of a model are kept apart.
+    """
+    DEFAULT_BOOT_SECS = 8.0
+
+    def __init__(self, default_secs=DEFAULT_BOOT_SECS, weight=0.5):
+        self.default_secs = default_secs
+        self.weight = weight
+        self._secs = {}
+        self._lock = threading.Lock()
+
+    def expected(self, key):
+        with self._lock:
+            return self._secs.get(key, self.default_secs)
+
+    def observe(self, key, secs):
+        with self._lock:
+            if key in self._secs:
+                self._secs[key] += self.weight * (secs - self._secs[key])
+            else:
+                self._secs[key] = secs
+
+    def clear(self):
+        with self._lock:
+            self._secs.clear()
+
+
+boot_priors = BootPriors()
+
+
+#
+# Reboot detection as state machine, independent of how probes are executed (blocking
+# step generator in HttpDevice, coroutine in AsyncHttpDevice).
+#
+#   down - tcp probes until the device stops accepting connections
+#   boot - device is down: tcp probes, staggered with GBL netconf probes until GBL answers;
+#          slow polling until the expected boot time has passed, fast polling afterwards
+#   http - tcp connect works again, http probes until the web server answers
+#   up / failed - done
+#
+class RebootDetector(object):
+    DOWN_TIMEOUT = 10.0
+    DOWN_INTERVAL = 0.5
+    SLOW_INTERVAL = 1.0
+    FAST_INTERVAL = 0.25
+
+    def __init__(self, max_secs, down_timeout=DOWN_TIMEOUT, expected_boot_secs=BootPriors.DEFAULT_BOOT_SECS,
+                 use_gbl=True, clock=time.monotonic):
+        self.max_secs = max_secs
+        self.down_timeout = down_timeout
+        self.expected_boot_secs = expected_boot_secs
+        self.use_gbl = use_gbl
+        self.clock = clock
+        self.start = clock()
+        self.phase = 'down'
+        self.down_confirmed = False
+        self.down_at = None
+        self.up_at = None
+        self.gbl_seen = False
+        self.last_probe = None
+
+    def elapsed(self):
+        return self.clock() - self.start
+
+    @property
+    def finished(self):
+        return self.phase in ('up', 'failed')
+
+    @property
+    def boot_secs(self):
+        """Observed boot time, None unless the device was seen going down and coming back."""
+        if self.phase != 'up' or not self.down_confirmed:
+            return None
+        return self.up_at - self.down_at
+
+    def next_probe(self):
+        """Return (delay, probe): wait delay seconds, then run probe 'tcp', 'gbl' or 'http'."""
+        if self.phase == 'down':
+            return (0 if self.last_probe is None else self.DOWN_INTERVAL), 'tcp'
+        if self.phase == 'http':
+            return (0 if self.last_probe == 'tcp' else self.FAST_INTERVAL), 'http'
+
+        if self.gbl_seen or self.elapsed() - self.down_at >= self.expected_boot_secs:
+            interval = self.FAST_INTERVAL
+        else:
+            interval = self.SLOW_INTERVAL
+        if self.use_gbl and not self.gbl_seen and self.last_probe == 'tcp':
+            return 0, 'gbl'
+        if self.last_probe == 'down':
+            return 0, 'tcp'
+        return min(interval, max(0.0, self.max_secs - self.elapsed())), 'tcp'
+
+    def report(self, probe, ok):
+        now = self.elapsed()
+        self.last_probe = probe
+        if self.phase == 'down':
+            if not ok:
+                self.phase, self.down_at, self.down_confirmed = 'boot', now, True
+                log.debug(f"device down after {now:.1f}s")
+            elif now >= self.down_timeout:
+                # reboot was too fast to be seen or did not happen, fall through to the up check
+                self.phase, self.down_at = 'boot', now
+                self.last_probe = 'down'
+                log.debug(f"device not seen going down within {self.down_timeout}s")
+        elif self.phase == 'boot':
+            if probe == 'gbl' and ok:
+                self.gbl_seen = True
+            elif probe == 'tcp' and ok:
+                self.phase = 'http'
+        elif self.phase == 'http' and ok:
+            self.phase, self.up_at = 'up', now
+
+        if not self.finished and now >= self.max_secs:
+            self.phase = 'failed'
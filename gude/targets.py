@@ -0,0 +1,182 @@
+import bisect
+import heapq
+import ipaddress
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
+
+
+def _ipv4_int(host):
+    """host as int if it is an IPv4 address string, None otherwise."""
+    try:
+        return int(ipaddress.IPv4Address(host))
+    except ValueError:
+        return None
+
+
+def _split_port(target):
+    """(host, port) of 'host:port' targets, (target, None) otherwise (IPv6 addresses included)."""
+    if target.count(':') == 1:
+        host, port = target.split(':')
+        return host, port
+    return target, None
+
+
+class TargetSet(object):
+    """
+    Targets of a run (IPv4 addresses, 'host:port' and hostnames), deduplicated without expanding ranges.
+
+    IPv4 ranges are kept as (first, last) integer intervals and single IPv4 addresses as ints,
+    strings are only created while iterating. A bare address or hostname is dropped if a
+    'host:port' variant of it was added. Iteration yields ranked addresses first (rank, address),
+    then IPv4 addresses in numeric order, then the other targets sorted; it can be repeated.
+    """
+
+    def __init__(self):
+        self.intervals = []  # (first, last) int, inclusive
+        self.singles = set()  # int
+        self.ports = {}  # int -> set of 'a.b.c.d:port' targets
+        self.names = {}  # hostname (or IPv6 address) -> set of targets
+        self.ranks = {}  # int -> rank, ranked addresses come first
+        self._merged = None
+        self._len = None
+
+    def _changed(self):
+        self._merged = None
+        self._len = None
+
+    def add(self, target):
+        target = str(target).strip()
+        host, port = _split_port(target)
+        value = _ipv4_int(host)
+        if value is None:
+            self.names.setdefault(host, set()).add(target)
+        else:
+            self.singles.add(value)
+            if port is not None:
+                self.ports.setdefault(value, set()).add(target)
+        self._changed()
+
+    def update(self, targets):
+        for target in targets:
+            self.add(target)
+
+    def add_network(self, network):
+        """Host addresses of network (as ipaddress.ip_network().hosts()), IPv6 networks are expanded."""
+        if network.version != 4:
+            self.update(str(host) for host in network.hosts())
+            return
+        first, last = int(network.network_address), int(network.broadcast_address)
+        if network.num_addresses > 2:
+            first, last = first + 1, last - 1
+        self.intervals.append((first, last))
+        self._changed()
+
+    def rank(self, host, rank):
+        value = _ipv4_int(host)
+        if value is not None:
+            self.ranks[value] = min(rank, self.ranks.get(value, rank))
+
+    def _merged_intervals(self):
+        if self._merged is None:
+            merged = []
+            for first, last in sorted(self.intervals):
+                if merged and first <= merged[-1][1] + 1:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+                else:
+                    merged.append((first, last))
+            self._merged = merged
+        return self._merged
+
+    def _in_intervals(self, value):
+        merged = self._merged_intervals()
+        pos = bisect.bisect_right(merged, (value, float('inf'))) - 1
+        return pos >= 0 and merged[pos][0] <= value <= merged[pos][1]
+
+    def __contains__(self, target):
+        host, port = _split_port(str(target))
+        value = _ipv4_int(host)
+        if value is None:
+            return str(target) in self.names.get(host, ())
+        if port is not None:
+            return str(target) in self.ports.get(value, ())
+        return value not in self.ports and (value in self.singles or self._in_intervals(value))
+
+    def _addresses(self):
+        """IPv4 addresses as ints, ascending and unique."""
+        ranges = (range(first, last + 1) for first, last in self._merged_intervals())
+        previous = None
+        for value in heapq.merge(*ranges, sorted(self.singles)):
+            if value != previous:
+                previous = value
+                yield value
+
+    def _address_targets(self, value):
+        if value in self.ports:
+            return sorted(self.ports[value])
+        return [str(ipaddress.IPv4Address(value))]
+
+    def __iter__(self):
+        ranked = sorted((rank, value) for value, rank in self.ranks.items()
+                        if value in self.singles or self._in_intervals(value))
+        for _, value in ranked:
+            yield from self._address_targets(value)
+        for value in self._addresses():
+            if value not in self.ranks:
+                yield from self._address_targets(value)
+        for host in sorted(self.names):
+            variants = self.names[host]
+            with_port = sorted(target for target in variants if target != host)
+            # the bare hostname is covered by its explicit host:port entries
+            yield from with_port if with_port else [host]
+
+    def __len__(self):
+        # counted from the interval bounds, the singles and the names, ranges are not expanded
+        if self._len is None:
+            count = sum(last - first + 1 for first, last in self._merged_intervals())
+            count += sum(1 for value in self.singles if not self._in_intervals(value))
+            count += sum(len(variants) - 1 for variants in self.ports.values())
+            for host, variants in self.names.items():
+                with_port = len(variants) - (host in variants)
+                count += with_port if with_port else 1
+            self._len = count
+        return self._len
+
+    def __bool__(self):
+        return bool(self.intervals or self.singles or self.names)
+
+
+def _alias_preference(target):
+    """Plain IPv4 addresses before hostnames before 'host:port' (port forwards)."""
+    host, port = _split_port(target)
+    if port is not None:
+        return 2
+    return 0 if _ipv4_int(host) is not None else 1
+
+
+def collapse_aliases(targets, macs):
+    """
+    One target per device: targets with the same MAC in macs (target -> MAC) are aliases.
+
+    Returns (kept, aliases): kept are the targets in their order, without the aliases, and
+    aliases maps each dropped target to the one kept for its MAC. Targets without MAC are kept.
+    """
+    canonical = {}
+    for target in targets:
+        mac = macs.get(target)
+        if mac is None:
+            continue
+        current = canonical.get(mac)
+        if current is None or _alias_preference(target) < _alias_preference(current):
+            canonical[mac] = target
+    kept = []
+    aliases = {}
+    for target in targets:
+        mac = macs.get(target)
+        if mac is None or canonical[mac] == target:
+            kept.append(target)
+        else:
+            aliases[target] = canonical[mac]
+    return kept, aliases
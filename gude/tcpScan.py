@@ -0,0 +1,69 @@
+import asyncio
+
+import logging
+# logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+log = logging.getLogger(__name__)  # custom logger name can be set
+log.setLevel(logging.getLevelName('INFO'))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_TIMEOUT = 1.0
+DEFAULT_CONCURRENCY = 2048
+RESERVED_FDS = 128  # file descriptors left for everything else while scanning
+
+
+#
+# TCP pre-scan: non-blocking connects to many (host, port) targets at once, to sort out
+# empty addresses of host ranges before devices are processed one by one.
+#
+def connect_budget(concurrency=DEFAULT_CONCURRENCY):
+    """concurrency limited by the process' open file limit (where it is known)."""
+    if resource is None:
+        return concurrency
+    try:
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (OSError, ValueError):
+        return concurrency
+    if soft == resource.RLIM_INFINITY:
+        return concurrency
+    return max(1, min(concurrency, soft - RESERVED_FDS))
+
+
+async def _connects(host, port, timeout):
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def scan_async(targets, timeout=DEFAULT_TIMEOUT, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Targets (host, port) accepting a TCP connection within timeout, in the given order.
+    targets may be a generator, concurrency workers take them one by one.
+    """
+    pending = enumerate(targets)
+    answered = []
+
+    async def worker():
+        for index, (host, port) in pending:
+            if await _connects(host, port, timeout):
+                answered.append((index, (host, port)))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return [target for _, target in sorted(answered)]
+
+
+def tcp_prescan(targets, timeout=DEFAULT_TIMEOUT, concurrency=DEFAULT_CONCURRENCY):
+    """Blocking wrapper of scan_async, runs its own event loop."""
+    concurrency = connect_budget(concurrency)
+    log.debug(f"TCP pre-scan, {concurrency} connects in flight")
+    return asyncio.run(scan_async(targets, timeout, concurrency))
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from gude.asyncHttpDevice import AsyncHttpDevice, iterate_async, run_bounded
+from gude.deployScheduler import GroupSlots
+from gude.httpDevice import HttpDevice
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = json.dumps({"path": self.path, "port": self.client_address[1]}).encode()
+        self.send_response(401 if self.path.startswith('/locked') else 200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class AsyncHttpDeviceTests(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_json_requests_share_keep_alive_connection(self):
+        async def run():
+            dev = AsyncHttpDevice('127.0.0.1')
+            dev.set_http_port(self.server.server_address[1], False)
+            try:
+                first = await dev.http_get_status_json(0x10)
+                second = await dev.http_get_config_json(0x100)
+            finally:
+                await dev.close()
+            return first, second
+
+        first, second = asyncio.run(run())
+        self.assertEqual(first["path"], "/status.json?components=16")
+        self.assertEqual(second["path"], "/config.json?components=256")
+        self.assertEqual(first["port"], second["port"])
+
+    def test_errors_match_sync_client(self):
+        port = self.server.server_address[1]
+        sync_dev = HttpDevice('127.0.0.1')
+        sync_dev.set_http_port(port, False)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            sync_dev.http_get('locked.json')
+
+        async def run():
+            dev = AsyncHttpDevice('127.0.0.1')
+            dev.set_http_port(port, False)
+            try:
+                await dev.http_get('locked.json')
+            finally:
+                await dev.close()
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            asyncio.run(run())
+
+    def test_run_bounded_limits_concurrency(self):
+        active = []
+        peak = []
+
+        async def job(key):
+            active.append(key)
+            peak.append(len(active))
+            await asyncio.sleep(0.01)
+            active.remove(key)
+            return key
+
+        results = asyncio.run(run_bounded(range(6), job, 2))
+        self.assertEqual(sorted(results), list(range(6)))
+        self.assertEqual(max(peak), 2)
+
+    def test_run_bounded_takes_keys_lazily(self):
+        taken = []
+        started = []
+
+        def keys():
+            for key in range(100):
+                taken.append(key)
+                yield key
+
+        async def job(key):
+            started.append(len(taken))
+            await asyncio.sleep(0)
+            return key
+
+        results = asyncio.run(run_bounded(keys(), job, 2))
+        self.assertEqual(sorted(results), list(range(100)))
+        self.assertLessEqual(started[0], 2)
+
+    def test_run_bounded_takes_keys_of_a_blocking_generator_in_the_executor(self):
+        def keys():
+            for key in range(10):
+                time.sleep(0.001)
+                yield key
+
+        async def job(key):
+            await asyncio.sleep(0)
+            return key
+
+        async def run():
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                return await run_bounded(iterate_async(keys(), pool), job, 3)
+
+        self.assertEqual(sorted(asyncio.run(run())), list(range(10)))
+
+    def test_run_bounded_starts_other_groups_while_one_is_full(self):
+        order = []
+
+        async def job(key):
+            order.append(key)
+            await asyncio.sleep(0.01)
+            return key
+
+        slots = GroupSlots(1)
+        results = asyncio.run(run_bounded(['a1', 'a2', 'b1'], job, 2, group_of=lambda key: key[0], group_slots=slots))
+        self.assertEqual(sorted(results), ['a1', 'a2', 'b1'])
+        self.assertEqual(order[:2], ['a1', 'b1'])
+        self.assertEqual(slots.used.get('a', 0), 0)
+
+    def test_run_bounded_holds_back_few_keys_of_a_full_group(self):
+        taken = []
+
+        def keys():
+            for i in range(50):
+                taken.append(i)
+                yield f"a{i}"
+
+        async def job(key):
+            await asyncio.sleep(0.005)
+            return len(taken)
+
+        slots = GroupSlots(1)
+        results = asyncio.run(run_bounded(keys(), job, 2, group_of=lambda key: key[0], group_slots=slots))
+        self.assertEqual(len(results), 50)
+        # the first device finished while only the deferral bound had been taken from the iterable
+        self.assertLessEqual(min(results), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
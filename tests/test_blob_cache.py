@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+from gude.blobCache import FirmwareBlobCache
+
+
+class FirmwareBlobCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write_file(self, name, data):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as fp:
+            fp.write(data)
+        return path
+
+    def test_concurrent_acquires_share_one_readonly_copy(self):
+        path = self.write_file("firmware-test_v1.0.0.bin", b"\x01\x02\x03" * 100)
+        cache = FirmwareBlobCache()
+        key1, view1 = cache.acquire(path)
+        key2, view2 = cache.acquire(path)
+        self.assertEqual(key1, key2)
+        self.assertIs(view1.obj, view2.obj)
+        self.assertTrue(view1.readonly)
+        self.assertEqual(bytes(view2[:3]), b"\x01\x02\x03")
+        self.assertEqual(len(cache), 1)
+
+    def test_unreferenced_blobs_are_evicted_lru(self):
+        cache = FirmwareBlobCache(max_idle=1)
+        keys = []
+        for i in range(3):
+            key, view = cache.acquire(self.write_file(f"fw{i}.bin", bytes([i]) * 10))
+            view.release()
+            keys.append(key)
+        key_in_use, _ = cache.acquire(self.write_file("fw_in_use.bin", b"x"))
+        for key in keys:
+            cache.release(key)
+        self.assertEqual(len(cache), 2)  # the blob in use plus one idle blob
+        cache.release(key_in_use)
+        self.assertEqual(len(cache), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+
+from gude.deadHosts import DeadHosts
+
+
+class DeadHostsTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'deadhosts.json')
+        self.now = 1000.0
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def clock(self):
+        return self.now
+
+    def test_back_off_doubles_up_to_max_ttl(self):
+        dead = DeadHosts(self.path, ttl=10, max_ttl=30, clock=self.clock)
+        retries = []
+        for _ in range(4):
+            dead.failed('10.0.0.5', 80)
+            retries.append(dead.retry_at('10.0.0.5', 80) - self.now)
+        self.assertEqual(retries, [10, 20, 30, 30])
+        self.assertTrue(dead.is_dead('10.0.0.5', 80))
+        self.assertFalse(dead.is_dead('10.0.0.5', 443))
+        self.now += 31
+        self.assertFalse(dead.is_dead('10.0.0.5', 80))
+
+    def test_persisted_until_target_answers(self):
+        dead = DeadHosts(self.path, ttl=10, clock=self.clock)
+        dead.failed('10.0.0.5', 80)
+        dead.save()
+        reloaded = DeadHosts.load(self.path, ttl=10, clock=self.clock)
+        self.assertTrue(reloaded.is_dead('10.0.0.5', 80))
+        reloaded.alive('10.0.0.5', 80)
+        reloaded.save()
+        self.assertFalse(DeadHosts.load(self.path, clock=self.clock).is_dead('10.0.0.5', 80))
+
+
+if __name__ == '__main__':
+    unittest.main()
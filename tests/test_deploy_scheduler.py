@@ -0,0 +1,120 @@
+import asyncio
+import time
+import unittest
+
+from gude.deployScheduler import DeploymentScheduler, GroupSlots, Sleep, run_steps, run_steps_async
+
+
+def sleeping_steps(name, secs, log=None):
+    if log is not None:
+        log.append(("start", name))
+    yield Sleep(secs)
+    if log is not None:
+        log.append(("end", name))
+    return name.upper()
+
+
+class DeploymentSchedulerTests(unittest.TestCase):
+    def test_run_steps_returns_generator_result(self):
+        self.assertEqual(run_steps(sleeping_steps("dev", 0)), "DEV")
+
+    def test_run_steps_async_returns_generator_result(self):
+        self.assertEqual(asyncio.run(run_steps_async(sleeping_steps("dev", 0.01))), "DEV")
+
+    def test_run_steps_async_sleeps_on_the_loop(self):
+        async def run():
+            return await asyncio.gather(*(run_steps_async(sleeping_steps(f"dev{i}", 0.2)) for i in range(20)))
+
+        start = time.monotonic()
+        results = asyncio.run(run())
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(results[7], "DEV7")
+
+    def test_sleeping_jobs_do_not_hold_workers(self):
+        scheduler = DeploymentScheduler(workers=2)
+        for i in range(20):
+            scheduler.submit(f"dev{i}", lambda i=i: sleeping_steps(f"dev{i}", 0.2))
+        start = time.monotonic()
+        results = scheduler.run()
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(results["dev7"], "DEV7")
+        self.assertEqual(len(results), 20)
+
+    def test_max_active_limits_devices_in_flight(self):
+        log = []
+        scheduler = DeploymentScheduler(workers=4, max_active=2)
+        for i in range(4):
+            scheduler.submit(i, lambda i=i: sleeping_steps(str(i), 0.05, log))
+        scheduler.run()
+        in_flight = 0
+        for event, _ in log:
+            in_flight += 1 if event == "start" else -1
+            self.assertLessEqual(in_flight, 2)
+
+    def test_run_takes_jobs_as_devices_finish(self):
+        taken = []
+        taken_at_start = []
+
+        def steps(i):
+            taken_at_start.append(len(taken))
+            yield Sleep(0.01)
+            return i
+
+        def jobs():
+            for i in range(50):
+                taken.append(i)
+                yield i, lambda i=i: steps(i), None
+
+        results = DeploymentScheduler(workers=2, max_active=2).run(jobs())
+        self.assertEqual(sorted(results), list(range(50)))
+        # the active and the waiting jobs, plus the one being handed over
+        self.assertLessEqual(max(n - k for k, n in enumerate(taken_at_start)), 2 * 2 + 1)
+
+    def test_failing_job_is_reported_via_on_error(self):
+        def failing_steps():
+            yield Sleep(0)
+            raise ValueError("boom")
+
+        scheduler = DeploymentScheduler(workers=1, on_error=lambda key, e: f"{key}: {e}")
+        scheduler.submit("dev", failing_steps)
+        self.assertEqual(scheduler.run(), {"dev": "dev: boom"})
+
+    def test_raising_on_error_still_finishes_the_job(self):
+        def failing_steps():
+            yield Sleep(0)
+            raise ValueError("boom")
+
+        def on_error(key, e):
+            raise RuntimeError("callback failed")
+
+        scheduler = DeploymentScheduler(workers=1, on_error=on_error)
+        scheduler.submit("dev", failing_steps)
+        scheduler.submit("other", lambda: sleeping_steps("other", 0))
+        results = scheduler.run()
+        self.assertIsInstance(results["dev"], ValueError)
+        self.assertEqual(results["other"], "OTHER")
+
+    def test_full_group_leaves_slots_to_other_groups(self):
+        log = []
+        scheduler = DeploymentScheduler(workers=2, max_active=2, group_slots=GroupSlots(1))
+        for key, group in (("a1", "gw-a"), ("a2", "gw-a"), ("b1", "gw-b")):
+            scheduler.submit(key, lambda key=key: sleeping_steps(key, 0.05, log), group=group)
+        scheduler.run()
+        self.assertEqual(sorted(log[:2]), [("start", "a1"), ("start", "b1")])
+        self.assertLess(log.index(("end", "a1")), log.index(("start", "a2")))
+
+
+class GroupSlotsTests(unittest.TestCase):
+    def test_limits_per_group(self):
+        slots = GroupSlots(lambda group: 2 if group == "gw" else 0)
+        self.assertTrue(slots.try_acquire("gw"))
+        self.assertTrue(slots.try_acquire("gw"))
+        self.assertFalse(slots.try_acquire("gw"))
+        self.assertTrue(all(slots.try_acquire("lan") for _ in range(10)))
+        slots.release("gw")
+        self.assertEqual(run_steps(slots.acquire_steps("gw")), None)
+        self.assertFalse(slots.try_acquire("gw"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import asyncio
+import socket
+import threading
+import unittest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+from gude.dnsCache import DnsCache, dns_cache
+from gude.httpSession import get_shared_session, session_key, close_shared_sessions
+
+
+class CountingDnsCache(DnsCache):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lookups = 0
+
+    def _lookup(self, host):
+        self.lookups += 1
+        return [(socket.AF_INET, '192.0.2.10')]
+
+    async def _lookup_async(self, host):
+        return self._lookup(host)
+
+
+class DnsCacheTests(unittest.TestCase):
+    def test_entries_expire_after_ttl(self):
+        now = [0.0]
+        cache = CountingDnsCache(ttl=300, clock=lambda: now[0])
+        self.assertEqual(cache.resolve('pdu.example'), '192.0.2.10')
+        self.assertEqual(cache.resolve('PDU.example'), '192.0.2.10')
+        self.assertEqual(cache.lookups, 1)
+        now[0] = 301
+        cache.resolve('pdu.example')
+        self.assertEqual(cache.lookups, 2)
+        self.assertEqual(cache.resolve('10.0.0.1'), '10.0.0.1')
+
+    def test_prefetch_pins_names_and_failures(self):
+        cache = DnsCache()
+        failed = cache.prefetch(['localhost', 'nosuchhost.invalid', '10.0.0.1'])
+        self.assertEqual(list(failed), ['nosuchhost.invalid'])
+        self.assertIsNone(cache.entries['localhost'][0])
+        with self.assertRaises(socket.gaierror):
+            cache.resolve('nosuchhost.invalid')
+        cache.unpin(['localhost', 'nosuchhost.invalid', '10.0.0.1'])
+        self.assertEqual(cache.entries, {})
+
+    def test_unpin_keeps_names_of_other_runs(self):
+        cache = CountingDnsCache()
+        cache.prefetch(['pdu-a.example', 'pdu-b.example'])
+        cache.prefetch(['pdu-b.example', 'pdu-c.example'])
+        self.assertEqual(cache.lookups, 3)
+        cache.unpin(['pdu-a.example', 'pdu-b.example'])
+        self.assertEqual(sorted(cache.entries), ['pdu-b.example', 'pdu-c.example'])
+        self.assertIsNone(cache.entries['pdu-b.example'][0])
+        cache.unpin(['pdu-b.example', 'pdu-c.example'])
+        self.assertEqual(cache.entries, {})
+
+    def test_resolve_async_shares_the_cache(self):
+        cache = DnsCache()
+        address = asyncio.run(cache.resolve_async('localhost'))
+        self.assertIn('localhost', cache.entries)
+        self.assertEqual(cache.resolve('LOCALHOST'), address)
+        with self.assertRaises(socket.gaierror):
+            asyncio.run(cache.resolve_async('nosuchhost.invalid'))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.headers['Host'].encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PinnedSessionTests(unittest.TestCase):
+    def test_session_connects_to_pinned_address(self):
+        server = HTTPServer(('127.0.0.1', 0), _Handler)
+        port = server.server_address[1]
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        dns_cache.entries['pdu-pinned.invalid'] = (None, [(socket.AF_INET, '127.0.0.1')])
+        try:
+            session = get_shared_session(session_key('pdu-pinned.invalid', port, False))
+            r = session.get(f'http://pdu-pinned.invalid:{port}/status.json', timeout=2)
+            self.assertEqual(r.text, f'pdu-pinned.invalid:{port}')
+        finally:
+            close_shared_sessions()
+            dns_cache.entries.pop('pdu-pinned.invalid', None)
+            server.shutdown()
+            server.server_close()
+
+    def test_unresolvable_name_raises_requests_connection_error(self):
+        dns_cache.entries['pdu-missing.invalid'] = (None, socket.gaierror('not found'))
+        try:
+            session = get_shared_session(session_key('pdu-missing.invalid', 80, False))
+            with self.assertRaises(requests.ConnectionError):
+                session.get('http://pdu-missing.invalid/status.json', timeout=2)
+        finally:
+            close_shared_sessions()
+            dns_cache.entries.pop('pdu-missing.invalid', None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import socket
+import unittest
+from functools import reduce
+
+from gude import gblCodec
+from gude.gblib import Gblib
+
+
+def netconf_reply(size, name=b'Expert Power Control 8045', hostname=b'epc-lab'):
+    layout = gblCodec.NETCONF_LAYOUTS[size]
+    fields = [b'GBL\x04\x01', b'\x00\x19\x32\x00\x00\x07', 0x32, 2, 1, 1, 9, 0,
+              socket.inet_aton('192.168.1.7'), socket.inet_aton('255.255.255.0'), socket.inet_aton('192.168.1.1'),
+              0, 0, 0x80, 0]
+    if size == 37:
+        fields += [0]
+    else:
+        fields += [b'', b'', 0, 0, 0, name, hostname]
+        if size == 133:
+            fields += [0]
+    data = layout.pack(*(fields + [0]))
+    return data[:-1] + bytes([gblCodec.checksum(data[:-1])])
+
+
+class GblCodecTests(unittest.TestCase):
+    def test_checksum_matches_bytewise_xor(self):
+        for size in (0, 1, 5, 37, 133, 1030):
+            data = os.urandom(size)
+            self.assertEqual(gblCodec.checksum(data), reduce(lambda a, b: a ^ b, data, 0))
+
+    def test_encode_netconf_query(self):
+        self.assertEqual(gblCodec.encode(Gblib.GBL_NETCONF), b'\x47\x42\x4c\x04\x01\x4c')
+        frame = gblCodec.decode(gblCodec.encode(Gblib.GBL_FWINFO, b'\x00\x19\x32\x00\x00\x07', b'\x01'))
+        self.assertEqual((frame.cmd, frame.mac, bytes(frame.data), frame.crc_ok),
+                         (Gblib.GBL_FWINFO, b'\x00\x19\x32\x00\x00\x07', b'\x01', True))
+
+    def test_netconf_reply_fields_and_tuple_compatibility(self):
+        for size in (131, 133):
+            dev = gblCodec.parse_netconf(netconf_reply(size))
+            self.assertEqual(dev.product_name, 'Expert Power Control 8045')
+            self.assertEqual(dev.hostname, 'epc-lab')
+            self.assertEqual(dev.ip, '192.168.1.7')
+            self.assertEqual(dev.firmware, [1, 9])
+            self.assertEqual(Gblib.get_device_name(dev), 'Expert Power Control 8045')
+            self.assertEqual(dev[8], socket.inet_aton('192.168.1.7'))
+
+        legacy = gblCodec.parse_netconf(netconf_reply(37))
+        self.assertFalse(legacy.extended)
+        self.assertEqual(Gblib.get_device_name(legacy), 'ExpertPowerControl 8x')
+        self.assertEqual(Gblib.netconf_info(netconf_reply(37))['allow_go_boot'], 0x80)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import socket
+import threading
+import unittest
+
+from gude import gblCodec
+from gude.deployScheduler import run_steps
+from gude.gblEntities import EntityLayout, GblEntityTransfer
+from gude.gblib import Gblib
+from gude.httpDevice import HttpDevice
+
+MAC = b'\x00\x19\x32\x01\x02\x03'
+
+
+class FakeEntityStore(object):
+    """Answers READENT / WRITENT on 127.0.0.2, the first write of entity 7 reports an error."""
+
+    def __init__(self, entities):
+        self.entities = dict(entities)
+        self.writes = {}
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.2', 50123))
+        self.sock.settimeout(0.05)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.sock.close()
+
+    def serve(self):
+        header = EntityLayout.HEADER
+        while not self.stopped.is_set():
+            try:
+                data, addr = self.sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            frame = gblCodec.decode(data)
+            entity_id, = header.unpack_from(frame.data)
+            if frame.cmd == Gblib.GBL_WRITENT:
+                self.writes[entity_id] = self.writes.get(entity_id, 0) + 1
+                if entity_id == 7 and self.writes[entity_id] == 1:
+                    payload = b'\x01'
+                else:
+                    self.entities[entity_id] = bytes(frame.data[header.size:])
+                    payload = b'\x00'
+            elif entity_id in self.entities:
+                payload = b'\x00' + self.entities[entity_id]
+            else:
+                payload = b'\x01'
+            self.sock.sendto(gblCodec.encode(frame.cmd, MAC, header.pack(entity_id) + payload), addr)
+
+
+class GblEntityTransferTests(unittest.TestCase):
+    def setUp(self):
+        try:
+            self.device = FakeEntityStore({3: b'\x0a\x0b', 14: b'\x01', 36: b'\x11\x22\x33'})
+        except OSError as e:
+            self.skipTest(f"cannot bind GBL port on 127.0.0.2: {e}")
+
+    def tearDown(self):
+        self.device.close()
+
+    def test_reads_present_entities_and_removes_volatiles(self):
+        transfer = GblEntityTransfer('127.0.0.2', MAC, window=16, rto=0.05)
+        entities = run_steps(transfer.read_all_steps(range(40)))
+        self.assertEqual(entities, [{"id": 3, "data": "0A0B"}, {"id": 14, "data": "01"}, {"id": 36, "data": "112233"}])
+        self.assertEqual([e["id"] for e in HttpDevice.remove_volatile_entities(entities)], [3, 36])
+
+    def test_clone_resends_entities_answered_with_error(self):
+        entities = [{"id": 3, "data": "0c0d"}, {"id": 7, "data": "FF"}]
+        stats = run_steps(GblEntityTransfer('127.0.0.2', MAC, rto=0.05).clone_steps(entities))
+        self.assertEqual(stats["entities"], 2)
+        self.assertEqual(self.device.entities[3], b'\x0c\x0d')
+        self.assertEqual(self.device.entities[7], b'\xff')
+        self.assertEqual(self.device.writes[7], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import socket
+import threading
+import unittest
+
+from gude import gblCodec
+from gude.deployScheduler import run_steps
+from gude.gblFlash import GblFlasher, PartitionPageLayout
+from gude.gblWindow import GblTransferError
+from gude.gblib import Gblib
+
+MAC = b'\x00\x19\x32\x01\x02\x03'
+
+
+class FakeBootloader(object):
+    """Answers WRPART / RDPART on 127.0.0.2, drops the first write of page 1 and corrupts page 2 once."""
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.flash = {}
+        self.writes = {}
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.2', 50123))
+        self.sock.settimeout(0.05)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.sock.close()
+
+    def serve(self):
+        header = self.layout.HEADER
+        while not self.stopped.is_set():
+            try:
+                data, addr = self.sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            frame = gblCodec.decode(data)
+            partition, page = header.unpack_from(frame.data)
+            if frame.cmd == Gblib.GBL_WRPART:
+                self.writes[page] = self.writes.get(page, 0) + 1
+                if page == 1 and self.writes[page] == 1:
+                    continue
+                content = bytes(frame.data[header.size:])
+                if page == 2 and self.writes[page] == 1:
+                    content = b'\x00' * len(content)
+                self.flash[page] = content
+                payload = b'\x00'
+            else:
+                payload = self.flash.get(page, b'')
+            self.sock.sendto(gblCodec.encode(frame.cmd, MAC, header.pack(partition, page) + payload), addr)
+
+
+class GblFlasherTests(unittest.TestCase):
+    def setUp(self):
+        self.layout = PartitionPageLayout(page_size=16)
+        try:
+            self.device = FakeBootloader(self.layout)
+        except OSError as e:
+            self.skipTest(f"cannot bind GBL port on 127.0.0.2: {e}")
+
+    def tearDown(self):
+        self.device.close()
+
+    def test_retransmits_and_rewrites_mismatching_pages(self):
+        image = bytes(range(100))
+        progress = []
+        flasher = GblFlasher('127.0.0.2', MAC, layout=self.layout, window=3, rto=0.05)
+        stats = run_steps(flasher.flash_steps(image, lambda sent, total: progress.append((sent, total))))
+
+        self.assertEqual(stats['pages'], 7)
+        self.assertGreaterEqual(stats['retransmits'], 1)
+        self.assertEqual(b''.join(self.device.flash[p] for p in range(7)), image + b'\xff' * 12)
+        self.assertEqual(self.device.writes[2], 2)
+        self.assertEqual(progress[-1], (100, 100))
+
+    def test_gives_up_without_replies(self):
+        flasher = GblFlasher('127.0.0.2', b'\x00\x19\x32\xff\xff\xff', layout=self.layout, rto=0.02, retries=2)
+        with self.assertRaises(GblTransferError):
+            run_steps(flasher.flash_steps(b'\x01' * 20))
+
+
+if __name__ == '__main__':
+    unittest.main()
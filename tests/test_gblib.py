@@ -0,0 +1,116 @@
+import socket
+import threading
+import time
+import unittest
+
+from gude.gblib import GblDiscovery, Gblib
+
+
+def netconf_reply(mac, bootl_mode=0, firmware=(1, 9)):
+    data = bytearray(b'GBL\x04' + Gblib.GBL_NETCONF + mac + b'\x00\x32' + bytes([2, 1]) + bytes(firmware))
+    data += bytes([bootl_mode])
+    data += b'\x00' * (36 - len(data))
+    data.append(Gblib.gbl_checksum(data))
+    return bytes(data)
+
+
+class GblBatchTests(unittest.TestCase):
+    def setUp(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.sock.bind(('127.0.0.2', 50123))
+        except OSError as e:
+            self.sock.close()
+            self.skipTest(f"cannot bind GBL port on 127.0.0.2: {e}")
+        threading.Thread(target=self.answer, daemon=True).start()
+
+    def tearDown(self):
+        self.sock.close()
+
+    def answer(self):
+        try:
+            query, addr = self.sock.recvfrom(64)
+            if query[4:5] == Gblib.GBL_NETCONF:
+                self.sock.sendto(netconf_reply(b'\x00\x19\x32\x01\x02\x03', bootl_mode=1), addr)
+        except OSError:
+            pass
+
+    def test_collects_replies_by_source_address(self):
+        found = Gblib.netconf_batch(['127.0.0.2', '127.0.0.3'], timeout=0.5)
+        self.assertEqual(list(found), ['127.0.0.2'])
+        info = found['127.0.0.2']
+        self.assertEqual(info['mac'], b'\x00\x19\x32\x01\x02\x03')
+        self.assertEqual(info['bootl_mode'], 1)
+        self.assertEqual(info['firmware'], [1, 9])
+
+
+class LegacyHostnameTests(unittest.TestCase):
+    def setUp(self):
+        self.socks = []
+        self.queries = []
+        for addr, mac in (('127.0.0.2', b'\x00\x19\x32\x00\x00\x01'), ('127.0.0.3', b'\x00\x19\x32\x00\x00\x02')):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.bind((addr, 50123))
+            except OSError as e:
+                sock.close()
+                self.tearDown()
+                self.skipTest(f"cannot bind GBL port on {addr}: {e}")
+            self.socks.append(sock)
+            threading.Thread(target=self.answer, args=(sock, mac), daemon=True).start()
+        Gblib.fwinfo_cache.clear()
+
+    def tearDown(self):
+        for sock in self.socks:
+            sock.close()
+        Gblib.fwinfo_cache.clear()
+
+    def answer(self, sock, mac):
+        try:
+            query, addr = sock.recvfrom(64)
+            self.queries.append(query)
+            if query[4:5] == Gblib.GBL_FWINFO and query[5:11] == mac:
+                reply = bytearray(b'GBL\x04' + Gblib.GBL_FWINFO + mac + b'\x00\x00' + f'host-{mac[-1]}'.encode() + b'\0\0')
+                reply.append(Gblib.gbl_checksum(reply))
+                sock.sendto(bytes(reply), addr)
+        except OSError:
+            pass
+
+    def test_queries_legacy_devices_at_once_and_caches_by_mac(self):
+        devs = [(b'', b'\x00\x19\x32\x00\x00\x01', 0x32, 1, 0, 1, 9, 0, socket.inet_aton('127.0.0.2')),
+                (b'', b'\x00\x19\x32\x00\x00\x02', 0x32, 1, 0, 1, 9, 0, socket.inet_aton('127.0.0.3'))]
+        start = time.monotonic()
+        hostnames = Gblib.legacy_hostnames(devs, timeout=1.0)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(hostnames, {devs[0][1]: 'host-1', devs[1][1]: 'host-2'})
+
+        self.assertEqual(Gblib.get_dev_info(devs[0])['hostname'], 'host-1')
+        self.assertEqual(len(self.queries), 2)
+
+
+class GblDiscoveryTests(unittest.TestCase):
+    def test_dedups_by_mac_and_stops_when_quiet(self):
+        replies = [netconf_reply(b'\x00\x19\x32\x00\x00\x01'), netconf_reply(b'\x00\x19\x32\x00\x00\x01'),
+                   netconf_reply(b'\x00\x19\x32\x00\x00\x02')]
+        discovery = GblDiscovery('127.0.0.1', timeout=5.0, quiet=0.2, rebroadcast=0)
+        discovery.broadcast = lambda s, dest=None: [s.sendto(r, s.getsockname()) for r in replies]
+
+        start = time.monotonic()
+        macs = [dev[1] for dev in discovery]
+        self.assertEqual(macs, [b'\x00\x19\x32\x00\x00\x01', b'\x00\x19\x32\x00\x00\x02'])
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_waits_full_timeout_for_first_reply(self):
+        reply = netconf_reply(b'\x00\x19\x32\x00\x00\x03')
+        discovery = GblDiscovery('127.0.0.1', timeout=1.0, quiet=0.2, rebroadcast=0)
+
+        def delayed_broadcast(s, dest=None):
+            timer = threading.Timer(0.5, lambda: s.sendto(reply, s.getsockname()))
+            timer.start()
+
+        discovery.broadcast = delayed_broadcast
+        self.assertEqual([dev[1] for dev in discovery], [b'\x00\x19\x32\x00\x00\x03'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import socket
+import unittest
+from configparser import ConfigParser
+from unittest import mock
+
+import upload
+from gude.gblCodec import NetconfReply
+from gude.targets import TargetSet
+
+
+def extended_reply(mac, ip, hostname):
+    fields = [0] * 22
+    fields[1] = mac
+    fields[8] = socket.inet_aton(ip)
+    fields[20] = b'Expert Power Control\0'
+    fields[21] = hostname.encode() + b'\0'
+    return NetconfReply(tuple(fields))
+
+
+class FakeDiscovery(object):
+    replies = []
+    targets = None
+
+    def __init__(self, myip='0.0.0.0', timeout=1.0, targets=None):
+        FakeDiscovery.targets = targets
+
+    def __iter__(self):
+        return iter(self.replies)
+
+    @staticmethod
+    def interface_targets(myip='0.0.0.0'):
+        return [('0.0.0.0', '<broadcast>')]
+
+    @staticmethod
+    def directed_target(network, myip='0.0.0.0'):
+        return (myip, '192.0.2.255')
+
+
+class GenerateIpListTests(unittest.TestCase):
+    def config(self, **hosts):
+        config = ConfigParser()
+        config.read_dict(upload.DEFAULT_SETTINGS)
+        config['defaults']['tcpPrescan'] = '0'
+        config['defaults']['deadCache'] = ''
+        config.read_dict({'hosts': hosts})
+        return config
+
+    def test_gbl_search_returns_target_set(self):
+        FakeDiscovery.replies = [extended_reply(b'\x00\x19\x32\x00\x00\x01', '192.0.2.20', 'pdu-1')]
+        discovered = {}
+        with mock.patch.object(upload, 'GblDiscovery', FakeDiscovery):
+            targets = upload.generate_ip_list(self.config(gbl='search', ip1='192.0.2.5'), '', 0.1,
+                                              discovered=discovered)
+        self.assertIsInstance(targets, TargetSet)
+        self.assertEqual(list(targets), ['192.0.2.5', '192.0.2.20'])
+        self.assertEqual(FakeDiscovery.targets, [('0.0.0.0', '<broadcast>')])
+        self.assertEqual(discovered['192.0.2.20']['mac'], b'\x00\x19\x32\x00\x00\x01')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from gude import httpSession
+from gude.httpSession import session_key, get_shared_session, drop_connections, close_shared_sessions
+
+
+class SharedSessionTests(unittest.TestCase):
+    def tearDown(self):
+        close_shared_sessions()
+
+    def test_same_endpoint_and_credentials_share_a_session(self):
+        first = get_shared_session(session_key('PDU-1.example', 80, False, True, 'admin', 'secret'))
+        second = get_shared_session(session_key('pdu-1.example', '80', 0, True, 'admin', 'secret'))
+        self.assertIs(first, second)
+        self.assertFalse(first.verify)
+
+    def test_port_ssl_and_auth_get_their_own_session(self):
+        base = get_shared_session(session_key('pdu-1.example', 80, False))
+        others = [get_shared_session(session_key('pdu-1.example', 8080, False)),
+                  get_shared_session(session_key('pdu-1.example', 80, True)),
+                  get_shared_session(session_key('pdu-1.example', 80, False, True, 'admin', 'secret')),
+                  get_shared_session(session_key('pdu-1.example', 80, False, True, 'admin', 'other'))]
+        self.assertEqual(len({id(session) for session in [base] + others}), 5)
+        # credentials only count with basic auth enabled
+        self.assertIs(get_shared_session(session_key('pdu-1.example', 80, False, False, 'admin', 'x')), base)
+
+    def test_drop_connections_keeps_the_session(self):
+        key = session_key('pdu-1.example', 80, False)
+        session = get_shared_session(key)
+        closed = []
+        session.close = lambda: closed.append(key)
+        drop_connections(key)
+        drop_connections(session_key('unknown.example', 80, False))
+        self.assertEqual(closed, [key])
+        self.assertIs(get_shared_session(key), session)
+
+    def test_close_shared_sessions_forgets_all(self):
+        key = session_key('pdu-1.example', 80, False)
+        session = get_shared_session(key)
+        closed = []
+        session.close = lambda: closed.append(key)
+        close_shared_sessions()
+        self.assertEqual(closed, [key])
+        self.assertEqual(httpSession._sessions, {})
+        self.assertIsNot(get_shared_session(key), session)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from gude.inventory import DeviceInventory
+
+
+class DeviceInventoryTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'inventory.json')
+        self.now = 1000.0
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def clock(self):
+        return self.now
+
+    def test_records_by_mac_and_survives_reload(self):
+        inventory = DeviceInventory.load(self.path, clock=self.clock)
+        inventory.record('00_19_32_00_00_01', target='10.0.0.5', firmware='1.9.2', prodid='8045')
+        inventory.record(b'\x00\x19\x32\x00\x00\x01', target='10.0.0.6')
+        inventory.record('unknown-mac', target='10.0.0.7')
+        inventory.save()
+
+        reloaded = DeviceInventory.load(self.path, clock=self.clock)
+        self.assertEqual(list(reloaded.devices), ['00:19:32:00:00:01'])
+        entry = reloaded.find('10.0.0.6')
+        self.assertEqual((entry['mac'], entry['firmware'], entry['prodid']), ('00:19:32:00:00:01', '1.9.2', '8045'))
+        self.assertIsNone(reloaded.find('10.0.0.5'))
+
+    def test_entries_get_stale(self):
+        inventory = DeviceInventory(self.path, clock=self.clock)
+        inventory.record('00:19:32:00:00:01', target='10.0.0.5')
+        entry = inventory.get('00:19:32:00:00:01')
+        self.now += 60
+        self.assertTrue(inventory.is_fresh(entry, 900))
+        self.now += 900
+        self.assertFalse(inventory.is_fresh(entry, 900))
+
+    def test_unreadable_file_starts_empty(self):
+        with open(self.path, 'w') as fp:
+            fp.write('{broken')
+        self.assertEqual(DeviceInventory.load(self.path).devices, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import io
+import os
+import tempfile
+import unittest
+
+import requests
+
+from gude.multipartStream import MultipartStream
+
+
+class MultipartStreamTests(unittest.TestCase):
+    def read_all(self, stream, chunk_size=1000):
+        return b"".join(iter(lambda: stream.read(chunk_size), b""))
+
+    def test_body_matches_requests_multipart_encoding(self):
+        data = bytes(range(256)) * 40
+        stream = MultipartStream('fwupload', memoryview(data))
+        body = self.read_all(stream)
+
+        prepared = requests.Request('POST', 'http://device/upl.html', files={'fwupload': data}).prepare()
+        expected = prepared.body
+        boundary = prepared.headers['Content-Type'].split("boundary=")[1]
+        self.assertEqual(body, expected.replace(boundary.encode(), stream.boundary.encode()))
+        self.assertEqual(len(stream), len(body))
+
+    def test_reports_bytes_sent_from_file(self):
+        data = os.urandom(10000)
+        with tempfile.TemporaryFile() as fp:
+            fp.write(data)
+            fp.seek(0)
+            progress = []
+            stream = MultipartStream('fwupload', fp, chunk_size=4096,
+                                     progress_cb=lambda sent, total: progress.append((sent, total)))
+            body = b"".join(stream)
+        self.assertIn(data, body)
+        self.assertEqual(progress[-1], (10000, 10000))
+        self.assertEqual([sent for sent, _ in progress], [4096, 8192, 10000])
+
+    def test_file_data_of_bytes_is_not_copied(self):
+        data = bytearray(b"x" * 5000)
+        stream = MultipartStream('fwupload', data)
+        stream.read(len(stream._head))
+        chunk = stream.read(1000)
+        self.assertIsInstance(chunk, memoryview)
+        data[0:1] = b"y"
+        self.assertEqual(bytes(chunk[:1]), b"y")
+
+    def test_str_data_is_utf8_encoded(self):
+        stream = MultipartStream('fwupload', "port 1 state set 1\n")
+        self.assertIn(b"\r\n\r\nport 1 state set 1\n\r\n--", self.read_all(stream, io.DEFAULT_BUFFER_SIZE))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import ipaddress
+import os
+import tempfile
+import unittest
+
+from gude.neighbors import read_arp_table, parse_ip_neigh, neighbors_in_network
+
+ARP_TABLE = """IP address       HW type     Flags       HW address            Mask     Device
+192.168.1.20     0x1         0x2         aa:bb:cc:00:00:01     *        eth0
+192.168.1.21     0x1         0x0         00:00:00:00:00:00     *        eth0
+192.168.1.30     0x1         0x2         00:19:32:00:00:02     *        eth0
+10.0.0.5         0x1         0x2         00:19:32:00:00:03     *        eth1
+"""
+
+IP_NEIGH = """192.168.1.20 dev eth0 lladdr aa:bb:cc:00:00:01 STALE
+192.168.1.21 dev eth0  FAILED
+192.168.1.30 dev eth0 lladdr 00:19:32:00:00:02 REACHABLE
+"""
+
+
+class NeighborTableTests(unittest.TestCase):
+    def test_arp_table_keeps_completed_entries(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'arp')
+            with open(path, 'w') as fp:
+                fp.write(ARP_TABLE)
+            neighbors = read_arp_table(path)
+            self.assertEqual([ip for ip, _ in neighbors], ['192.168.1.20', '192.168.1.30', '10.0.0.5'])
+            self.assertEqual(read_arp_table(os.path.join(tmpdir, 'missing')), [])
+
+    def test_ip_neigh_output(self):
+        self.assertEqual(parse_ip_neigh(IP_NEIGH), [('192.168.1.20', 'aa:bb:cc:00:00:01'),
+                                                    ('192.168.1.30', '00:19:32:00:00:02')])
+
+    def test_filtered_by_network_gude_first(self):
+        neighbors = parse_ip_neigh(IP_NEIGH) + [('10.0.0.5', '00:19:32:00:00:03')]
+        found = neighbors_in_network(neighbors, ipaddress.ip_network('192.168.1.0/24'))
+        self.assertEqual([ip for ip, _ in found], ['192.168.1.30', '192.168.1.20'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+from unittest import mock
+
+from gude.httpDevice import HttpDevice
+from gude.probes import HTTP_PROBES, ProbeSelector
+
+
+class ProbeSelectorTests(unittest.TestCase):
+    def test_falls_back_and_caches_choice_per_model(self):
+        selector = ProbeSelector()
+        dev = HttpDevice('127.0.0.1')
+        dev.boot_model = '8045'
+        codes = {'head': 405, 'status': 200, 'index': 200}
+        calls = []
+
+        def fake_probe(probe, timeout=1.0, req_headers=None):
+            calls.append(probe.name)
+            return probe.outcome(codes[probe.name])
+
+        dev.http_probe = fake_probe
+        with mock.patch('gude.httpDevice.liveness_probes', selector):
+            self.assertTrue(dev.http_ping())
+            self.assertTrue(dev.http_ping())
+
+        self.assertEqual(calls, ['head', 'status', 'status'])
+        self.assertEqual(selector.chosen(), {'8045': 'status'})
+        self.assertEqual(selector.rtt_summary()['status'][0], 2)
+
+    def test_unsupported_choice_is_dropped(self):
+        selector = ProbeSelector()
+        head = HTTP_PROBES[0]
+        selector.report('8045', head, True)
+        selector.report('8045', head, None)
+        self.assertNotIn(head, selector.candidates('8045'))
+        self.assertEqual(len(selector.candidates('8045')), len(HTTP_PROBES) - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
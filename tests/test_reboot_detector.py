@@ -0,0 +1,55 @@
+import unittest
+
+from gude.rebootDetector import BootPriors, RebootDetector
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def drive(detector, clock, is_up):
+    """Run the detector against is_up(probe, now), return the probes made."""
+    probes = []
+    while not detector.finished:
+        delay, probe = detector.next_probe()
+        clock.now += delay
+        probes.append(probe)
+        detector.report(probe, is_up(probe, clock.now))
+        clock.now += 0.01
+    return probes
+
+
+class RebootDetectorTests(unittest.TestCase):
+    def test_waits_for_down_before_reporting_up(self):
+        clock = FakeClock()
+        detector = RebootDetector(30, expected_boot_secs=5, use_gbl=True, clock=clock)
+        probes = drive(detector, clock, lambda probe, now: now < 1.0 or now > 6.0)
+
+        self.assertEqual(detector.phase, 'up')
+        self.assertTrue(detector.down_confirmed)
+        self.assertGreater(detector.up_at, 6.0)
+        self.assertLess(detector.up_at, 6.5)
+        self.assertIn('gbl', probes)
+        self.assertEqual(probes[-1], 'http')
+
+    def test_gives_up_after_max_secs(self):
+        clock = FakeClock()
+        detector = RebootDetector(10, clock=clock)
+        drive(detector, clock, lambda probe, now: now < 1.0)
+        self.assertEqual(detector.phase, 'failed')
+        self.assertIsNone(detector.boot_secs)
+
+    def test_boot_priors_learn_per_key(self):
+        priors = BootPriors(default_secs=8.0, weight=0.5)
+        priors.observe(('8045', 85), 20.0)
+        priors.observe(('8045', 85), 10.0)
+        self.assertEqual(priors.expected(('8045', 85)), 15.0)
+        self.assertEqual(priors.expected(('8045', 25)), 8.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
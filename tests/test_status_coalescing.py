@@ -0,0 +1,28 @@
+import unittest
+
+from gude.httpDevice import HttpDevice
+
+
+class StatusCoalescingTests(unittest.TestCase):
+    def test_one_request_split_per_consumer(self):
+        dev = HttpDevice('127.0.0.1')
+        requested = []
+
+        def fake_status_json(components, cgi_get_params=None, req_headers=None):
+            requested.append(components)
+            return {"misc": {"firm_v": "1.0"}, "ethernet": {"mac": "00:19:32:00:00:01"}}
+
+        dev.http_get_status_json = fake_status_json
+        misc, ethernet = dev.http_get_status_json_coalesced([HttpDevice.JSON_STATUS_MISC, HttpDevice.JSON_STATUS_ETHERNET])
+
+        self.assertEqual(requested, [HttpDevice.JSON_STATUS_MISC | HttpDevice.JSON_STATUS_ETHERNET])
+        self.assertEqual(misc, {"misc": {"firm_v": "1.0"}})
+        self.assertEqual(ethernet, {"ethernet": {"mac": "00:19:32:00:00:01"}})
+
+    def test_unknown_flags_get_full_response(self):
+        data = {"misc": {}, "outputs": []}
+        self.assertEqual(HttpDevice.split_status_json(data, [HttpDevice.JSON_STATUS_MISC | 0x1]), [data])
+
+
+if __name__ == '__main__':
+    unittest.main()
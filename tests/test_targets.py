@@ -0,0 +1,54 @@
+import ipaddress
+import unittest
+
+from gude.targets import TargetSet, collapse_aliases
+
+
+class TargetSetTests(unittest.TestCase):
+    def test_ranges_are_merged_without_duplicates(self):
+        targets = TargetSet()
+        targets.add_network(ipaddress.ip_network('10.0.0.0/30'))
+        targets.add_network(ipaddress.ip_network('10.0.0.0/29'))
+        targets.update(['10.0.0.2', '10.0.0.9', 'gude-01'])
+        self.assertEqual(list(targets), ['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.4', '10.0.0.5',
+                                         '10.0.0.6', '10.0.0.9', 'gude-01'])
+        self.assertEqual(len(targets), 8)
+
+    def test_port_variant_replaces_bare_target(self):
+        targets = TargetSet()
+        targets.add_network(ipaddress.ip_network('10.0.0.0/30'))
+        targets.update(['10.0.0.1:8080', 'gude-01', 'gude-01:443'])
+        self.assertEqual(list(targets), ['10.0.0.1:8080', '10.0.0.2', 'gude-01:443'])
+        self.assertEqual(len(targets), 3)
+        self.assertNotIn('10.0.0.1', targets)
+
+    def test_ranked_addresses_first(self):
+        targets = TargetSet()
+        targets.add_network(ipaddress.ip_network('10.0.0.0/29'))
+        targets.rank('10.0.0.5', 1)
+        targets.rank('10.0.0.6', 0)
+        targets.rank('10.0.1.1', 0)  # not a target
+        self.assertEqual(list(targets)[:3], ['10.0.0.6', '10.0.0.5', '10.0.0.1'])
+
+    def test_large_range_streams(self):
+        targets = TargetSet()
+        targets.add_network(ipaddress.ip_network('10.0.0.0/8'))
+        self.assertEqual(next(iter(targets)), '10.0.0.1')
+        self.assertIn('10.255.255.254', targets)
+        self.assertEqual(len(targets), 2 ** 24 - 2)
+        self.assertTrue(targets)
+        self.assertFalse(TargetSet())
+
+
+class CollapseAliasesTests(unittest.TestCase):
+    def test_one_target_per_mac_plain_ip_preferred(self):
+        targets = ['gw.example:31101', 'pdu-1.example', '10.0.0.5', 'gw.example:31102', '10.0.0.6']
+        macs = {'gw.example:31101': 'mac-a', 'pdu-1.example': 'mac-a', '10.0.0.5': 'mac-a',
+                'gw.example:31102': 'mac-b', 'pdu-2.example': 'mac-b'}
+        kept, aliases = collapse_aliases(targets, macs)
+        self.assertEqual(kept, ['10.0.0.5', 'gw.example:31102', '10.0.0.6'])
+        self.assertEqual(aliases, {'gw.example:31101': '10.0.0.5', 'pdu-1.example': '10.0.0.5'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import socket
+import unittest
+
+from gude.tcpScan import connect_budget, tcp_prescan
+
+
+class TcpPrescanTests(unittest.TestCase):
+    def test_keeps_only_listening_targets(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+        port = listener.getsockname()[1]
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        closed_port = closed.getsockname()[1]
+        try:
+            found = tcp_prescan([('127.0.0.1', closed_port), ('127.0.0.1', port)], timeout=1.0, concurrency=4)
+        finally:
+            listener.close()
+            closed.close()
+        self.assertEqual(found, [('127.0.0.1', port)])
+
+    def test_takes_targets_lazily_and_keeps_their_order(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(16)
+        port = listener.getsockname()[1]
+        taken = []
+
+        def targets():
+            for i in range(6):
+                taken.append(i)
+                yield '127.0.0.1', port
+
+        try:
+            found = tcp_prescan(targets(), timeout=1.0, concurrency=2)
+        finally:
+            listener.close()
+        self.assertEqual(taken, list(range(6)))
+        self.assertEqual(found, [('127.0.0.1', port)] * 6)
+
+    def test_budget_is_positive_and_bounded(self):
+        self.assertGreaterEqual(connect_budget(8), 1)
+        self.assertLessEqual(connect_budget(8), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,24 +2,39 @@
 
 from configparser import ConfigParser
 from datetime import date
+from time import monotonic, localtime, strftime
 from argparse import ArgumentParser, Namespace, RawDescriptionHelpFormatter
 import os
 import sys
+import asyncio
 import ipaddress
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from socket import gaierror
 from requests import get as req_get
-from requests.exceptions import Timeout, HTTPError, RequestException
-from typing import Tuple, Optional, List, Dict, Any, Callable
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
+from requests.exceptions import Timeout, HTTPError, RequestException, ConnectionError as RequestsConnectionError
+from typing import Tuple, Optional, List, Dict, Any, Callable, Iterable, Collection
+from dataclasses import dataclass, field
 
 from gude.deployDev import DeployDev
+from gude.asyncHttpDevice import iterate_async, run_bounded
 from gude.firmware_target import (
     format_firmware_version_for_display,
     is_explicit_firmware_selection,
     resolve_configured_firmware_version,
 )
-from gude.gblib import Gblib
+from gude.gblib import Gblib, GblDiscovery
+from gude.gblEntities import read_device_entities_steps
+from gude.httpSession import close_shared_sessions
+from gude.dnsCache import dns_cache
+from gude.inventory import DeviceInventory
+from gude.deadHosts import DeadHosts
+from gude.tcpScan import tcp_prescan
+from gude.targets import TargetSet, collapse_aliases
+from gude.neighbors import read_neighbors, neighbors_in_network, is_gude_mac
+from gude.probes import liveness_probes
+from gude.deployScheduler import DeploymentScheduler, GroupSlots, run_steps, run_steps_async
 import json
 import re
 
@@ -135,6 +150,22 @@ def _extract_model_candidates_from_product_name(product_name: str, rev_suffix: s
     return out
 
 
+def prodid_from_gbl_name(product_name: str, firmware_cfg: ConfigParser) -> Optional[str]:
+    """
+    Firmware section for a product name as reported by GBL, None if it is not unambiguous
+    (no section for the model number, or hardware revisions like '8045R2' exist as well).
+    """
+    sec_lc_map = {sec.lower(): sec for sec in firmware_cfg.sections()}
+    for cand in _extract_model_candidates_from_product_name(product_name):
+        sec = sec_lc_map.get(cand.lower())
+        if sec is None:
+            continue
+        if any(other.startswith(cand.lower() + 'r') for other in sec_lc_map):
+            return None
+        return sec
+    return None
+
+
 def _version_key(v: str) -> tuple:
     """Turn a version like '1.2.3' or '1.2.3-R2' into a sortable key."""
     if not isinstance(v, str):
@@ -322,6 +353,30 @@ def add_devices_to_config(_args: Namespace, _config: ConfigParser) -> ConfigPars
     return _config
 
 
+# [defaults] options of optional features, switched on by command line / API options (attribute -> option)
+DEFAULTS_FROM_ARGS = {
+    'inventory': 'inventory',
+    'tcp_prescan': 'tcpPrescan',
+    'dead_cache': 'deadCache',
+    'gateway_uploads': 'gatewayUploads',
+    'gateway_connections': 'gatewayConnections',
+    'mac_dedup': 'macDedup',
+    'gbl_clone_entities': 'gblCloneEntities',
+}
+
+
+def add_feature_options_to_config(_args: Namespace, _config: ConfigParser) -> ConfigParser:
+    """
+    Write the feature options given on the command line (or by the API) to [defaults],
+    over the upload.ini values. Options that are None keep upload.ini / DEFAULT_SETTINGS.
+    """
+    for attr, option in DEFAULTS_FROM_ARGS.items():
+        value = getattr(_args, attr, None)
+        if value is not None:
+            _config.set('defaults', option, str(value))
+    return _config
+
+
 def set_config_defaults(_config: ConfigParser, section: str, settings: dict, overwrite: bool = False) -> None:
     """
     Function to set default configuration values for a section.
@@ -343,6 +398,20 @@ DEFAULT_SETTINGS = {
     'defaults': {
         'httpTimeout': '3.0',
         'gblTimeout': '1.0',
+        'gblDirected': '0',
+        'tcpPrescan': '0',
+        'tcpPrescanTimeout': '1.0',
+        'neighborSeed': '0',
+        'macDedup': '0',
+        'gblCloneEntities': '',
+        'dnsCacheTtl': '300',
+        'gatewayUploads': '0',
+        'gatewayConnections': '0',
+        'deadCache': '',
+        'deadCacheTtl': '300',
+        'deadCacheMaxTtl': '86400',
+        'inventory': '',
+        'inventoryMaxAge': '900',
         'fwdir': 'fw'
     },
     'httpDefaults': {
@@ -604,12 +673,34 @@ def parse_args() -> Tuple[Namespace, ConfigParser, ConfigParser, str]:
     parser.add_argument('-S', '--status', help='Only fetch device status without making any changes', action="store_true", default=False)
     parser.add_argument('-G', '--gbl', help='Use GBL broadcast', action="store_true", default=False)
     parser.add_argument('-ng', '--nogbl', help='Dont use GBL', action="store_true", default=False)
+    parser.add_argument('--gbl-inventory', help='Status only, built from GBL replies; HTTP only for devices whose product id GBL does not reveal', action="store_true", default=False)
+    parser.add_argument('--tcp-prescan', action='store_const', const='1', default=None,
+                        help='Pre-scan the addresses of netN ranges by parallel TCP connects, only answering ones are processed')
+    parser.add_argument('--inventory', nargs='?', const='inventory.json', default=None, metavar='FILE',
+                        help='Record devices in a device inventory (default file: inventory.json); status runs take recently seen devices from it')
+    parser.add_argument('--refresh-inventory', help='Status runs: ask every device instead of using recent inventory entries', action="store_true", default=False)
+    parser.add_argument('--dead-cache', nargs='?', const='deadhosts.json', default=None, metavar='FILE',
+                        help='Remember targets without answer (default file: deadhosts.json) and skip them in later runs for a while')
+    parser.add_argument('--refresh-dead', help='Also try targets that did not answer in earlier runs', action="store_true", default=False)
+    parser.add_argument('--mac-dedup', action='store_const', const='1', default=None,
+                        help='Ask the targets for their MAC first and process aliases of one device (LAN IP, DNS name, port forward) once')
+    parser.add_argument('--gbl-clone-from', help='Write the eprom entities of this device via GBL instead of uploading config.txt', default=None)
+    parser.add_argument('--gbl-clone-entities', default=None, metavar='IDS',
+                        help='Comma separated ids of the eprom entities written by --gbl-clone-from (required)')
     parser.add_argument('--device-concurrency', type=int, default=1, help='Number of devices processed in parallel (default: 1)')
+    parser.add_argument('--engine', choices=['thread', 'async'], default='thread', help='Device I/O engine: worker threads (default) or a single asyncio event loop')
+    parser.add_argument('--gateway-uploads', type=int, default=None, metavar='N',
+                        help='Firmware uploads at a time per gateway (resolved address of the target host, default: 0 = unlimited)')
+    parser.add_argument('--gateway-connections', type=int, default=None, metavar='N',
+                        help='Devices in flight per gateway (default: 0 = unlimited)')
+    parser.add_argument('--worker-threads', type=int, default=None, help='Number of threads driving the parallel devices (default: --device-concurrency)')
     parser.add_argument('--jsonl-progress', type=str, default=None, help='Write progress events to a JSONL file')
     parser.add_argument('--firmware-config', type=json.loads, default=None, help='JSON mapping of model->{filename, version} to override version.ini')
     parser.add_argument('--custom-config', type=json.loads, default=None, help='JSON mapping of ip->config_filename or "RESET" to override config file selection')
     parser.add_argument('--custom-ssl', type=json.loads, default=None, help='JSON mapping of ip->ssl_filename to override ssl cert selection')
     _args = parser.parse_args()
+    if _args.gbl_inventory:
+        _args.status = True
 
     log.debug(f"Reading {_args.upload_ini} ...")
     _config = ConfigParser(strict=False)
@@ -634,6 +725,9 @@ def parse_args() -> Tuple[Namespace, ConfigParser, ConfigParser, str]:
     # Apply default settings using the generalized function
     for section, settings in DEFAULT_SETTINGS.items():
         set_config_defaults(_config, section, settings)
+    add_feature_options_to_config(_args, _config)
+    if _args.gbl_clone_from and not _clone_entity_ids(_config):
+        parser.error('--gbl-clone-from needs the entity ids to clone (--gbl-clone-entities or gblCloneEntities in [defaults])')
 
     _firmware = ConfigParser(strict=False)
     if _args.search_folder is not None and os.path.isdir(_args.search_folder):
@@ -700,90 +794,159 @@ def add_iprange_to_config(
             raise KeyError("Missing required args, could not determine device!")
 
 
-def generate_ip_list(_hosts_config: ConfigParser, _my_ip: str, _gbl_timeout: float) -> List[str]: # Changed _hosts to _hosts_config
+def _is_broadcast_network(target: str) -> bool:
+    try:
+        return ipaddress.ip_network(target, strict=False).num_addresses > 2
+    except ValueError:
+        return False
+
+
+def _gbl_ips_in_network(ips: List[str], target: str) -> List[str]:
+    network = ipaddress.ip_network(target, strict=False)
+    return [ip for ip in ips if ipaddress.ip_address(ip) in network]
+
+
+def _tcp_prescan_hosts(_hosts_config: ConfigParser, hosts: Iterable[str], refresh_dead: bool = False) -> List[str]:
+    """Hosts accepting a TCP connection on their configured HTTP(S) port."""
+    default_port = int(_hosts_config.get('httpDefaults', 'port', fallback=80))
+    dead_hosts = open_dead_hosts(_hosts_config)
+    # addresses that did not answer in earlier runs are skipped until their back-off is over
+    skip_dead = dead_hosts is not None and not refresh_dead
+    counts = {'scanned': 0, 'skipped': 0}
+
+    def targets():
+        # taken lazily by the scan, a large range is never listed up front
+        for host in hosts:
+            target = (host, int(_hosts_config.get(host, 'port', fallback=default_port)))
+            if skip_dead and dead_hosts.is_dead(*target):
+                counts['skipped'] += 1
+            else:
+                counts['scanned'] += 1
+                yield target
+
+    start = monotonic()
+    answered = tcp_prescan(targets(), float(_hosts_config.get('defaults', 'tcpPrescanTimeout', fallback=1.0)))
+    if counts['skipped']:
+        log.info(f"TCP pre-scan: skipped {counts['skipped']} addresses without answer in earlier runs")
+    log.info(f"TCP pre-scan: {len(answered)} of {counts['scanned']} addresses answered "
+             f"within {monotonic() - start:.1f}s")
+    if dead_hosts is not None:
+        # misses of a bulk range are not recorded (mostly empty addresses), only answers clear entries
+        for target in answered:
+            dead_hosts.alive(*target)
+        dead_hosts.save()
+    return [host for host, _ in answered]
+
+
+def _neighbor_seed_mode(_hosts_config: ConfigParser) -> str:
+    """[defaults] neighborSeed: '' (off), 'first' (probe neighbors first) or 'only' (no sweep)."""
+    value = _hosts_config.get('defaults', 'neighborSeed', fallback='0').strip().lower()
+    if value == 'only':
+        return 'only'
+    return 'first' if value in ('1', 'yes', 'true', 'on', 'first') else ''
+
+
+def generate_ip_list(_hosts_config: ConfigParser, _my_ip: str, _gbl_timeout: float,
+                     discovered: Optional[Dict[str, Dict[str, Any]]] = None,
+                     refresh_dead: bool = False) -> TargetSet: # Changed _hosts to _hosts_config
     """
     Function that adds hosts from args to hosts in _config (parsed hosts from upload.ini)
     :param ConfigParser _hosts_config: ConfigParser section for hosts
     :param str _my_ip: this is the broadcaster/client ip, require for GBL/UDP search
     :param float _gbl_timeout: timeout in seconds to wait after sending broadcast
+    :param dict discovered: if given, filled with ip -> GBL record (Gblib.dev_netconf_info plus
+        'hostname') of the devices that answered the GBL search, to be passed on to iterate_list
+    :param bool refresh_dead: pre-scan addresses even if they did not answer in earlier runs
 
     :returns:
-    - _ip_list - parsed args
-    :rtype: list
+    - targets - parsed args, iterable (repeatedly) and sized
+    :rtype: TargetSet
     """
-    _ip_list = []
+    targets = TargetSet()
+    # GBL search: broadcast on every local interface (or on myIp) and, with
+    # [defaults] gblDirected = 1, directed broadcasts into the configured netN subnets.
+    # All of them are sent in parallel and answered in one discovery round.
+    directed_nets = []
+    if _hosts_config.getboolean('defaults', 'gblDirected', fallback=False):
+        directed_nets = [net for key, net in _hosts_config.items('hosts')
+                         if key.startswith('net') and _is_broadcast_network(net)]
+    searching = any(target == "search" for _, target in _hosts_config.items('hosts'))
+    gbl_ips = []
+    if searching or directed_nets:
+        bc_targets = GblDiscovery.interface_targets(_my_ip) if searching else []
+        bc_targets += [GblDiscovery.directed_target(net, _my_ip) for net in directed_nets]
+        log.info("Searching devices by GBL UDP broadcast...")
+        log.debug(f"GBL search targets (bind address, destination): {bc_targets}")
+        try:
+            # devices are taken as they reply, discovery ends after a quiet period
+            replies = list(GblDiscovery(_my_ip, _gbl_timeout, targets=bc_targets))
+            # hostnames of legacy devices (short replies) by GBL_FWINFO, all queried at once
+            legacy_hostnames = Gblib.legacy_hostnames(replies, _gbl_timeout)
+            for dev_info_bytes in replies: # dev is bytes
+                dev_info_dict = Gblib.get_dev_info(dev_info_bytes, legacy_hostnames.get(dev_info_bytes[1], '')) # parse bytes to dict
+                if 'ip' in dev_info_dict:
+                     gbl_ips.append(dev_info_dict['ip'])
+                     if discovered is not None:
+                         discovered[dev_info_dict['ip']] = dict(Gblib.dev_netconf_info(dev_info_bytes),
+                                                                hostname=dev_info_dict['hostname'])
+                else:
+                    log.warning(f"Device found via GBL without IP information: {dev_info_dict}")
+        except Exception as e:
+            log.error(f"Error during GBL search: {e}")
+
     # Iterate over items in the 'hosts' section of the ConfigParser object
+    # (ranges are kept as integer intervals, addresses are only created while iterating)
     log.debug(f"Getting all IPs for hosts defined in config section: hosts")
+    prescan = _hosts_config.getboolean('defaults', 'tcpPrescan', fallback=False)
+    prescan_set = TargetSet()
+    # neighbor table seeding: addresses of netN ranges the kernel knows a MAC for are
+    # probed first (Gude devices before anything else), the rest is swept after them or not at all
+    neighbor_mode = _neighbor_seed_mode(_hosts_config)
+    neighbors = read_neighbors() if neighbor_mode else []
+    if neighbor_mode and not neighbors:
+        log.info("Neighbor table empty or not available, sweeping netN ranges as usual")
     for key, target in _hosts_config.items('hosts'): # Iterate over 'hosts' section
         log.debug(f"Checking host entry {key}: {target}")
         if target == "search":
-            log.info("Searching devices by GBL UDP broadcast...")
-            try:
-                device_lst = Gblib.recv_bc(_my_ip, _gbl_timeout)
-                for dev_info_bytes in device_lst: # dev is bytes
-                    dev_info_dict = Gblib.get_dev_info(dev_info_bytes) # parse bytes to dict
-                    if 'ip' in dev_info_dict:
-                         _ip_list.append(dev_info_dict['ip'])
-                    else:
-                        log.warning(f"Device found via GBL without IP information: {dev_info_dict}")
-            except Exception as e:
-                log.error(f"Error during GBL search: {e}")
+            targets.update(gbl_ips)
+        elif target in directed_nets and _gbl_ips_in_network(gbl_ips, target):
+            found = _gbl_ips_in_network(gbl_ips, target)
+            log.info(f"{len(found)} devices found in {target} by directed GBL broadcast")
+            targets.update(found)
         else:
-            num_hosts = 0
+            if target in directed_nets:
+                log.info(f"No GBL reply from {target}, probing every address")
             try:
                 # ipaddress.ip_network can handle single IPs as well if they are valid strings
                 # It will create a network with a single host.
                 # For hostnames, this will fail, and we'll fall into the ValueError.
                 ip_network = ipaddress.ip_network(target, strict=False) # strict=False allows single IPs
-                for ip_addr_obj in ip_network.hosts():
-                    _ip_list.append(str(ip_addr_obj)) # Store as string
-                    num_hosts += 1
-                if num_hosts == 0 and ip_network.num_addresses == 1: # Single IP case
-                     _ip_list.append(str(ip_network.network_address))
-                     num_hosts = 1
-
             except ValueError: # Handles hostnames or invalid IP/network strings
                 log.warning(f"{target} could not be parsed as IPAddress or IP-Network by 'ipaddress' library, "
                             f"treating as a single host identifier (e.g., hostname or IP string).")
-                _ip_list.append(target) # Add as is (could be hostname or IP string)
-                num_hosts = 1
-
-            if num_hosts == 0 and '/' not in target : # If still no hosts, and it wasn't a network string, add target itself
-                 _ip_list.append(target)
+                targets.add(target) # Add as is (could be hostname or IP string)
+                continue
+            # addresses of ranges are pre-scanned, unless GBL found the device there
+            range_set = prescan_set if prescan and ip_network.num_addresses > 2 else targets
+            found = neighbors_in_network(neighbors, ip_network) if neighbors and ip_network.num_addresses > 2 else []
+            if found:
+                gude_count = sum(1 for _, mac in found if is_gude_mac(mac))
+                log.info(f"{len(found)} neighbors in {target}, {gude_count} with Gude OUI")
+                for ip, mac in found:
+                    targets.rank(ip, 0 if is_gude_mac(mac) else 1)
+            if found and neighbor_mode == 'only':
+                range_set.update(ip for ip, _ in found)
+            else:
+                range_set.add_network(ip_network)
 
+    if prescan_set:
+        gbl_set = set(gbl_ips)
+        targets.update(_tcp_prescan_hosts(_hosts_config, (host for host in prescan_set if host not in gbl_set),
+                                          refresh_dead))
 
-    # Remove duplicates that might have occurred
-    _ip_list = sorted(list(set(_ip_list)))
-    
-    # Advanced dedup: remove 'IP' if 'IP:PORT' exists
-    # This prevents duplicates when GBL finds '1.2.3.4' but config has '1.2.3.4:80'
-    final_list = []
-    ip_map = {} # ip -> list of original strings
-    
-    for item in _ip_list:
-        # Handle IPv4 primarily. IPv6 in simple logic might fail split(':') if not careful, 
-        # but code mostly handles IPv4. 
-        if item.count(':') == 1:
-             ip_part = item.split(':')[0]
-        else:
-             ip_part = item
-             
-        if ip_part not in ip_map:
-            ip_map[ip_part] = []
-        ip_map[ip_part].append(item)
-        
-    for ip_part, items in ip_map.items():
-        has_port_variant = any(':' in i for i in items)
-        if has_port_variant:
-            # Keep only those with ports. Discard the "bare" IP (usually from GBL)
-            # as it is likely covered by the explicit config entry.
-            for i in items:
-                if ':' in i:
-                    final_list.append(i)
-        else:
-             final_list.extend(items)
-             
-    return sorted(final_list)
+    # duplicates are dropped by the TargetSet, a bare 'IP' if 'IP:PORT' exists as well
+    # (GBL finds '1.2.3.4' but config has '1.2.3.4:80'); neighbor table hosts come first
+    return targets
 
 
 def format_device_log_label(
@@ -816,6 +979,7 @@ class DeviceResult:
     latest_publish_date: Optional[str] = None
     target_is_custom: bool = False
     selected_prodid: Optional[str] = None
+    prodid: Optional[str] = None
     status_only: bool = False
     final_firmware: Optional[str] = None
     firmware_status: str = "not attempted"
@@ -825,426 +989,1008 @@ class DeviceResult:
     job_id: Optional[str] = None
 
 
+def _conn_host(ip: str) -> str:
+    """Host part of a target, "host:port" targets are connected on their configured port."""
+    # Handle potential port in IP string (though generate_ip_list should give clean IPs)
+    if isinstance(ip, str) and ':' in ip:
+        parts = ip.split(':')
+        host = parts[0]
+        # Check if we're dealing with a hostname or IP
+        try:
+            # Only validate if it looks like an IP address
+            if re.match(r'^[\d\.]+$', host):
+                ipaddress.ip_address(host)
+        except ValueError:
+            # This is likely a hostname with port, which is fine
+            log.debug(f"Treating {host} as hostname with port {parts[1]}")
+        return host
+    return ip
+
+
+@dataclass
+class RunContext:
+    """State of one iterate_list() run, shared by the per-device functions below."""
+    firmware: ConfigParser
+    config: ConfigParser
+    args: Any
+    progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None
+    concurrency: int = 1
+    use_progress_bar: bool = True
+    show_job_id: bool = False
+    # target -> job id, numbered as the devices are started
+    job_ids: Dict[str, str] = field(default_factory=dict)
+    job_ids_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    # host names that did not resolve (gude.dnsCache) -> error
+    unresolved: Dict[str, OSError] = field(default_factory=dict)
+    # GBL_NETCONF replies by host
+    gbl_netconf: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    inventory: Optional[DeviceInventory] = None
+    inventory_max_age: float = 900.0
+    dead_hosts: Optional[DeadHosts] = None
+    # target -> status parts [misc, ethernet] read by the identity stage, or the exception of an
+    # unreachable target; used once by the status stage instead of asking the device again
+    identity_status: Dict[str, Any] = field(default_factory=dict)
+    # eprom entities of the --gbl-clone-from device, written instead of config.txt
+    clone_from: Optional[str] = None
+    clone_entities: Optional[List[Dict[str, Any]]] = None
+    # gateway address -> host name (for logs and per-gateway sections)
+    gateway_names: Dict[str, str] = field(default_factory=dict)
+    upload_slots: Optional[GroupSlots] = None
+
+    def job_id(self, ip: str) -> Optional[str]:
+        """Job id of a target for concurrent runs (None otherwise), assigned on first use."""
+        if not self.show_job_id:
+            return None
+        with self.job_ids_lock:
+            return self.job_ids.setdefault(ip, f"job-{len(self.job_ids) + 1:02d}")
+
+    # Optional progress emitter
+    def emit(self, evt: Dict[str, Any]):
+        if self.progress_cb:
+            try:
+                self.progress_cb(evt)
+            except Exception:
+                pass
+
+
+def _gateway(run: RunContext, ip_str_or_obj: Any) -> str:
+    host = _conn_host(str(ip_str_or_obj))
+    try:
+        gateway = dns_cache.resolve(host)
+    except (gaierror, UnicodeError):
+        gateway = host
+    run.gateway_names.setdefault(gateway, host)
+    return gateway
+
+
+def _gateway_limit(run: RunContext, option: str) -> Callable[[str], int]:
+    """Limit of a gateway: option of its host section (e.g. [gw.example.com]), else of [defaults]."""
+    default = run.config.get('defaults', option, fallback='0')
+    return lambda gateway: int(run.config.get(run.gateway_names.get(gateway, gateway), option, fallback=default) or 0)
+
+
+def _upload_slot(run: RunContext, gateway: str) -> Tuple[Callable[[Dict[str, Any]], None], Callable[[], None]]:
+    """
+    (progress_cb, release) for a firmware upload holding an upload slot of gateway. The slot is
+    released once the image is sent (device reboots) or by release(), whatever comes first.
+    """
+    held = [True]
+
+    def release():
+        if held[0]:
+            held[0] = False
+            run.upload_slots.release(gateway)
+
+    def progress(evt: Dict[str, Any]):
+        if str(evt.get('status', '')).startswith('Rebooting'):
+            release()
+        run.emit(evt)
+    return progress, release
+
+
+def _log_upload_wait(run: RunContext, dev: Any, gateway: str) -> None:
+    log.info(f"[{dev.get_log_label()}] waiting for a free upload slot of gateway {run.gateway_names.get(gateway, gateway)}")
+
+
+def _start_device(run: RunContext, ip_str_or_obj: Any) -> DeviceResult:
+    ip = str(ip_str_or_obj) # Ensure ip is a string for consistency
+    job_id = run.job_id(ip)
+    result = DeviceResult(ip=ip, product_name="unknown", mac="unknown", initial_firmware="unknown", job_id=job_id)
+    run.emit({"type": "device_start", "ip": ip, "job_id": job_id})
+    log.debug(f"[{format_device_log_label(ip, job_id=job_id)}] Processing device")
+    return result
+
+
+def _enter_stage(run: RunContext, result: DeviceResult, stage: str) -> None:
+    run.emit({"type": "device_stage", "ip": result.ip, "job_id": result.job_id, "stage": stage})
+
+
+def _append_status_note(result: DeviceResult, note: str) -> None:
+    """Append an additional action summary to the visible per-device status text."""
+    if not note:
+        return
+    if not result.firmware_status or result.firmware_status == "not attempted":
+        result.firmware_status = note
+        return
+    if note in result.firmware_status:
+        return
+    result.firmware_status = f"{result.firmware_status}; {note}"
+
+
+def _append_error(result: DeviceResult, message: str) -> None:
+    if result.error_message: result.error_message += f"; {message}"
+    else: result.error_message = message
+
+
+def _config_key(run: RunContext, ip: str) -> str:
+    # Determine config_key: if ip (e.g. "192.168.1.10:8080") is a section name, use it.
+    # Otherwise, use dev_ip_for_conn (e.g. "192.168.1.10") if it's a section.
+    # Fallback to 'httpDefaults'.
+    config_key_options = [ip, _conn_host(ip), 'httpDefaults']
+    config_key = 'httpDefaults' # Default fallback
+    for key_option in config_key_options:
+        if run.config.has_section(key_option):
+            config_key = key_option
+            break
+    return config_key
+
+
+def _http_port(run: RunContext, config_key: str) -> int:
+    return int(run.config.get(config_key, 'port', fallback=int(run.config.get('httpDefaults', 'port', fallback=80))))
+
+
+def _http_ssl(run: RunContext, config_key: str) -> bool:
+    return run.config.getboolean(config_key, 'ssl', fallback=run.config.getboolean('httpDefaults', 'ssl', fallback=False))
+
+
+def _gbl_target(run: RunContext, ip: str) -> bool:
+    """
+    False for targets on a non-default HTTP port ('host:port' or a port set in their section):
+    these are port forwards, GBL datagrams to their host reach the gateway, not the device.
+    """
+    if ip.count(':') == 1:
+        return False
+    config_key = _config_key(run, ip)
+    return _http_port(run, config_key) == (443 if _http_ssl(run, config_key) else 80)
+
+
+def _gbl_reply(run: RunContext, ip: str) -> Optional[Dict[str, Any]]:
+    """GBL_NETCONF reply of the device at target ip, None if there is none or GBL cannot reach it."""
+    return run.gbl_netconf.get(_conn_host(ip)) if _gbl_target(run, ip) else None
+
+
+def _setup_device(run: RunContext, result: DeviceResult, dev_cls: type) -> Tuple[Any, str]:
+    """Create the device object for result.ip with its http settings. Returns (dev, dev_ip_for_conn)."""
+    ip = result.ip
+    job_id = result.job_id
+
+    #if ip not in ["gwtestnet1.gude.local:38221", "gwtestnet1.gude.local:38226"]:
+    #    continue
+
+    dev_ip_for_conn = _conn_host(ip)
+
+    dev = dev_cls(dev_ip_for_conn, req_headers=run.args.header)
+
+    config_key = _config_key(run, ip)
+    log.debug(f"[{format_device_log_label(ip, job_id=job_id)}] Using config-key '{config_key}'")
+
+    # Determine connection settings
+    # Avoid mutating shared config during concurrency
+    port = _http_port(run, config_key)
+    use_ssl = _http_ssl(run, config_key)
+    # Apply to device
+    dev.set_http_port(port, use_ssl)
+    dev.set_log_job_id(job_id)
+    dev.set_basic_auth(run.config.getboolean(config_key, 'auth', fallback=False),
+                       run.config.get(config_key, 'username', fallback=''),
+                       run.config.get(config_key, 'password', fallback=''))
+    dev.set_http_timeout(float(run.config.get('defaults', 'httpTimeout', fallback=3.0)))
+    dev.set_http_retries(0)
+    dev.reboot_gbl_probe = not getattr(run.args, 'nogbl', False) and _gbl_target(run, ip)
+
+    # Expose connection info for UI
+    result.conn_host = dev_ip_for_conn
+    result.conn_port = port
+    result.conn_ssl = use_ssl
+    proto = 'https' if use_ssl else 'http'
+    result.url = f"{proto}://{dev_ip_for_conn}:{port}"
+    return dev, dev_ip_for_conn
+
+
+def _gbl_mac(run: RunContext, dev: Any, ip: str) -> str:
+    mac = "unknown-mac"
+    if getattr(run.args, 'nogbl', False):
+        log.debug(f"[{dev.get_log_label()}] GBL MAC lookup skipped by --nogbl.")
+    elif not _gbl_target(run, ip):
+        log.debug(f"[{dev.get_log_label()}] GBL MAC lookup skipped, port {dev.httpOpts['port']} is not the device's own HTTP port.")
+    else:
+        try:
+            log.info(f"[{dev.get_log_label()}] Attempting to get MAC via GBL/UDP...")
+            netconf = _gbl_reply(run, ip)
+            if netconf is None:
+                log.warning(f"[{dev.get_log_label()}] GBL timeout (UDP port 50123)")
+            else:
+                # Keep the historical config filename format: aa_bb_cc_dd_ee_ff.
+                mac = '_'.join(f'{c:02x}' for c in netconf['mac'])
+                log.info(f"[{dev.get_log_label()}] Got MAC {mac} via GBL.")
+        except (gaierror, ConnectionResetError, OSError) as e_gbl:
+            log.warning(f"[{dev.get_log_label()}] GBL MAC retrieval failed: {e_gbl}")
+    return mac
+
+
+def _record_status_error(run: RunContext, dev: Any, result: DeviceResult, e: Exception) -> None:
+    if isinstance(e, HTTPError):
+        if e.response.status_code == 401:
+            log.error(f"[{dev.get_log_label()}] Authentication error on configured port/protocol: {e}")
+            result.error_message = f"Authentication Error: {e}"
+        else:
+            log.error(f"[{dev.get_log_label()}] HTTPError: {e}")
+            result.error_message = f"HTTPError: {e}"
+    elif isinstance(e, (Timeout, ConnectionError, RequestsConnectionError)): # Catch Timeout and ConnectionError
+        log.error(f"[{dev.get_log_label()}] Could not reach device on configured port/protocol: {e}")
+        result.error_message = f"Connection/Timeout Error: {e}"
+        if run.dead_hosts is not None:
+            run.dead_hosts.failed(result.conn_host, result.conn_port)
+    else: # Catch other potential errors during initial status fetch
+        log.error(f"[{dev.get_log_label()}] Unexpected error fetching initial status: {e}")
+        result.error_message = f"Unexpected initial status error: {e}"
+
+
+def _identity_status_parts(run: RunContext, ip: str) -> Optional[List[Dict[str, Any]]]:
+    """Status parts of the identity stage (taken once), raises its error for unreachable targets."""
+    parts = run.identity_status.pop(ip, None)
+    if isinstance(parts, Exception):
+        raise parts
+    return parts
+
+
+def _status_components(mac: str) -> List[int]:
+    if mac == "unknown-mac":
+        return [DeployDev.JSON_STATUS_MISC, DeployDev.JSON_STATUS_ETHERNET]
+    return [DeployDev.JSON_STATUS_MISC]
+
+
+def _apply_device_status(run: RunContext, dev: Any, result: DeviceResult, device_data: Dict[str, Any]) -> None:
+    dev.boot_model = device_data.get('prodid')
+    result.prodid = device_data.get('prodid')
+    if run.dead_hosts is not None and result.conn_host is not None:
+        run.dead_hosts.alive(result.conn_host, result.conn_port)
+    result.product_name = device_data['product_name']
+    result.hostname = device_data.get('hostname')
+    result.initial_firmware = device_data['firm_v']
+
+
+def _mac_from_ethernet(dev: Any, ethernet_json: Dict[str, Any]) -> str:
+    mac = ethernet_json['ethernet']['mac'].replace(':', '_')
+    log.info(f"[{dev.get_log_label()}] Got MAC {mac} via HTTP(S).")
+    return mac
+
+
+def _plan_device(run: RunContext, dev: Any, mac: str, device_data: Dict[str, Any], result: DeviceResult) -> Dict[str, Any]:
+    """
+    Select config, certificate and firmware for the device (no device I/O).
+    Returns the deployment plan; device_data['prodid'] is set to the selected firmware section.
+    """
+    ip = result.ip
+    log.debug(f"[{dev.get_log_label()}] Getting config filename for MAC {mac}, IP {ip}...")
+    
+    # Check for custom config override
+    custom_config_map = getattr(run.args, 'custom_config', None) or {}
+    # Try to find match by IP (exact or host:port if matches dev.host)
+    custom_config_val = custom_config_map.get(ip)
+    if not custom_config_val and dev.host in custom_config_map:
+        custom_config_val = custom_config_map[dev.host]
+
+    factory_reset_requested = (custom_config_val == "RESET")
+    explicit_config_file = custom_config_val if (custom_config_val and not factory_reset_requested) else None
+
+    # Pass explicit_filename if we have one (not RESET, and not None)
+    cfg_filename = DeployDev.get_config_filename('config', 'config', 'txt', mac, ip, run.args.configip, explicit_filename=explicit_config_file)
+    
+    log.debug(f"[{dev.get_log_label()}] Getting SSL certificate filename for MAC {mac}, IP {ip}...")
+    
+    # Check for custom ssl override
+    custom_ssl_map = getattr(run.args, 'custom_ssl', None) or {}
+    custom_ssl_val = custom_ssl_map.get(ip)
+    if not custom_ssl_val and dev.host in custom_ssl_map:
+        custom_ssl_val = custom_ssl_map[dev.host]
+
+    explicit_ssl_file = None
+    skip_ssl = False
+    if custom_ssl_val == "__no_cert__":
+        skip_ssl = True
+    elif custom_ssl_val:
+        explicit_ssl_file = custom_ssl_val
+
+    if skip_ssl:
+        ssl_cert_filename = None
+        log.info(f"[{dev.get_log_label()}] SSL upload skipped by user request.")
+    else:
+        ssl_cert_filename = DeployDev.get_config_filename('ssl', 'cert', 'pem', mac, ip, run.args.configip, explicit_filename=explicit_ssl_file)
+
+    # Check for custom firmware override (currently used for per-device "__no_update__")
+    custom_firmware_map = getattr(run.args, 'custom_firmware', None) or {}
+    custom_firmware_val = custom_firmware_map.get(ip)
+    if not custom_firmware_val and dev.host in custom_firmware_map:
+        custom_firmware_val = custom_firmware_map[dev.host]
+    skip_firmware_update = (custom_firmware_val == "__no_update__")
+
+    # --- before logging/deploy ---
+    actual_prod_id = device_data['prodid']
+    # Build replacement map (if provided via args)
+    repl_map = run.args.repl_prod_id if isinstance(getattr(run.args, 'repl_prod_id', None), dict) else None
+    selected_prod_id, selected_version = resolve_prodid(
+        actual_prodid=actual_prod_id,
+        product_name=device_data.get('product_name') or '',
+        firmware_cfg=run.firmware,
+        repl_map=repl_map,
+    )
+    # Offline fallback: if resolved section has no local file, try compatible
+    # same-family entries (e.g. 80xxR2) that do have a local file.
+    if selected_prod_id and not run.args.onlineupdate:
+        fw_dir_default = run.config.get('defaults', 'fwdir', fallback='fw')
+        fallback_prodid = find_offline_compatible_prodid(
+            selected_prodid=selected_prod_id,
+            firmware_cfg=run.firmware,
+            fw_dir_default=fw_dir_default,
+        )
+        if fallback_prodid:
+            log.info(f"[{dev.get_log_label()}] Offline fallback: using compatible firmware section '{fallback_prodid}' instead of '{selected_prod_id}'")
+            selected_prod_id = fallback_prodid
+            selected_version = run.firmware.get(selected_prod_id, 'version', fallback=selected_version)
+            if result.firmware_upload_notes:
+                result.firmware_upload_notes += f"; offline fallback -> {selected_prod_id}"
+            else:
+                result.firmware_upload_notes = f"offline fallback -> {selected_prod_id}"
+    # update device_data and log
+    if selected_prod_id:
+        device_data["prodid"] = selected_prod_id # Update prodid for update_firmware call
+        # Track selected product id for summary/use
+        result.selected_prodid = selected_prod_id
+        target_filename = run.firmware.get(selected_prod_id, 'filename', fallback='').strip()
+        result.target_is_custom = is_explicit_firmware_selection(target_filename)
+        effective_target_version = selected_version
+        if result.target_is_custom:
+            effective_target_version = resolve_configured_firmware_version(
+                selected_prod_id,
+                target_filename,
+                run.firmware.get(selected_prod_id, 'version', fallback=''),
+            )
+        disp_version = format_firmware_version_for_display(selected_prod_id, effective_target_version) or target_filename or "unknown"
+        result.latest_known_firmware = disp_version
+        # Determine publish date for latest known version (prefer model 'date' for online sources)
+        try:
+            if result.target_is_custom:
+                result.latest_publish_date = None
+            elif run.args.onlineupdate and run.firmware.has_option(selected_prod_id, 'date'):
+                result.latest_publish_date = run.firmware.get(selected_prod_id, 'date')
+            elif run.firmware.has_section('url') and run.firmware.has_option('url', 'last_update'):
+                result.latest_publish_date = run.firmware.get('url', 'last_update')
+        except Exception:
+            result.latest_publish_date = None
+        firmware_label = "selected target" if result.target_is_custom else "latest known"
+        log.info(
+            f"{device_data['product_name']} "
+            f"({actual_prod_id} -> {selected_prod_id}, {mac}) at {dev.get_log_label()}\n"
+            + " " * (len(f"{device_data['product_name']} ({actual_prod_id} -> {selected_prod_id}, {mac}) at {dev.get_log_label()}") - len(f"running Firmware v{device_data['firm_v']}")) # Align logging
+            + f"running Firmware v{device_data['firm_v']}, {firmware_label}: {result.latest_known_firmware}"
+        )
+    else:
+        log.warning(f"[{dev.get_log_label()}] No firmware entry found for product '{actual_prod_id}' (original) or suitable replacement.")
+        result.firmware_status = f"No firmware definition for {actual_prod_id}"
+
+    # deploy Firmware?
+    update_firmware = False
+    if skip_firmware_update:
+        log.info(f"[{dev.get_log_label()}] Firmware update skipped by user request (No Update).")
+        result.firmware_status = "Skipped (No Update)"
+    elif selected_prod_id and selected_prod_id in run.firmware: # Check if selected_prod_id is valid for _firmware
+        # Check for explicit no-update flag
+        target_filename = run.firmware.get(selected_prod_id, 'filename', fallback='')
+        if target_filename == '__no_update__':
+             log.info(f"[{dev.get_log_label()}] Firmware update skipped by user request (No Update).")
+             result.firmware_status = "Skipped (No Update)"
+        else: 
+            update_firmware = True
+
+    return {
+        "update_firmware": update_firmware,
+        "factory_reset": factory_reset_requested,
+        "cfg_filename": cfg_filename,
+        "ssl_cert_filename": ssl_cert_filename,
+    }
+
+
+def _set_status_only(result: DeviceResult) -> DeviceResult:
+    result.firmware_status = "status only, no changes made"
+    result.status_only = True
+    result.success = False
+    return result
+
+
+def _apply_firmware_result(result: DeviceResult, fw_update_result: Dict[str, Any]) -> None:
+    result.final_firmware = fw_update_result.get("final_version", result.initial_firmware)
+    result.firmware_status = fw_update_result.get("status_message", "firmware update status unknown")
+    result.firmware_upload_notes = fw_update_result.get("upload_notes")
+
+
+def _record_firmware_error(dev: Any, result: DeviceResult, e: Exception) -> None:
+    if isinstance(e, ValueError): # Catches firmware file not found etc. from update_firmware
+        result.firmware_status = f"failed: {str(e)}"
+        log.warning(f"[{dev.get_log_label()}] Skipped firmware update: {e}")
+    else: # Catch any other unexpected error during update_firmware
+        result.firmware_status = f"failed: unexpected error during update ({str(e)})"
+        log.error(f"[{dev.get_log_label()}] Unexpected error during firmware update: {e}", exc_info=True)
+
+
+def _apply_factory_reset(dev: Any, result: DeviceResult, reset_ok: Optional[bool], e: Optional[Exception] = None) -> None:
+    if e is not None:
+         log.error(f"[{dev.get_log_label()}] Factory reset failed: {e}")
+         result.error_message = f"Factory reset failed: {e}"
+    elif reset_ok:
+         log.info(f"[{dev.get_log_label()}] Factory reset triggered successfully.")
+         result.firmware_status = "Factory Reset Triggered"
+         # Reset usually reboots the device, so we might want to skip further configuration
+         # But we continue to let valid flow happen if possible, though config upload likely moot
+    else:
+        log.warning(f"[{dev.get_log_label()}] Factory reset returned False (maybe not supported or failed).")
+        result.error_message = "Factory reset failed or not supported"
+
+
+def _clones_entities(run: RunContext, result: DeviceResult, plan: Dict[str, Any]) -> bool:
+    # the reference itself is left alone, a factory reset replaces the configuration
+    return (run.clone_entities is not None and not plan["factory_reset"]
+            and _conn_host(result.ip) != _conn_host(run.clone_from))
+
+
+def _apply_upload_outcome(dev: Any, result: DeviceResult, kind: str, filename: str, e: Optional[Exception] = None) -> None:
+    # kind: "config" or "ssl"
+    if kind == "config":
+        label, note, error = "configuration", "Config updated", "Config upload error"
+    else:
+        label, note, error = "SSL certificate", "SSL certificate updated", "SSL cert upload error"
+    if e is None:
+        log.info(f"[{dev.get_log_label()}] Successfully uploaded {label} {filename}.")
+        _append_status_note(result, f"{note} ({filename})")
+    else:
+        log.error(f"[{dev.get_log_label()}] Failed to upload {label} {filename}: {e}")
+        _append_error(result, f"{error}: {e}")
+
+
+def _apply_final_check(dev: Any, result: DeviceResult, final_ipv4_config: Dict[str, Any], final_misc_status: Dict[str, Any]) -> None:
+    log.info(f"[{dev.get_log_label()}] Final check: hostname '{final_ipv4_config['hostname']}', FW Version {final_misc_status['firm_v']}")
+    # Update final_firmware if it changed due to config/ssl reboot and wasn't from fw update
+    if result.final_firmware == result.initial_firmware or result.final_firmware is None: # only if not set by fw update
+        if final_misc_status['firm_v'] != result.initial_firmware:
+            result.final_firmware = final_misc_status['firm_v']
+            # Potentially update firmware_status if it implies no update was done but version changed
+            if "not attempted" in result.firmware_status or "up to date" in result.firmware_status:
+                 result.firmware_status = f"version changed to {result.final_firmware} (possibly due to other uploads)"
+
+
+def _record_major_error(result: DeviceResult, e: Exception) -> None:
+    log.error(f"[{format_device_log_label(result.ip, job_id=result.job_id)}] Major error processing device: {e}", exc_info=True)
+    result.error_message = str(e)
+    result.success = False # Ensure success is false on major error
+
+
+def _finish_device(run: RunContext, result: DeviceResult) -> DeviceResult:
+    run.emit({
+        "type": "device_done",
+        "ip": result.ip,
+        "job_id": result.job_id,
+        "ok": result.success,
+        "product": result.product_name,
+        "initial_fw": result.initial_firmware,
+        "final_fw": result.final_firmware,
+        "status": result.firmware_status,
+        "error": result.error_message,
+    })
+    return result
+
+
+def _gbl_device_data(run: RunContext, ip: str) -> Optional[Dict[str, Any]]:
+    """status.json 'misc' fields taken from the device's GBL_NETCONF reply, None if GBL lacks some of them."""
+    netconf = _gbl_reply(run, ip)
+    dev_info = netconf.get('dev_info') if netconf else None
+    if not dev_info or not dev_info.extended:  # legacy replies carry neither name nor hostname
+        return None
+    product_name = dev_info.product_name
+    prodid = prodid_from_gbl_name(product_name, run.firmware)
+    if prodid is None:
+        return None
+    return {
+        'product_name': product_name,
+        'prodid': prodid,
+        'firm_v': '.'.join(str(x) for x in netconf['firmware']),
+        'hostname': dev_info.hostname,
+    }
+
+
+def _gbl_status_row(run: RunContext, ip_str_or_obj: Any) -> Optional[DeviceResult]:
+    """Status-only result from GBL data alone (--gbl-inventory), None if HTTP is needed."""
+    device_data = _gbl_device_data(run, str(ip_str_or_obj))
+    if device_data is None:
+        return None
+    return _status_only_row(run, ip_str_or_obj, device_data)
+
+
+def _inventory_status_row(run: RunContext, ip_str_or_obj: Any) -> Optional[DeviceResult]:
+    """Status-only result from a fresh inventory entry, None if the device has to be asked."""
+    entry = run.inventory.find(str(ip_str_or_obj))
+    if not run.inventory.is_fresh(entry, run.inventory_max_age) or not entry.get('firmware'):
+        return None
+    netconf = _gbl_reply(run, str(ip_str_or_obj))
+    if netconf is not None and DeviceInventory.normalize_mac(netconf['mac']) != entry['mac']:
+        return None  # another device answers at this address now
+    device_data = {
+        'product_name': entry.get('product_name') or 'unknown',
+        'prodid': entry.get('prodid'),
+        'hostname': entry.get('hostname'),
+        'firm_v': entry['firmware'],
+    }
+    return _status_only_row(run, ip_str_or_obj, device_data, entry['mac'].replace(':', '_'))
+
+
+def _dead_host_row(run: RunContext, ip_str_or_obj: Any) -> Optional[DeviceResult]:
+    """Result for a target that did not answer in earlier runs and is still backed off, None otherwise."""
+    ip = str(ip_str_or_obj)
+    host, port = _conn_host(ip), _http_port(run, _config_key(run, ip))
+    if not run.dead_hosts.is_dead(host, port):
+        return None
+    result = _start_device(run, ip_str_or_obj)
+    retry_at = strftime('%H:%M:%S', localtime(run.dead_hosts.retry_at(host, port)))
+    log.warning(f"[{format_device_log_label(ip, job_id=result.job_id)}] skipped, no answer in earlier runs (retried after {retry_at})")
+    result.error_message = f"Skipped: no answer on port {port} in earlier runs, retried after {retry_at} or with --refresh-dead"
+    return _finish_device(run, result)
+
+
+def _identity_status(run: RunContext, ip: str) -> Any:
+    """Status parts [misc, ethernet] of a target in one request, the exception if they cannot be read."""
+    dev, _ = _setup_device(run, DeviceResult(ip=ip, product_name="unknown", mac="unknown", initial_firmware="unknown"), DeployDev)
+    try:
+        return dev.http_get_status_json_coalesced([DeployDev.JSON_STATUS_MISC, DeployDev.JSON_STATUS_ETHERNET])
+    except Exception as e:
+        log.debug(f"[{dev.get_log_label()}] identity stage: no status via HTTP(S): {e}")
+        return e
+
+
+def _identity_macs(run: RunContext, targets: List[str]) -> Dict[str, str]:
+    """
+    target -> normalized MAC: from the GBL replies where there is one (targets on their own HTTP port),
+    via status.json (misc and ethernet) for the others, queried in parallel. The status is
+    kept in run.identity_status for the status stage.
+    """
+    macs = {}
+    missing = []
+    for ip in targets:
+        netconf = _gbl_reply(run, ip)
+        if netconf is not None:
+            macs[ip] = DeviceInventory.normalize_mac(netconf['mac'])
+        else:
+            missing.append(ip)
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(len(missing), run.concurrency)) as pool:
+            for ip, parts in zip(missing, pool.map(lambda ip: _identity_status(run, ip), missing)):
+                run.identity_status[ip] = parts
+                mac = None if isinstance(parts, Exception) else parts[1].get('ethernet', {}).get('mac')
+                if mac:
+                    macs[ip] = DeviceInventory.normalize_mac(mac)
+    return {ip: mac for ip, mac in macs.items() if mac is not None}
+
+
+def _alias_row(run: RunContext, ip: str, canonical: str, mac: str) -> DeviceResult:
+    result = _start_device(run, ip)
+    result.mac = mac.replace(':', '_')
+    log.warning(f"[{format_device_log_label(ip, job_id=result.job_id)}] skipped, same device (MAC) as {canonical}")
+    result.error_message = f"Skipped: same device as {canonical}"
+    return _finish_device(run, result)
+
+
+def _unresolved_row(run: RunContext, ip_str_or_obj: Any) -> DeviceResult:
+    result = _start_device(run, ip_str_or_obj)
+    error = run.unresolved[_conn_host(result.ip).lower()]
+    log.error(f"[{format_device_log_label(result.ip, job_id=result.job_id)}] host name could not be resolved: {error}")
+    result.error_message = f"DNS resolution failed: {error}"
+    return _finish_device(run, result)
+
+
+def _status_only_row(run: RunContext, ip_str_or_obj: Any, device_data: Dict[str, Any], mac: Optional[str] = None) -> DeviceResult:
+    result = _start_device(run, ip_str_or_obj)
+    try:
+        dev, _ = _setup_device(run, result, DeployDev)
+        _enter_stage(run, result, "discover")
+        if mac is None:
+            mac = _gbl_mac(run, dev, result.ip)
+        result.mac = mac
+        _apply_device_status(run, dev, result, device_data)
+        _plan_device(run, dev, mac, device_data, result)
+        _set_status_only(result)
+    except Exception as e:
+        _record_major_error(result, e)
+    return _finish_device(run, result)
+
+
+def _device_steps(run: RunContext, ip_str_or_obj: Any):
+    """
+    Per-device deployment as step generator (see gude.deployScheduler), passing the stages
+    discover -> status -> upload -> config -> ssl -> verify. Returns the DeviceResult.
+    """
+    result = _start_device(run, ip_str_or_obj)
+    try:
+        dev, _ = _setup_device(run, result, DeployDev)
+
+        _enter_stage(run, result, "discover")
+        mac = _gbl_mac(run, dev, result.ip)
+        result.mac = mac
+
+        _enter_stage(run, result, "status")
+        # misc and (if GBL gave no MAC) ethernet status in one round-trip
+        status_components = _status_components(mac)
+        try:
+            status_parts = _identity_status_parts(run, result.ip) or dev.http_get_status_json_coalesced(status_components)
+            device_data = status_parts[0]['misc']
+        except Exception as e_status:
+            _record_status_error(run, dev, result, e_status)
+            return result
+        _apply_device_status(run, dev, result, device_data)
+
+        if mac == "unknown-mac":
+            log.info(f"[{dev.get_log_label()}] Falling back to HTTP(S) to get MAC...")
+            try:
+                mac = _mac_from_ethernet(dev, status_parts[1])
+            except (RequestException, ValueError, TimeoutError, KeyError) as e_http_mac:
+                log.error(f"[{dev.get_log_label()}] Could not get MAC via HTTP(S): {e_http_mac}")
+                # Keep mac as "unknown-mac" or previous GBL error value
+        result.mac = mac
+
+        plan = _plan_device(run, dev, mac, device_data, result)
+
+        # continue here for status
+        if run.args.status:
+            return _set_status_only(result)
+
+        if plan["update_firmware"]:
+            _enter_stage(run, result, "upload")
+            gateway = _gateway(run, result.ip)
+            if not run.upload_slots.try_acquire(gateway):
+                _log_upload_wait(run, dev, gateway)
+                yield from run.upload_slots.acquire_steps(gateway)
+            upload_progress, release_upload = _upload_slot(run, gateway)
+            try:
+                fw_update_result = yield from dev.update_firmware_steps(device_data, run.firmware,
+                                                                        run.config.get('defaults', 'fwdir', fallback='fw'),
+                                                                        forced=run.args.forcefw,
+                                                                        online_update=run.args.onlineupdate,
+                                                                        show_progress_bar=run.use_progress_bar, progress_cb=upload_progress)
+                _apply_firmware_result(result, fw_update_result)
+            except Exception as e_fw_update:
+                _record_firmware_error(dev, result, e_fw_update)
+            finally:
+                release_upload()
+
+        # Factory Reset Processing
+        if plan["factory_reset"]:
+            log.info(f"[{dev.get_log_label()}] Factory reset requested via custom config...")
+            try:
+                _apply_factory_reset(dev, result, dev.factory_reset())
+            except Exception as e_reset:
+                _apply_factory_reset(dev, result, False, e_reset)
+
+        # Deploy Configuration
+        # Skip config upload if we just did a factory reset? 
+        # Usually yes, unless user wants a specific config AFTER reset.
+        # But the UI flow suggests either Reset OR Config, not both.
+        cfg_filename = plan["cfg_filename"]
+        if _clones_entities(run, result, plan):
+            _enter_stage(run, result, "config")
+            try:
+                yield from dev.clone_entities_gbl_steps(run.clone_entities, show_progress_bar=run.use_progress_bar, progress_cb=run.emit)
+                _apply_upload_outcome(dev, result, "config", f"entities of {run.clone_from}")
+            except Exception as e_clone:
+                _apply_upload_outcome(dev, result, "config", f"entities of {run.clone_from}", e_clone)
+        elif run.clone_entities is None and cfg_filename is not None and not plan["factory_reset"]:
+            _enter_stage(run, result, "config")
+            log.debug(f"[{dev.get_log_label()}] Attempting to upload configuration {cfg_filename}...")
+            try:
+                yield from dev.upload_config_steps(cfg_filename, run.args.configip, show_progress_bar=run.use_progress_bar, progress_cb=run.emit)
+                _apply_upload_outcome(dev, result, "config", cfg_filename)
+            except Exception as e_cfg:
+                _apply_upload_outcome(dev, result, "config", cfg_filename, e_cfg)
+
+        # Deploy SSL certificate
+        ssl_cert_filename = plan["ssl_cert_filename"]
+        if ssl_cert_filename is not None:
+            _enter_stage(run, result, "ssl")
+            log.debug(f"[{dev.get_log_label()}] Attempting to upload SSL certificate {ssl_cert_filename}...")
+            try:
+                yield from dev.upload_ssl_certificate_steps(ssl_cert_filename, show_progress_bar=run.use_progress_bar, progress_cb=run.emit)
+                _apply_upload_outcome(dev, result, "ssl", ssl_cert_filename)
+            except Exception as e_ssl:
+                _apply_upload_outcome(dev, result, "ssl", ssl_cert_filename, e_ssl)
+
+        # Print FW Version and configured Hostname (final check)
+        _enter_stage(run, result, "verify")
+        try:
+            final_ipv4_config = dev.http_get_config_json(dev.JSON_CONFIG_IP)['ipv4']
+            final_misc_status = dev.http_get_status_json(DeployDev.JSON_STATUS_MISC)['misc']
+            _apply_final_check(dev, result, final_ipv4_config, final_misc_status)
+        except Exception as e_final_check:
+            log.warning(f"[{dev.get_log_label()}] Could not perform final status check: {e_final_check}")
+
+        # Overall success for the device if no major error message was set earlier
+        if not result.error_message:
+             result.success = True # Mark as success if no critical errors were logged to result.error_message
+
+    except Exception as e: # Catch-all for the processing of a single device
+        _record_major_error(result, e)
+
+    return _finish_device(run, result)
+
+
+def _failed_result(run: RunContext, ip_key: str, e: Exception) -> DeviceResult:
+    return DeviceResult(
+        ip=ip_key,
+        product_name="unknown",
+        mac="unknown",
+        initial_firmware="unknown",
+        success=False,
+        error_message=str(e),
+        job_id=run.job_id(ip_key),
+    )
+
+
+def _clone_entity_ids(_config: ConfigParser) -> List[int]:
+    """Entity ids of [defaults] gblCloneEntities, the entities --gbl-clone-from may write."""
+    return [int(x) for x in _config.get('defaults', 'gblCloneEntities', fallback='').split(',') if x.strip()]
+
+
+def _reference_entities(run: RunContext, ref: str) -> List[Dict[str, Any]]:
+    """
+    Entities of the clone reference listed in gblCloneEntities: eprom.json via HTTP, GBL_READENT
+    if that fails. Nothing is cloned without that list, the entities of the reference include
+    its network settings (IP address, hostname) which must not be copied to a whole range.
+    """
+    included = _clone_entity_ids(run.config)
+    if not included:
+        raise ValueError(f"cloning entities of {ref} needs the entity ids to clone (gblCloneEntities)")
+    dev, dev_ip_for_conn = _setup_device(run, DeviceResult(ip=ref, product_name="unknown", mac="unknown", initial_firmware="unknown"), DeployDev)
+    try:
+        entities = dev.get_eprom_json()
+    except Exception as e:
+        log.warning(f"[{dev.get_log_label()}] Could not read eprom.json ({e}), reading entities via GBL")
+        entities = None
+    if not entities:
+        entities = DeployDev.remove_volatile_entities(run_steps(read_device_entities_steps(dev_ip_for_conn, included)))
+    entities = [entity for entity in entities if entity["id"] in included]
+    missing = sorted(set(included) - set(entity["id"] for entity in entities))
+    if missing:
+        log.warning(f"[{dev.get_log_label()}] entities {missing} not found on the reference device, they are not cloned")
+    return entities
+
+
+GBL_BATCH = 1024  # targets per GBL_NETCONF batch while iterate_list feeds the devices
+
+
+def _cached_row(run: RunContext, ip_str_or_obj: Any) -> Tuple[Optional[str], Optional[DeviceResult]]:
+    """(stage, row) of a target answered without its device (DNS error, caches), (None, None) otherwise."""
+    args = run.args
+    if run.unresolved and _conn_host(str(ip_str_or_obj)).lower() in run.unresolved:
+        return 'dns', _unresolved_row(run, ip_str_or_obj)
+    if getattr(args, 'gbl_inventory', False) and run.gbl_netconf:
+        row = _gbl_status_row(run, ip_str_or_obj)
+        if row is not None:
+            return 'gbl', row
+    if run.inventory is not None and args.status and not getattr(args, 'refresh_inventory', False):
+        row = _inventory_status_row(run, ip_str_or_obj)
+        if row is not None:
+            return 'inventory', row
+    if run.dead_hosts is not None and not getattr(args, 'refresh_dead', False):
+        row = _dead_host_row(run, ip_str_or_obj)
+        if row is not None:
+            return 'dead', row
+    return None, None
+
+
+def _device_targets(run: RunContext, targets: Iterable[Any], rows: List[DeviceResult]) -> Iterable[Any]:
+    """
+    Targets that need their device, taken lazily from targets: GBL replies are asked per
+    GBL_BATCH targets, targets answered by _cached_row are added to rows instead.
+    """
+    gbl_timeout = float(run.config.get('defaults', 'gblTimeout', fallback=1.0))
+    counts = {'dns': 0, 'gbl': 0, 'inventory': 0, 'dead': 0, 'device': 0}
+    targets = iter(targets)
+    while True:
+        batch = list(islice(targets, GBL_BATCH))
+        if not batch:
+            break
+        if not getattr(run.args, 'nogbl', False):
+            # GBL MAC lookup of a batch at once (one UDP socket, one timeout window)
+            gbl_hosts = sorted(set(_conn_host(str(ip)) for ip in batch if _gbl_target(run, str(ip))) - set(run.gbl_netconf))
+            if gbl_hosts:
+                found = Gblib.netconf_batch(gbl_hosts, gbl_timeout)
+                log.debug(f"GBL: {len(found)} of {len(gbl_hosts)} hosts answered")
+                run.gbl_netconf.update(found)
+        for ip_str_or_obj in batch:
+            stage, row = _cached_row(run, ip_str_or_obj)
+            if row is None:
+                counts['device'] += 1
+                yield ip_str_or_obj
+            else:
+                counts[stage] += 1
+                rows.append(row)
+    if counts['gbl']:
+        log.info(f"GBL inventory: {counts['gbl']} devices from GBL replies")
+    if counts['inventory']:
+        log.info(f"Inventory: {counts['inventory']} devices seen within {run.inventory_max_age:.0f}s")
+    log.debug(f"{counts['device']} targets handed to the devices, {sum(counts.values()) - counts['device']} answered before")
+
+
 def iterate_list(
-    _ip_list: List[str],
+    _ip_list: Collection[str],
     _firmware: ConfigParser,
     _config: ConfigParser,
     _args: object,
     progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+    discovered: Optional[Dict[str, Dict[str, Any]]] = None,
 ) -> List[DeviceResult]:
     """
     Function that iterates over all hosts from _ip_list hosts,
     matching corresponding firmware in _firmware,
     using http config given by _config,
     considering additional options from _args
-    :param list _ip_list: list of ips, ip-sub-nets OR hostnames
+    :param _ip_list: ips, ip-sub-nets OR hostnames (list or TargetSet of generate_ip_list)
     :param ConfigParser _firmware: containing firmware information
     :param ConfigParser _config: containing http config
     :param Namespace _args: additional options
+    :param dict discovered: GBL records collected by generate_ip_list, these devices are not queried again
     Returns a list of DeviceResult objects containing the processing status of each device.
     """
 
-    # TODO: Is GBL in this context necessary?
-    gbl = Gblib()
-
     concurrency = int(getattr(_args, 'device_concurrency', 1) or 1)
-    use_progress_bar = (concurrency <= 1)
+    # one thread per device in flight unless fewer are asked for: uploads and status queries block
+    # their thread, only devices waiting for a reboot do not hold one
+    worker_threads = min(concurrency, int(getattr(_args, 'worker_threads', None) or concurrency))
+    engine = getattr(_args, 'engine', None) or 'thread'
     show_job_id = (concurrency > 1)
-    job_id_map = {
-        str(ip_item): f"job-{idx:02d}"
-        for idx, ip_item in enumerate(_ip_list, start=1)
-    }
+    run = RunContext(
+        firmware=_firmware,
+        config=_config,
+        args=_args,
+        progress_cb=progress_cb,
+        concurrency=concurrency,
+        use_progress_bar=(concurrency <= 1),
+        show_job_id=show_job_id,
+        clone_from=getattr(_args, 'gbl_clone_from', None),
+    )
 
     results: List[DeviceResult] = [] # Type hint for results
     log.debug(f"trying {len(_ip_list)} devices")
 
-    # Optional progress emitter
-    def emit(evt: Dict[str, Any]):
-        if progress_cb:
-            try:
-                progress_cb(evt)
-            except Exception:
-                pass
+    # host names of all targets resolved in parallel and pinned for this run (gude.dnsCache),
+    # targets whose name does not resolve are reported before any device is touched
+    dns_cache.ttl = float(_config.get('defaults', 'dnsCacheTtl', fallback=300))
+    run_targets = _ip_list
+    run.unresolved = dns_cache.prefetch(_conn_host(str(ip)) for ip in run_targets)
+
+    # devices known from the GBL search are taken from its replies, the others are asked
+    # per batch while the targets are fed to the devices (_device_targets)
+    if not getattr(_args, 'nogbl', False):
+        run.gbl_netconf.update(discovered or {})
+
+    # devices seen by earlier runs (gude.inventory), updated with the devices of this run
+    inventory = run.inventory = open_inventory(_config)
+    run.inventory_max_age = float(_config.get('defaults', 'inventoryMaxAge', fallback=900))
+
+    # targets without answer in earlier runs (gude.deadHosts), skipped unless --refresh-dead
+    dead_hosts = run.dead_hosts = open_dead_hosts(_config)
+
+    # per gateway (resolved address of a target's host) limits of firmware uploads and of devices
+    # in flight: port-forwarded devices behind one NAT gateway share its uplink
+    run.upload_slots = GroupSlots(_gateway_limit(run, 'gatewayUploads'))
+    connection_slots = GroupSlots(_gateway_limit(run, 'gatewayConnections'))
+
+    if run.clone_from and not _args.status:
+        run.clone_entities = _reference_entities(run, run.clone_from)
+        log.info(f"cloning {len(run.clone_entities)} entities of {run.clone_from} via GBL")
+
+    # rows of targets answered without their device; the others are taken from the
+    # range only as devices finish, a large TargetSet is never listed up front
+    rows: List[DeviceResult] = []
+    _ip_list = _device_targets(run, _ip_list, rows)
+    if not _args.status and _config.getboolean('defaults', 'macDedup', fallback=False):
+        # identity stage: aliases of one device (LAN IP, DNS name, port forward) are processed once
+        # (needs all targets at once)
+        targets = [str(ip) for ip in _ip_list]
+        _ip_list = targets
+        if len(targets) > 1:
+            identities = _identity_macs(run, targets)
+            _ip_list, aliases = collapse_aliases(targets, identities)
+            if aliases:
+                log.info(f"Identity: {len(aliases)} targets are aliases of other targets (same MAC), processing {len(_ip_list)}")
+            for ip in targets:
+                if ip in aliases:
+                    rows.append(_alias_row(run, ip, aliases[ip], identities[ip]))
+
+    # device sessions are kept alive across all stages of a device and closed per run
+    try:
+        if engine == 'async':
+            # one event loop, at most `concurrency` devices in flight: the device steps run on
+            # `worker_threads` threads while they do I/O, waiting devices are timers of the loop
+            with ThreadPoolExecutor(max_workers=worker_threads, thread_name_prefix='deploy-io') as io_pool:
+                results.extend(asyncio.run(run_bounded(iterate_async(_ip_list, io_pool), lambda ip_obj: run_steps_async(_device_steps(run, ip_obj), io_pool),
+                                                       concurrency,
+                                                       group_of=lambda ip_obj: _gateway(run, ip_obj),
+                                                       group_slots=connection_slots)))
+            return rows + results
+
+        if concurrency <= 1:
+            for ip_str_or_obj in _ip_list:
+                results.append(run_steps(_device_steps(run, ip_str_or_obj)))
+            return rows + results
+
+        # Concurrent execution: up to `concurrency` devices in flight, driven by `worker_threads` threads
+        scheduler = DeploymentScheduler(workers=worker_threads, max_active=concurrency, on_error=lambda ip_key, e: _failed_result(run, ip_key, e),
+                                        group_slots=connection_slots)
+        # results in order of completion
+        results.extend(scheduler.run((str(ip_obj), lambda ip_obj=ip_obj: _device_steps(run, ip_obj), _gateway(run, ip_obj))
+                                     for ip_obj in _ip_list).values())
+    finally:
+        close_shared_sessions()
+        dns_cache.unpin(_conn_host(str(ip)) for ip in run_targets)
+        _log_probe_rtts()
+        if inventory is not None:
+            _record_inventory(run, results)
+        if dead_hosts is not None:
+            dead_hosts.save()
+    return rows + results
+
+
+def open_inventory(_config: ConfigParser) -> Optional[DeviceInventory]:
+    """Device inventory named by [defaults] inventory, None if it is disabled (empty)."""
+    path = _config.get('defaults', 'inventory', fallback='').strip()
+    if not path:
+        return None
+    log.debug(f"Device inventory: {os.path.abspath(path)}")
+    return DeviceInventory.load(path)
 
-    def _process_device(ip_str_or_obj: Any) -> DeviceResult:
-        ip = str(ip_str_or_obj) # Ensure ip is a string for consistency
-        job_id = job_id_map.get(ip) if show_job_id else None
-        result = DeviceResult(ip=ip, product_name="unknown", mac="unknown", initial_firmware="unknown", job_id=job_id)
-        emit({"type": "device_start", "ip": ip, "job_id": job_id})
-        
-        def append_status_note(note: str) -> None:
-            """Append an additional action summary to the visible per-device status text."""
-            if not note:
-                return
-            if not result.firmware_status or result.firmware_status == "not attempted":
-                result.firmware_status = note
-                return
-            if note in result.firmware_status:
-                return
-            result.firmware_status = f"{result.firmware_status}; {note}"
-        
-        try:
-            log.debug(f"[{format_device_log_label(ip, job_id=job_id)}] Processing device")
-
-            #if ip not in ["gwtestnet1.gude.local:38221", "gwtestnet1.gude.local:38226"]:
-            #    continue
-
-            dev_ip_for_conn = ip # Default
-            # Handle potential port in IP string (though generate_ip_list should give clean IPs)
-            if isinstance(ip, str) and ':' in ip:
-                parts = ip.split(':')
-                dev_ip_for_conn = parts[0]
-                # Check if we're dealing with a hostname or IP
-                try:
-                    # Only validate if it looks like an IP address
-                    if re.match(r'^[\d\.]+$', dev_ip_for_conn):
-                        ipaddress.ip_address(dev_ip_for_conn)
-                except ValueError:
-                    # This is likely a hostname with port, which is fine
-                    log.debug(f"Treating {dev_ip_for_conn} as hostname with port {parts[1]}")
-
-            dev = DeployDev(dev_ip_for_conn, req_headers=_args.header)
-
-            # Determine config_key: if ip (e.g. "192.168.1.10:8080") is a section name, use it.
-            # Otherwise, use dev_ip_for_conn (e.g. "192.168.1.10") if it's a section.
-            # Fallback to 'httpDefaults'.
-            config_key_options = [ip, dev_ip_for_conn, 'httpDefaults']
-            config_key = 'httpDefaults' # Default fallback
-            for key_option in config_key_options:
-                if _config.has_section(key_option):
-                    config_key = key_option
-                    break
-
-            log.debug(f"[{format_device_log_label(ip, job_id=job_id)}] Using config-key '{config_key}'")
-
-            # Determine connection settings
-            # Avoid mutating shared config during concurrency
-            port = int(_config.get(config_key, 'port', fallback=int(_config.get('httpDefaults', 'port', fallback=80))))
-            use_ssl = _config.getboolean(config_key, 'ssl', fallback=_config.getboolean('httpDefaults', 'ssl', fallback=False))
-            # Apply to device
-            dev.set_http_port(port, use_ssl)
-            dev.set_log_job_id(job_id)
-            dev.set_basic_auth(_config.getboolean(config_key, 'auth', fallback=False),
-                               _config.get(config_key, 'username', fallback=''),
-                               _config.get(config_key, 'password', fallback=''))
-            dev.set_http_timeout(float(_config.get('defaults', 'httpTimeout', fallback=3.0)))
-            dev.set_http_retries(0)
-
-            # Expose connection info for UI
-            result.conn_host = dev_ip_for_conn
-            result.conn_port = port
-            result.conn_ssl = use_ssl
-            proto = 'https' if use_ssl else 'http'
-            result.url = f"{proto}://{dev_ip_for_conn}:{port}"
-
-            mac = "unknown-mac"
-            if not getattr(_args, 'nogbl', False):
-                try:
-                    log.info(f"[{dev.get_log_label()}] Attempting to get MAC via GBL/UDP...")
-                    _gbl = Gblib()
-                    if not _gbl.check_mac(str(dev_ip_for_conn)):
-                        log.warning(f"[{dev.get_log_label()}] GBL timeout (UDP port 50123)")
-                    else:
-                        # Keep the historical config filename format: aa_bb_cc_dd_ee_ff.
-                        mac = '_'.join(f'{c:02x}' for c in _gbl.dstMAC)
-                        log.info(f"[{dev.get_log_label()}] Got MAC {mac} via GBL.")
-                except (gaierror, ConnectionResetError, OSError) as e_gbl:
-                    log.warning(f"[{dev.get_log_label()}] GBL MAC retrieval failed: {e_gbl}")
-            else:
-                log.debug(f"[{dev.get_log_label()}] GBL MAC lookup skipped by --nogbl.")
-            result.mac = mac
 
-            try:
-                device_data = dev.http_get_status_json(DeployDev.JSON_STATUS_MISC)['misc']
-            except HTTPError as e:
-                if e.response.status_code == 401:
-                    log.error(f"[{dev.get_log_label()}] Authentication error on configured port/protocol: {e}")
-                    result.error_message = f"Authentication Error: {e}"
-                    #continue
-                    return result
-                else:
-                    log.error(f"[{dev.get_log_label()}] HTTPError: {e}")
-                    result.error_message = f"HTTPError: {e}"
-                    #continue # Re-raise if you want to stop all processing
-                    return result
-            except (Timeout, ConnectionError) as ce: # Catch Timeout and ConnectionError
-                log.error(f"[{dev.get_log_label()}] Could not reach device on configured port/protocol: {ce}")
-                result.error_message = f"Connection/Timeout Error: {ce}"
-                #continue
-                return result
-            except Exception as e_misc: # Catch other potential errors during initial status fetch
-                log.error(f"[{dev.get_log_label()}] Unexpected error fetching initial status: {e_misc}")
-                result.error_message = f"Unexpected initial status error: {e_misc}"
-                #continue
-                return result
-
-            result.product_name = device_data['product_name']
-            result.hostname = device_data.get('hostname')
-            result.initial_firmware = device_data['firm_v']
-
-            if mac == "unknown-mac":
-                log.info(f"[{dev.get_log_label()}] Falling back to HTTP(S) to get MAC...")
-                try:
-                    mac_http = dev.http_get_status_json(DeployDev.JSON_STATUS_ETHERNET, req_headers=None)['ethernet']['mac']
-                    mac = mac_http.replace(':', '_')
-                    log.info(f"[{dev.get_log_label()}] Got MAC {mac} via HTTP(S).")
-                except (RequestException, ValueError, TimeoutError) as e_http_mac:
-                    log.error(f"[{dev.get_log_label()}] Could not get MAC via HTTP(S): {e_http_mac}")
-                    # Keep mac as "unknown-mac" or previous GBL error value
-
-            result.mac = mac
-
-            log.debug(f"[{dev.get_log_label()}] Getting config filename for MAC {mac}, IP {ip}...")
-            
-            # Check for custom config override
-            custom_config_map = getattr(_args, 'custom_config', None) or {}
-            # Try to find match by IP (exact or host:port if matches dev.host)
-            custom_config_val = custom_config_map.get(ip)
-            if not custom_config_val and dev.host in custom_config_map:
-                custom_config_val = custom_config_map[dev.host]
-
-            factory_reset_requested = (custom_config_val == "RESET")
-            explicit_config_file = custom_config_val if (custom_config_val and not factory_reset_requested) else None
-
-            # Pass explicit_filename if we have one (not RESET, and not None)
-            cfg_filename = DeployDev.get_config_filename('config', 'config', 'txt', mac, ip, _args.configip, explicit_filename=explicit_config_file)
-            
-            log.debug(f"[{dev.get_log_label()}] Getting SSL certificate filename for MAC {mac}, IP {ip}...")
-            
-            # Check for custom ssl override
-            custom_ssl_map = getattr(_args, 'custom_ssl', None) or {}
-            custom_ssl_val = custom_ssl_map.get(ip)
-            if not custom_ssl_val and dev.host in custom_ssl_map:
-                custom_ssl_val = custom_ssl_map[dev.host]
-
-            explicit_ssl_file = None
-            skip_ssl = False
-            if custom_ssl_val == "__no_cert__":
-                skip_ssl = True
-            elif custom_ssl_val:
-                explicit_ssl_file = custom_ssl_val
-
-            if skip_ssl:
-                ssl_cert_filename = None
-                log.info(f"[{dev.get_log_label()}] SSL upload skipped by user request.")
-            else:
-                ssl_cert_filename = DeployDev.get_config_filename('ssl', 'cert', 'pem', mac, ip, _args.configip, explicit_filename=explicit_ssl_file)
-
-            # Check for custom firmware override (currently used for per-device "__no_update__")
-            custom_firmware_map = getattr(_args, 'custom_firmware', None) or {}
-            custom_firmware_val = custom_firmware_map.get(ip)
-            if not custom_firmware_val and dev.host in custom_firmware_map:
-                custom_firmware_val = custom_firmware_map[dev.host]
-            skip_firmware_update = (custom_firmware_val == "__no_update__")
-
-            # --- before logging/deploy ---
-            actual_prod_id = device_data['prodid']
-            # Build replacement map (if provided via args)
-            repl_map = _args.repl_prod_id if isinstance(getattr(_args, 'repl_prod_id', None), dict) else None
-            selected_prod_id, selected_version = resolve_prodid(
-                actual_prodid=actual_prod_id,
-                product_name=device_data.get('product_name') or '',
-                firmware_cfg=_firmware,
-                repl_map=repl_map,
-            )
-            # Offline fallback: if resolved section has no local file, try compatible
-            # same-family entries (e.g. 80xxR2) that do have a local file.
-            if selected_prod_id and not _args.onlineupdate:
-                fw_dir_default = _config.get('defaults', 'fwdir', fallback='fw')
-                fallback_prodid = find_offline_compatible_prodid(
-                    selected_prodid=selected_prod_id,
-                    firmware_cfg=_firmware,
-                    fw_dir_default=fw_dir_default,
-                )
-                if fallback_prodid:
-                    log.info(f"[{dev.get_log_label()}] Offline fallback: using compatible firmware section '{fallback_prodid}' instead of '{selected_prod_id}'")
-                    selected_prod_id = fallback_prodid
-                    selected_version = _firmware.get(selected_prod_id, 'version', fallback=selected_version)
-                    if result.firmware_upload_notes:
-                        result.firmware_upload_notes += f"; offline fallback -> {selected_prod_id}"
-                    else:
-                        result.firmware_upload_notes = f"offline fallback -> {selected_prod_id}"
-            # update device_data and log
-            if selected_prod_id:
-                device_data["prodid"] = selected_prod_id # Update prodid for update_firmware call
-                # Track selected product id for summary/use
-                result.selected_prodid = selected_prod_id
-                target_filename = _firmware.get(selected_prod_id, 'filename', fallback='').strip()
-                result.target_is_custom = is_explicit_firmware_selection(target_filename)
-                effective_target_version = selected_version
-                if result.target_is_custom:
-                    effective_target_version = resolve_configured_firmware_version(
-                        selected_prod_id,
-                        target_filename,
-                        _firmware.get(selected_prod_id, 'version', fallback=''),
-                    )
-                disp_version = format_firmware_version_for_display(selected_prod_id, effective_target_version) or target_filename or "unknown"
-                result.latest_known_firmware = disp_version
-                # Determine publish date for latest known version (prefer model 'date' for online sources)
-                try:
-                    if result.target_is_custom:
-                        result.latest_publish_date = None
-                    elif _args.onlineupdate and _firmware.has_option(selected_prod_id, 'date'):
-                        result.latest_publish_date = _firmware.get(selected_prod_id, 'date')
-                    elif _firmware.has_section('url') and _firmware.has_option('url', 'last_update'):
-                        result.latest_publish_date = _firmware.get('url', 'last_update')
-                except Exception:
-                    result.latest_publish_date = None
-                firmware_label = "selected target" if result.target_is_custom else "latest known"
-                log.info(
-                    f"{device_data['product_name']} "
-                    f"({actual_prod_id} -> {selected_prod_id}, {mac}) at {dev.get_log_label()}\n"
-                    + " " * (len(f"{device_data['product_name']} ({actual_prod_id} -> {selected_prod_id}, {mac}) at {dev.get_log_label()}") - len(f"running Firmware v{device_data['firm_v']}")) # Align logging
-                    + f"running Firmware v{device_data['firm_v']}, {firmware_label}: {result.latest_known_firmware}"
-                )
-            else:
-                log.warning(f"[{dev.get_log_label()}] No firmware entry found for product '{actual_prod_id}' (original) or suitable replacement.")
-                result.firmware_status = f"No firmware definition for {actual_prod_id}"
-
-            # continue here for status
-            if _args.status:
-                result.firmware_status = "status only, no changes made"
-                result.status_only = True
-                result.success = False
-                return result
-
-            # deploy Firmware
-            if skip_firmware_update:
-                log.info(f"[{dev.get_log_label()}] Firmware update skipped by user request (No Update).")
-                result.firmware_status = "Skipped (No Update)"
-            elif selected_prod_id and selected_prod_id in _firmware: # Check if selected_prod_id is valid for _firmware
-                # Check for explicit no-update flag
-                target_filename = _firmware.get(selected_prod_id, 'filename', fallback='')
-                if target_filename == '__no_update__':
-                     log.info(f"[{dev.get_log_label()}] Firmware update skipped by user request (No Update).")
-                     result.firmware_status = "Skipped (No Update)"
-                else: 
-                    try:
-                        fw_update_result = dev.update_firmware(device_data, _firmware,
-                                                           _config.get('defaults', 'fwdir', fallback='fw'),
-                                                           forced=_args.forcefw,
-                                                           online_update=_args.onlineupdate,
-                                                           show_progress_bar=use_progress_bar, progress_cb=emit)
-
-                        result.final_firmware = fw_update_result.get("final_version", result.initial_firmware)
-                        result.firmware_status = fw_update_result.get("status_message", "firmware update status unknown")
-                        result.firmware_upload_notes = fw_update_result.get("upload_notes")
-                    except ValueError as ve_fw: # Catches firmware file not found etc. from update_firmware
-                        result.firmware_status = f"failed: {str(ve_fw)}"
-                        log.warning(f"[{dev.get_log_label()}] Skipped firmware update: {ve_fw}")
-                    except Exception as e_fw_update: # Catch any other unexpected error during update_firmware
-                        result.firmware_status = f"failed: unexpected error during update ({str(e_fw_update)})"
-                        log.error(f"[{dev.get_log_label()}] Unexpected error during firmware update: {e_fw_update}", exc_info=True)
-
-            # Factory Reset Processing
-            if factory_reset_requested:
-                log.info(f"[{dev.get_log_label()}] Factory reset requested via custom config...")
-                try:
-                     if dev.factory_reset():
-                         log.info(f"[{dev.get_log_label()}] Factory reset triggered successfully.")
-                         result.firmware_status = "Factory Reset Triggered"
-                         # Reset usually reboots the device, so we might want to skip further configuration
-                         # But we continue to let valid flow happen if possible, though config upload likely moot
-                     else:
-                        log.warning(f"[{dev.get_log_label()}] Factory reset returned False (maybe not supported or failed).")
-                        result.error_message = "Factory reset failed or not supported"
-                except Exception as e_reset:
-                     log.error(f"[{dev.get_log_label()}] Factory reset failed: {e_reset}")
-                     result.error_message = f"Factory reset failed: {e_reset}"
-
-            # Deploy Configuration
-            # Skip config upload if we just did a factory reset? 
-            # Usually yes, unless user wants a specific config AFTER reset.
-            # But the UI flow suggests either Reset OR Config, not both.
-            if cfg_filename is not None and not factory_reset_requested:
-                log.debug(f"[{dev.get_log_label()}] Attempting to upload configuration {cfg_filename}...")
-                try:
-                    dev.upload_config(cfg_filename, _args.configip, show_progress_bar=use_progress_bar, progress_cb=emit)
-                    log.info(f"[{dev.get_log_label()}] Successfully uploaded configuration {cfg_filename}.")
-                    append_status_note(f"Config updated ({cfg_filename})")
-                except Exception as e_cfg:
-                    log.error(f"[{dev.get_log_label()}] Failed to upload configuration {cfg_filename}: {e_cfg}")
-                    if result.error_message: result.error_message += f"; Config upload error: {e_cfg}"
-                    else: result.error_message = f"Config upload error: {e_cfg}"
-
-
-            # Deploy SSL certificate
-            if ssl_cert_filename is not None:
-                log.debug(f"[{dev.get_log_label()}] Attempting to upload SSL certificate {ssl_cert_filename}...")
-                try:
-                    dev.upload_ssl_certificate(ssl_cert_filename, show_progress_bar=use_progress_bar, progress_cb=emit)
-                    log.info(f"[{dev.get_log_label()}] Successfully uploaded SSL certificate {ssl_cert_filename}.")
-                    append_status_note(f"SSL certificate updated ({ssl_cert_filename})")
-                except Exception as e_ssl:
-                    log.error(f"[{dev.get_log_label()}] Failed to upload SSL certificate {ssl_cert_filename}: {e_ssl}")
-                    if result.error_message: result.error_message += f"; SSL cert upload error: {e_ssl}"
-                    else: result.error_message = f"SSL cert upload error: {e_ssl}"
-
-            # Print FW Version and configured Hostname (final check)
-            try:
-                final_ipv4_config = dev.http_get_config_json(dev.JSON_CONFIG_IP)['ipv4']
-                final_misc_status = dev.http_get_status_json(DeployDev.JSON_STATUS_MISC)['misc']
-                log.info(f"[{dev.get_log_label()}] Final check: hostname '{final_ipv4_config['hostname']}', FW Version {final_misc_status['firm_v']}")
-                # Update final_firmware if it changed due to config/ssl reboot and wasn't from fw update
-                if result.final_firmware == result.initial_firmware or result.final_firmware is None: # only if not set by fw update
-                    if final_misc_status['firm_v'] != result.initial_firmware:
-                        result.final_firmware = final_misc_status['firm_v']
-                        # Potentially update firmware_status if it implies no update was done but version changed
-                        if "not attempted" in result.firmware_status or "up to date" in result.firmware_status:
-                             result.firmware_status = f"version changed to {result.final_firmware} (possibly due to other uploads)"
-
-
-            except Exception as e_final_check:
-                log.warning(f"[{dev.get_log_label()}] Could not perform final status check: {e_final_check}")
-
-            # Overall success for the device if no major error message was set earlier
-            if not result.error_message:
-                 result.success = True # Mark as success if no critical errors were logged to result.error_message
-
-        except Exception as e: # Catch-all for the processing of a single device
-            log.error(f"[{format_device_log_label(ip, job_id=job_id)}] Major error processing device: {e}", exc_info=True)
-            result.error_message = str(e)
-            result.success = False # Ensure success is false on major error
-
-        emit({
-            "type": "device_done",
-            "ip": ip,
-            "job_id": job_id,
-            "ok": result.success,
-            "product": result.product_name,
-            "initial_fw": result.initial_firmware,
-            "final_fw": result.final_firmware,
-            "status": result.firmware_status,
-            "error": result.error_message,
-        })
-        return result
-
-    if concurrency <= 1:
-        for ip_str_or_obj in _ip_list:
-            results.append(_process_device(ip_str_or_obj))
-        return results
-
-    # Concurrent execution
-    with ThreadPoolExecutor(max_workers=concurrency) as pool:
-        future_map = {pool.submit(_process_device, ip_obj): ip_obj for ip_obj in _ip_list}
-        for fut in as_completed(future_map):
-            try:
-                results.append(fut.result())
-            except Exception as e:
-                ip_obj = future_map[fut]
-                ip_key = str(ip_obj)
-                results.append(
-                    DeviceResult(
-                        ip=ip_key,
-                        product_name="unknown",
-                        mac="unknown",
-                        initial_firmware="unknown",
-                        success=False,
-                        error_message=str(e),
-                        job_id=job_id_map.get(ip_key) if show_job_id else None,
-                    )
-                )
-    return results
+def open_dead_hosts(_config: ConfigParser) -> Optional[DeadHosts]:
+    """Dead host cache named by [defaults] deadCache, None if it is disabled (empty)."""
+    path = _config.get('defaults', 'deadCache', fallback='').strip()
+    if not path:
+        return None
+    log.debug(f"Dead host cache: {os.path.abspath(path)}")
+    return DeadHosts.load(path, float(_config.get('defaults', 'deadCacheTtl', fallback=DeadHosts.DEFAULT_TTL)),
+                          float(_config.get('defaults', 'deadCacheMaxTtl', fallback=DeadHosts.DEFAULT_MAX_TTL)))
+
+
+def _record_inventory(run: RunContext, results: List[DeviceResult]) -> None:
+    """Store devices whose status was read in this run."""
+    inventory = run.inventory
+    recorded = 0
+    for result in results:
+        if result.initial_firmware in (None, "unknown") or DeviceInventory.normalize_mac(result.mac) is None:
+            continue
+        netconf = _gbl_reply(run, result.ip)
+        dev_info = netconf.get('dev_info') if netconf else None
+        inventory.record(result.mac, target=result.ip, ip=result.conn_host, port=result.conn_port, ssl=result.conn_ssl,
+                         prodid=result.prodid, product_name=result.product_name, hostname=result.hostname,
+                         firmware=result.final_firmware or result.initial_firmware,
+                         capabilities={'gbl': netconf is not None,
+                                       'gbl_hostname': bool(dev_info is not None and dev_info.extended)})
+        recorded += 1
+    if recorded:
+        inventory.save()
+        log.debug(f"{recorded} devices recorded in inventory {inventory.path}")
+
+
+def _log_probe_rtts() -> None:
+    """Log the liveness probes used during reboot waits and their average round-trip times."""
+    summary = liveness_probes.rtt_summary()
+    if summary:
+        rtts = ", ".join(f"{name} {count}x {avg * 1000:.1f} ms" for name, (count, avg) in sorted(summary.items()))
+        log.info(f"Liveness probe round-trip times: {rtts}")
 
 
 def configure_auth_settings(_config: ConfigParser) -> None:
@@ -1281,7 +2027,9 @@ def main() -> None:
     add_iprange_to_config(args.iprange, config, upload_ini_found=getattr(args, 'upload_ini_found', None), web_mode=False)
 
     # Pass the 'hosts' section of config, not the whole config object
-    ip_list = generate_ip_list(config, my_ip, float(config.get('defaults', 'gblTimeout', fallback=1.0)))
+    discovered: Dict[str, Dict[str, Any]] = {}
+    ip_list = generate_ip_list(config, my_ip, float(config.get('defaults', 'gblTimeout', fallback=1.0)), discovered=discovered,
+                               refresh_dead=args.refresh_dead)
 
     # Optional JSONL progress writer
     progress_fp = None
@@ -1302,7 +2050,8 @@ def main() -> None:
 
     try:
         # iterate devices, get each dev info, update fw, config and certificate
-        processing_results = iterate_list(ip_list, firmware, config, args, progress_cb=_progress_cb if progress_fp else None)
+        processing_results = iterate_list(ip_list, firmware, config, args, progress_cb=_progress_cb if progress_fp else None,
+                                          discovered=discovered)
     finally:
         if progress_fp:
             try:
@@ -1364,12 +2113,25 @@ def run_processing_from_options(
     search_folder: Optional[str] = None,
     header: Optional[Dict[str, str]] = None,
     status: bool = False,
+    gbl_inventory: bool = False,
+    gbl_clone_from: Optional[str] = None,
+    gbl_clone_entities: Optional[str] = None,
+    mac_dedup: bool = False,
+    tcp_prescan: bool = False,
+    inventory: Optional[str] = None,
+    refresh_inventory: bool = False,
+    dead_cache: Optional[str] = None,
+    refresh_dead: bool = False,
     gbl: bool = False,
     devices: Optional[Dict[str, Any]] = None,
     forcefw: bool = False,
     repl_prod_id: Optional[Dict[str, str]] = None,
     configip: Optional[str] = None,
     device_concurrency: int = 1,
+    gateway_uploads: Optional[int] = None,
+    gateway_connections: Optional[int] = None,
+    worker_threads: Optional[int] = None,
+    engine: str = 'thread',
     progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
     firmware_config: Optional[Dict[str, Dict[str, str]]] = None,
     custom_firmware: Optional[Dict[str, str]] = None,
@@ -1393,12 +2155,25 @@ def run_processing_from_options(
     args.repl_prod_id = repl_prod_id or {'2110': '2111'}
     args.devices = devices
     args.header = header
-    args.status = status
+    args.status = status or gbl_inventory
+    args.gbl_inventory = gbl_inventory
+    args.gbl_clone_from = gbl_clone_from
+    args.gbl_clone_entities = gbl_clone_entities
+    args.mac_dedup = '1' if mac_dedup else None
+    args.tcp_prescan = '1' if tcp_prescan else None
+    args.inventory = inventory
+    args.refresh_inventory = refresh_inventory
+    args.dead_cache = dead_cache
+    args.refresh_dead = refresh_dead
     args.gbl = gbl
     # Keep parity with CLI: default to using GBL unless explicitly disabled
     args.nogbl = False
     # Concurrency for programmatic callers
     args.device_concurrency = int(device_concurrency or 1)
+    args.gateway_uploads = gateway_uploads
+    args.gateway_connections = gateway_connections
+    args.worker_threads = int(worker_threads) if worker_threads else None
+    args.engine = engine
     args.custom_firmware = custom_firmware
     args.custom_config = custom_config
     args.custom_ssl = custom_ssl
@@ -1455,6 +2230,7 @@ def run_processing_from_options(
     # Apply global defaults
     for section, settings in DEFAULT_SETTINGS.items():
         set_config_defaults(config, section, settings)
+    add_feature_options_to_config(args, config)
 
     # Prepare firmware database
     firmware = ConfigParser(strict=False)
@@ -1499,8 +2275,10 @@ def run_processing_from_options(
         upload_ini_found=getattr(args, 'upload_ini_found', None),
         web_mode=True,
     )
-    ip_list = generate_ip_list(config, my_ip, float(config.get('defaults', 'gblTimeout', fallback=2.0)))
-    results = iterate_list(ip_list, firmware, config, args, progress_cb=progress_cb)
+    discovered: Dict[str, Dict[str, Any]] = {}
+    ip_list = generate_ip_list(config, my_ip, float(config.get('defaults', 'gblTimeout', fallback=2.0)), discovered=discovered,
+                               refresh_dead=args.refresh_dead)
+    results = iterate_list(ip_list, firmware, config, args, progress_cb=progress_cb, discovered=discovered)
     return results
 
 
@@ -161,6 +161,9 @@ def _base_dir() -> Path:
 BASE_DIR = _base_dir()
 ASSETS_DIR = str(BASE_DIR.joinpath('assets'))
 
+# targets without answer, used by searches and updates when 'Skip dead hosts' is checked
+DEAD_CACHE_FILE = 'deadhosts.json'
+
 
 def _json_default(obj):
     if is_dataclass(obj):
@@ -168,7 +171,7 @@ def _json_default(obj):
     return str(obj)
 
 
-def _run_gbl_query_async(enable_gbl: bool = True):
+def _run_gbl_query_async(enable_gbl: bool = True, tcp_prescan: bool = False, dead_cache: bool = False):
     try:
         State.running = True
         State.progress = {}
@@ -176,6 +179,8 @@ def _run_gbl_query_async(enable_gbl: bool = True):
             State.results = run_processing_from_options(
                 gbl=enable_gbl,
                 status=True,
+                tcp_prescan=tcp_prescan,  # netN ranges: only addresses with an open HTTP(S) port are asked
+                dead_cache=DEAD_CACHE_FILE if dead_cache else None,
                 onlineupdate=True,
                 upload_ini="upload.ini",
                 version_ini="version.ini"
@@ -204,6 +209,7 @@ def _run_update_selected_async(
     ssl_overrides: Optional[dict] = None,
     forcefw: bool = False,
     custom_firmware: Optional[dict] = None,
+    dead_cache: bool = False,
 ):
     try:
         State.running = True
@@ -233,8 +239,11 @@ def _run_update_selected_async(
             devices=devices,
             forcefw=bool(forcefw),
             status=False,
+            dead_cache=DEAD_CACHE_FILE if dead_cache else None,
+            refresh_dead=dead_cache,  # selected devices are always tried, their cache entries updated
             gbl=False,
             device_concurrency=2,
+            gateway_uploads=2,  # port-forwarded devices behind one gateway share its uplink
             progress_cb=on_progress,
 
             firmware_config=firmware_overrides,  # Pass overrides to upload logic
@@ -262,6 +271,8 @@ def _run_status_selected_async(hosts: list[str]):
             devices=devices,
             forcefw=False,
             status=True,
+            inventory='inventory.json',  # the devices' answers are recorded
+            refresh_inventory=True,  # explicit status refresh: ask the devices, not the inventory
             gbl=False,
             device_concurrency=5
         )
@@ -718,6 +729,7 @@ class Handler(BaseHTTPRequestHandler):
 
         # Check for POST data (selected IPs)
         enable_gbl = True
+        tcp_prescan = dead_cache = False
         if self.command == 'POST':
             length = int(self.headers.get('Content-Length', '0') or '0')
             raw = self.rfile.read(length) if length > 0 else b'{}'
@@ -727,6 +739,8 @@ class Handler(BaseHTTPRequestHandler):
                 body = {}
             
             enable_gbl = body.get('gbl', True)
+            tcp_prescan = bool(body.get('tcp_prescan', False))
+            dead_cache = bool(body.get('dead_cache', False))
             hosts: list[str] = []
             if isinstance(body.get('hosts'), list):
                 hosts = [str(x) for x in body['hosts']]
@@ -741,7 +755,7 @@ class Handler(BaseHTTPRequestHandler):
                 return
 
         # Default GET/POST-no-hosts behavior: GBL query
-        t = threading.Thread(target=_run_gbl_query_async, args=(enable_gbl,), daemon=True)
+        t = threading.Thread(target=_run_gbl_query_async, args=(enable_gbl, tcp_prescan, dead_cache), daemon=True)
         t.start()
         payload = {'running': True}
         data = json.dumps(payload).encode('utf-8')
@@ -779,10 +793,11 @@ class Handler(BaseHTTPRequestHandler):
         config_overrides = body.get('config_overrides')      # Optional dict
         ssl_overrides = body.get('ssl_overrides')            # Optional dict
         forcefw = bool(body.get('forcefw', False))
+        dead_cache = bool(body.get('dead_cache', False))
 
         t = threading.Thread(
             target=_run_update_selected_async,
-            args=(hosts, firmware_overrides, config_overrides, ssl_overrides, forcefw, custom_firmware),
+            args=(hosts, firmware_overrides, config_overrides, ssl_overrides, forcefw, custom_firmware, dead_cache),
             daemon=True,
         )
         t.start()